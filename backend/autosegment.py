@@ -0,0 +1,174 @@
+"""
+Segmentación automática tras cada escritura (opcional, LEADFLOW_AUTOSEGMENT=1).
+
+Los endpoints que crean leads o cambian su texto encolan los ids después
+del commit y responden sin esperar. Una tarea asyncio vacía la cola en
+micro-lotes: un lote se cierra al llegar a AUTOSEGMENT_BATCH_SIZE ids o a
+AUTOSEGMENT_MAX_LATENCY_MS desde el primer id del lote, se segmenta con
+el proveedor LLM (pasando por la caché) y se guarda con un solo
+executemany. Al apagar la API se procesa todo lo encolado.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from batch import save_segmentations
+from database import pool, row_to_dict
+from events import publish_segmentations
+from response_cache import response_cache
+from segmentation_cache import segment_leads_cached_async
+
+logger = logging.getLogger("leadflow.autosegment")
+
+AUTOSEGMENT_ENABLED = os.getenv("LEADFLOW_AUTOSEGMENT", "0").lower() in ("1", "true", "si", "on")
+AUTOSEGMENT_BATCH_SIZE = int(os.getenv("LEADFLOW_AUTOSEGMENT_BATCH_SIZE", "200"))
+AUTOSEGMENT_MAX_LATENCY_MS = float(os.getenv("LEADFLOW_AUTOSEGMENT_MAX_LATENCY_MS", "50"))
+
+_FIN = object()
+
+
+def _leer_leads(ids: List[int]) -> List[Dict]:
+    with pool.connection() as db:
+        filas = db.execute(
+            "SELECT * FROM leads WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id",
+            (json.dumps(ids),),
+        ).fetchall()
+    return [row_to_dict(f) for f in filas]
+
+
+def _guardar(resultados: List) -> None:
+    with pool.connection() as db:
+        save_segmentations(db, resultados)
+        db.commit()
+    response_cache.invalidate_leads(lead_id for lead_id, _ in resultados)
+    publish_segmentations(resultados)
+
+
+class AutoSegmenter:
+    def __init__(
+        self,
+        provider,
+        enabled: bool = AUTOSEGMENT_ENABLED,
+        batch_size: int = AUTOSEGMENT_BATCH_SIZE,
+        max_latency_ms: float = AUTOSEGMENT_MAX_LATENCY_MS,
+    ):
+        self.provider = provider
+        self.enabled = enabled
+        self.batch_size = max(1, batch_size)
+        self.max_latency = max_latency_ms / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cola: Optional[asyncio.Queue] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._encolados = 0
+        self._segmentados = 0
+        self._lotes = 0
+        self._errores = 0
+        self._medidos = 0
+        self._espera_total = 0.0   # segundos desde que se encola un id hasta que se guarda
+        self._espera_max = 0.0
+
+    async def start(self) -> None:
+        if not self.enabled or self._tarea is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._cola = asyncio.Queue()
+        self._tarea = asyncio.create_task(self._consumir())
+
+    async def stop(self) -> None:
+        """Procesa lo que quede en la cola y termina la tarea."""
+        if self._tarea is None:
+            return
+        self._cola.put_nowait(_FIN)
+        await self._tarea
+        self._tarea = None
+
+    def enqueue(self, lead_ids: Iterable[int]) -> None:
+        """
+        Encola leads para segmentar. Se puede llamar desde el event loop o
+        desde un hilo del threadpool (endpoints síncronos); sin modo activo
+        no hace nada.
+        """
+        if self._tarea is None:
+            return
+        ids = [i for i in lead_ids if i is not None]
+        if ids:
+            self._loop.call_soon_threadsafe(self._encolar, ids, time.perf_counter())
+
+    def _encolar(self, ids: List[int], instante: float) -> None:
+        self._encolados += len(ids)
+        for lead_id in ids:
+            self._cola.put_nowait((lead_id, instante))
+
+    async def _consumir(self) -> None:
+        terminar = False
+        while not terminar:
+            elemento = await self._cola.get()
+            if elemento is _FIN:
+                break
+            lote = [elemento]
+            limite = time.perf_counter() + self.max_latency
+            while len(lote) < self.batch_size:
+                try:
+                    elemento = self._cola.get_nowait()
+                except asyncio.QueueEmpty:
+                    restante = limite - time.perf_counter()
+                    if restante <= 0:
+                        break
+                    try:
+                        elemento = await asyncio.wait_for(self._cola.get(), restante)
+                    except asyncio.TimeoutError:
+                        break
+                if elemento is _FIN:
+                    # Todo lo encolado antes del fin ya está en este lote o en los anteriores
+                    terminar = True
+                    break
+                lote.append(elemento)
+            await self._procesar(lote)
+        # Lo encolado después del fin (escrituras que terminaban durante el apagado)
+        resto = []
+        while not self._cola.empty():
+            elemento = self._cola.get_nowait()
+            if elemento is not _FIN:
+                resto.append(elemento)
+        for inicio in range(0, len(resto), self.batch_size):
+            await self._procesar(resto[inicio:inicio + self.batch_size])
+
+    async def _procesar(self, lote: List) -> None:
+        # Un lead editado varias veces seguidas se segmenta una sola vez
+        ids = list(dict.fromkeys(lead_id for lead_id, _ in lote))
+        try:
+            leads = await run_in_threadpool(_leer_leads, ids)
+            if leads:
+                resultados = await segment_leads_cached_async(leads, self.provider)
+                await run_in_threadpool(_guardar, [(l["id"], r) for l, r in zip(leads, resultados)])
+        except Exception:
+            self._errores += 1
+            logger.exception("Error en la segmentación automática de %d leads", len(ids))
+            return
+        ahora = time.perf_counter()
+        esperas = [ahora - instante for _, instante in lote]
+        self._lotes += 1
+        self._segmentados += len(leads)
+        self._medidos += len(esperas)
+        self._espera_total += sum(esperas)
+        self._espera_max = max(self._espera_max, max(esperas))
+
+    def stats(self) -> Dict:
+        return {
+            "activo": self._tarea is not None,
+            "tamano_lote": self.batch_size,
+            "latencia_max_ms": round(self.max_latency * 1000, 1),
+            "encolados": self._encolados,
+            "pendientes": self._cola.qsize() if self._cola else 0,
+            "segmentados": self._segmentados,
+            "lotes": self._lotes,
+            "lote_medio": round(self._segmentados / self._lotes, 1) if self._lotes else 0.0,
+            "errores": self._errores,
+            "espera_media_ms": round(self._espera_total / self._medidos * 1000, 2) if self._medidos else 0.0,
+            "espera_max_ms": round(self._espera_max * 1000, 2),
+        }
@@ -0,0 +1,305 @@
+"""
+Operaciones por lotes sobre leads.
+
+Se recorren los leads por bloques ordenados por id (paginación por clave),
+de modo que nunca se carga la tabla entera en memoria y cada bloque se
+puede escribir y confirmar por separado.
+"""
+import json
+import sqlite3
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from database import normalize_email
+
+LEAD_INSERT_SQL = """
+    INSERT INTO leads (
+        id, nombre, email, empresa, sector, fuente,
+        mensaje_inicial, necesidades,
+        etapa_funnel, temperatura, tipo_contacto, estado, creado_en, actualizado_en, email_norm
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Igual que LEAD_INSERT_SQL pero, si el email normalizado ya existe, fusiona
+# los datos de contacto en el lead existente (sin tocar su segmentación ni estado)
+LEAD_UPSERT_SQL = LEAD_INSERT_SQL + """
+    ON CONFLICT (email_norm) DO UPDATE SET
+        nombre = excluded.nombre,
+        email = excluded.email,
+        empresa = COALESCE(excluded.empresa, leads.empresa),
+        sector = COALESCE(excluded.sector, leads.sector),
+        fuente = COALESCE(excluded.fuente, leads.fuente),
+        mensaje_inicial = COALESCE(excluded.mensaje_inicial, leads.mensaje_inicial),
+        necesidades = COALESCE(excluded.necesidades, leads.necesidades),
+        actualizado_en = excluded.actualizado_en,
+        version = leads.version + 1
+"""
+
+SEGMENTACION_UPDATE_SQL = """
+    UPDATE leads
+    SET etapa_funnel = ?, temperatura = ?, tipo_contacto = ?, actualizado_en = ?, version = version + 1
+    WHERE id = ?
+"""
+
+
+def iter_lead_chunks(
+    db: sqlite3.Connection,
+    where: str,
+    params: Sequence,
+    chunk_size: int,
+    desde_id: int = 0,
+) -> Iterator[List[sqlite3.Row]]:
+    """
+    Devuelve los leads que cumplen `where` en bloques de `chunk_size` filas,
+    ordenados por id. Cada bloque es una consulta nueva que continúa desde
+    el último id visto, así que se puede escribir en la tabla entre bloques.
+    """
+    ultimo_id = desde_id
+    while True:
+        cur = db.execute(
+            f"SELECT * FROM leads WHERE id > ? AND ({where}) ORDER BY id LIMIT ?",
+            [ultimo_id, *params, chunk_size],
+        )
+        filas = cur.fetchall()
+        if not filas:
+            return
+        yield filas
+        ultimo_id = filas[-1]["id"]
+
+
+def save_segmentations(db: sqlite3.Connection, resultados: List[Tuple[int, Dict]]) -> None:
+    """
+    Guarda en bloque pares (lead_id, resultado de segment_lead_with_llm).
+    No hace commit: la transacción la controla quien llama.
+    """
+    ahora = datetime.now().isoformat(timespec="seconds")
+    db.executemany(
+        SEGMENTACION_UPDATE_SQL,
+        [
+            (r["etapa_funnel"], r["temperatura"], r["tipo_contacto"], ahora, lead_id)
+            for lead_id, r in resultados
+        ],
+    )
+
+
+def refresh_priorities(db: sqlite3.Connection, desde_id: int = 0, hasta_id: Optional[int] = None) -> int:
+    """
+    Recalcula leads.prioridad (vista leads_prioridad_calculada) de los leads
+    con desde_id < id <= hasta_id y devuelve cuántos cambiaron. Solo escribe
+    los que cambian (el término de tiempo va por días completos, con tope),
+    así que una pasada en el mismo día no reescribe nada.
+    No hace commit.
+    """
+    cur = db.execute(
+        """
+        UPDATE leads SET prioridad = c.prioridad
+        FROM leads_prioridad_calculada c
+        WHERE c.id = leads.id AND leads.id > ? AND leads.id <= ? AND leads.prioridad IS NOT c.prioridad
+        """,
+        (desde_id, hasta_id if hasta_id is not None else 2**63 - 1),
+    )
+    return cur.rowcount
+
+
+def next_id(db: sqlite3.Connection, tabla: str) -> int:
+    """
+    Primer id libre de una tabla AUTOINCREMENT. Solo es fiable con la
+    transacción de escritura ya abierta (BEGIN IMMEDIATE), porque entonces
+    nadie más puede insertar hasta el commit.
+    """
+    fila = db.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabla,)).fetchone()
+    seq = fila[0] if fila else 0
+    max_id = db.execute(f"SELECT COALESCE(MAX(id), 0) FROM {tabla}").fetchone()[0]
+    return max(seq, max_id) + 1
+
+
+def lead_insert_params(lead_id: Optional[int], lead: Dict, seg: Dict, ahora: str) -> Tuple:
+    """Parámetros de LEAD_INSERT_SQL / LEAD_UPSERT_SQL para un lead (dict de LeadCreate)."""
+    return (
+        lead_id,
+        lead.get("nombre"),
+        lead.get("email"),
+        lead.get("empresa"),
+        lead.get("sector"),
+        lead.get("fuente"),
+        lead.get("mensaje_inicial"),
+        lead.get("necesidades"),
+        seg.get("etapa_funnel"),
+        seg.get("temperatura"),
+        seg.get("tipo_contacto", "lead"),
+        "nuevo",
+        ahora,
+        ahora,
+        normalize_email(lead.get("email")),
+    )
+
+
+def insert_leads(
+    db: sqlite3.Connection,
+    leads: List[Dict],
+    segmentaciones: Optional[List[Dict]] = None,
+    upsert: bool = False,
+    en_transaccion: Optional[Callable[[sqlite3.Connection], None]] = None,
+) -> List[Dict]:
+    """
+    Inserta un bloque de leads con un solo executemany dentro de una
+    transacción IMMEDIATE. Devuelve, en el mismo orden, un dict por lead:
+    {"id", "fusionado"} o {"error"} si su email ya existía y no hay upsert.
+
+    Los ids nuevos se asignan explícitamente a partir de next_id para poder
+    devolverlos sin releer las filas. Si se pasan segmentaciones (una por
+    lead) el lead nuevo se guarda ya clasificado. `en_transaccion(db)` se
+    ejecuta justo tras el BEGIN; si lanza, no se inserta nada.
+    """
+    ahora = datetime.now().isoformat(timespec="seconds")
+    normas = [normalize_email(lead.get("email")) for lead in leads]
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        if en_transaccion is not None:
+            en_transaccion(db)
+        # Emails que ya existen en la tabla -> id del lead existente
+        conocidos = dict(
+            db.execute(
+                "SELECT email_norm, id FROM leads WHERE email_norm IN (SELECT value FROM json_each(?))",
+                (json.dumps([n for n in normas if n]),),
+            ).fetchall()
+        )
+        siguiente = next_id(db, "leads")
+        resultados = []
+        filas = []
+        for i, (lead, norma) in enumerate(zip(leads, normas)):
+            if norma and norma in conocidos:
+                if not upsert:
+                    resultados.append({"error": "Ya existe un lead con ese email"})
+                    continue
+                resultados.append({"id": conocidos[norma], "fusionado": True})
+                lead_id = None
+            else:
+                lead_id = siguiente
+                siguiente += 1
+                if norma:
+                    conocidos[norma] = lead_id
+                resultados.append({"id": lead_id, "fusionado": False})
+            seg = segmentaciones[i] if segmentaciones else {}
+            filas.append(lead_insert_params(lead_id, lead, seg, ahora))
+        db.executemany(LEAD_UPSERT_SQL if upsert else LEAD_INSERT_SQL, filas)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return resultados
+
+
+# Tipo de interacción que se registra al guardar un mensaje generado, según el objetivo
+TIPO_POR_OBJETIVO = {
+    "reactivar": "reactivacion",
+    "seguimiento": "seguimiento",
+}
+
+
+def leads_with_history_chunk(
+    db: sqlite3.Connection,
+    where: str,
+    params: Sequence,
+    desde_id: int,
+    chunk_size: int,
+    n_historial: int = 5,
+) -> List[Tuple[Dict, List[Dict]]]:
+    """
+    Siguiente bloque de leads (id > desde_id) junto con sus `n_historial`
+    interacciones más recientes, en una sola consulta con ROW_NUMBER()
+    OVER (PARTITION BY lead_id ...) en lugar de una consulta por lead.
+    Devuelve [(lead, [interacciones de más reciente a más antigua])].
+    """
+    cur = db.execute(
+        f"""
+        WITH objetivo AS (
+            SELECT * FROM leads WHERE id > ? AND ({where}) ORDER BY id LIMIT ?
+        ),
+        historial AS (
+            SELECT i.*,
+                   ROW_NUMBER() OVER (PARTITION BY i.lead_id ORDER BY i.fecha DESC, i.id DESC) AS rn
+            FROM interacciones i
+            WHERE i.lead_id IN (SELECT id FROM objetivo)
+        )
+        SELECT o.*,
+               h.id AS h_id, h.lead_id AS h_lead_id, h.canal AS h_canal, h.rol AS h_rol,
+               h.mensaje AS h_mensaje, h.tipo AS h_tipo, h.resultado AS h_resultado, h.fecha AS h_fecha
+        FROM objetivo o
+        LEFT JOIN historial h ON h.lead_id = o.id AND h.rn <= ?
+        ORDER BY o.id, h.rn
+        """,
+        [desde_id, *params, chunk_size, n_historial],
+    )
+    columnas = [d[0] for d in cur.description]
+    n_lead = columnas.index("h_id")
+    columnas_lead = columnas[:n_lead]
+    columnas_hist = [c[2:] for c in columnas[n_lead:]]
+    pos_id = columnas_lead.index("id")
+
+    bloque: List[Tuple[Dict, List[Dict]]] = []
+    for fila in cur:
+        fila = tuple(fila)
+        if not bloque or bloque[-1][0]["id"] != fila[pos_id]:
+            bloque.append((dict(zip(columnas_lead, fila[:n_lead])), []))
+        if fila[n_lead] is not None:
+            bloque[-1][1].append(dict(zip(columnas_hist, fila[n_lead:])))
+    return bloque
+
+
+def insert_generated_messages(
+    db: sqlite3.Connection,
+    mensajes: List[Tuple[Dict, List[Dict], Dict]],
+    objetivo: str,
+) -> List[int]:
+    """
+    Inserta como interacciones (rol agente) los mensajes generados para
+    (lead, historial, mensaje) con un executemany. No abre ni confirma la
+    transacción: el llamante debe tener una IMMEDIATE abierta para que los
+    ids reservados con next_id no choquen. Devuelve los ids en el mismo orden.
+    """
+    primero = next_id(db, "interacciones")
+    ids = list(range(primero, primero + len(mensajes)))
+    filas = []
+    for interaccion_id, (lead, historial, mensaje) in zip(ids, mensajes):
+        tipo = TIPO_POR_OBJETIVO.get(objetivo) or ("seguimiento" if historial else "primer_contacto")
+        filas.append(
+            (
+                interaccion_id,
+                lead["id"],
+                mensaje["canal"],
+                "agente",
+                mensaje["cuerpo"],
+                tipo,
+                None,
+                mensaje["generado_en"],
+            )
+        )
+    db.executemany(
+        """
+        INSERT INTO interacciones (id, lead_id, canal, rol, mensaje, tipo, resultado, fecha)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        filas,
+    )
+    return ids
+
+
+def save_generated_messages(
+    db: sqlite3.Connection,
+    mensajes: List[Tuple[Dict, List[Dict], Dict]],
+    objetivo: str,
+) -> List[int]:
+    """
+    Registra como interacciones (rol agente) los mensajes generados para
+    (lead, historial, mensaje), con un executemany en una transacción
+    IMMEDIATE. Devuelve los ids de las interacciones en el mismo orden.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        ids = insert_generated_messages(db, mensajes, objetivo)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return ids
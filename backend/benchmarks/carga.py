@@ -0,0 +1,215 @@
+"""
+Prueba de carga en proceso de la API (main.app) sin red: httpx.AsyncClient
+con ASGITransport sobre una BD temporal generada con benchmarks/datos.py.
+
+Escenarios (cada uno con --concurrencia clientes durante --duracion s):
+    crud          listar, ver, crear, editar y borrar leads; registrar y
+                  listar interacciones (mezcla ponderada)
+    segmentacion  POST /leads/{id}/segmentar sobre leads al azar
+    mensajes      POST /leads/{id}/siguiente-mensaje sobre leads al azar
+    interacciones POST /leads/{id}/interacciones (ráfagas de mensajes de
+                  chat); con LEADFLOW_WRITE_BEHIND=1 mide el commit agrupado
+                  (ver benchmarks/write_behind.py)
+
+Informa en JSON, por escenario y por operación, peticiones/s y latencias
+p50/p95/p99/máx, además de los errores. Con --comparar se marcan las
+operaciones cuyo p95 empeora más que --umbral respecto a un informe
+anterior (código de salida 1), para comparar commits.
+
+Uso (desde backend/):
+    python benchmarks/carga.py --leads 20000 --interacciones 60000 --salida carga.json
+    python benchmarks/carga.py --escenarios crud --concurrencia 64 --comparar carga.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from comun import comparar, escribir_informe, leer_informe, metadatos, resumen_latencias  # noqa: E402
+from datos import DOLORES, INTENCIONES, poblar  # noqa: E402
+
+ESCENARIOS = ("crud", "segmentacion", "mensajes", "interacciones")
+
+
+class Escenario:
+    """Estado compartido por los clientes de un escenario y registro de latencias."""
+
+    def __init__(self, cliente, n_leads: int, semilla: int):
+        self.cliente = cliente
+        self.n_leads = n_leads
+        self.rnd = random.Random(semilla)
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.errores: Dict[str, int] = defaultdict(int)
+        self.creados: List[int] = []
+        self.contador = 0
+
+    def lead_al_azar(self) -> int:
+        return self.rnd.randint(1, self.n_leads)
+
+    async def peticion(self, operacion: str, metodo: str, url: str, esperado: int = 200, **kwargs):
+        t0 = time.perf_counter()
+        respuesta = await self.cliente.request(metodo, url, **kwargs)
+        self.latencias[operacion].append(time.perf_counter() - t0)
+        if respuesta.status_code != esperado:
+            self.errores[f"{operacion} → {respuesta.status_code}"] += 1
+        return respuesta
+
+
+async def _crud(e: Escenario) -> None:
+    r = e.rnd.random()
+    if r < 0.30:
+        await e.peticion("GET /leads", "GET", "/leads", params={"limit": 50})
+    elif r < 0.55:
+        await e.peticion("GET /leads/{id}", "GET", f"/leads/{e.lead_al_azar()}")
+    elif r < 0.65:
+        await e.peticion("GET /leads/{id}/interacciones", "GET", f"/leads/{e.lead_al_azar()}/interacciones")
+    elif r < 0.77:
+        e.contador += 1
+        cuerpo = {
+            "nombre": f"Carga {e.contador}",
+            "email": f"carga.{e.contador}.{id(e)}@ejemplo.com",
+            "sector": "ecommerce",
+            "fuente": "Instagram Ads",
+            "mensaje_inicial": f"{e.rnd.choice(DOLORES)}, {e.rnd.choice(INTENCIONES)}",
+        }
+        respuesta = await e.peticion("POST /leads", "POST", "/leads", 201, json=cuerpo)
+        if respuesta.status_code == 201:
+            e.creados.append(respuesta.json()["id"])
+    elif r < 0.87:
+        lead_id = e.rnd.choice(e.creados) if e.creados else e.lead_al_azar()
+        cuerpo = {"nombre": f"Editado {lead_id}", "mensaje_inicial": e.rnd.choice(DOLORES)}
+        await e.peticion("PUT /leads/{id}", "PUT", f"/leads/{lead_id}", json=cuerpo)
+    elif r < 0.97:
+        cuerpo = {"canal": "email", "rol": "agente", "mensaje": e.rnd.choice(DOLORES), "tipo": "seguimiento"}
+        await e.peticion("POST /leads/{id}/interacciones", "POST", f"/leads/{e.lead_al_azar()}/interacciones", 201, json=cuerpo)
+    elif e.creados:
+        # Solo se borran leads creados por la propia prueba
+        lead_id = e.creados.pop(e.rnd.randrange(len(e.creados)))
+        await e.peticion("DELETE /leads/{id}", "DELETE", f"/leads/{lead_id}", 204)
+
+
+async def _segmentacion(e: Escenario) -> None:
+    await e.peticion("POST /leads/{id}/segmentar", "POST", f"/leads/{e.lead_al_azar()}/segmentar")
+
+
+async def _mensajes(e: Escenario) -> None:
+    cuerpo = {
+        "canal": e.rnd.choice(("email", "whatsapp", "linkedin")),
+        "objetivo": e.rnd.choice(("conseguir_llamada", "seguimiento", "reactivar")),
+        "tono": "cercano_profesional",
+    }
+    await e.peticion("POST /leads/{id}/siguiente-mensaje", "POST", f"/leads/{e.lead_al_azar()}/siguiente-mensaje", json=cuerpo)
+
+
+async def _interacciones(e: Escenario) -> None:
+    cuerpo = {
+        "canal": "whatsapp",
+        "rol": e.rnd.choice(("lead", "agente")),
+        "mensaje": e.rnd.choice(DOLORES),
+        "tipo": "seguimiento",
+        "resultado": e.rnd.choice(("sin_respuesta", "respondio")),
+    }
+    await e.peticion("POST /leads/{id}/interacciones", "POST", f"/leads/{e.lead_al_azar()}/interacciones", 201, json=cuerpo)
+
+
+OPERACIONES = {"crud": _crud, "segmentacion": _segmentacion, "mensajes": _mensajes, "interacciones": _interacciones}
+
+
+async def ejecutar(cliente, nombre: str, n_leads: int, concurrencia: int, duracion: float, semilla: int) -> Dict:
+    e = Escenario(cliente, n_leads, semilla)
+    operacion = OPERACIONES[nombre]
+    fin = time.perf_counter() + duracion
+
+    async def usuario():
+        while time.perf_counter() < fin:
+            await operacion(e)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(usuario() for _ in range(concurrencia)))
+    segundos = time.perf_counter() - t0
+    todas = [lat for lista in e.latencias.values() for lat in lista]
+    return {
+        "total": resumen_latencias(todas, segundos),
+        "operaciones": {op: resumen_latencias(lista, segundos) for op, lista in sorted(e.latencias.items())},
+        "errores": dict(e.errores),
+    }
+
+
+async def correr(args) -> Dict:
+    import httpx
+    import main as api
+
+    resultados = {}
+    async with api.app.router.lifespan_context(api.app):
+        transporte = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://carga") as cliente:
+            for nombre in args.escenarios:
+                # Calentamiento: cachés de páginas de SQLite, pool de conexiones, imports perezosos
+                await ejecutar(cliente, nombre, args.leads, args.concurrencia, min(1.0, args.duracion), args.semilla)
+                resultados[nombre] = await ejecutar(
+                    cliente, nombre, args.leads, args.concurrencia, args.duracion, args.semilla
+                )
+                print(f"{nombre:14s} {resultados[nombre]['total']}", file=sys.stderr)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=20000)
+    parser.add_argument("--interacciones", type=int, default=60000)
+    parser.add_argument("--escenarios", nargs="+", choices=ESCENARIOS, default=list(ESCENARIOS))
+    parser.add_argument("--concurrencia", type=int, default=32, help="Clientes simultáneos por escenario")
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos por escenario")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="Guardar el informe JSON en este fichero")
+    parser.add_argument("--comparar", help="Informe JSON anterior con el que comparar")
+    parser.add_argument("--umbral", type=float, default=0.2, help="Empeoramiento de p95 tolerado (0.2 = 20 %%)")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="leadflow-carga-")
+    shutil.copy(os.path.join(BACKEND, "models.sql"), directorio)
+    os.chdir(directorio)  # database.DB_PATH y models.sql son relativos
+    try:
+        t0 = time.perf_counter()
+        conn = sqlite3.connect("leadflow.db")
+        poblar(conn, args.leads, args.interacciones, args.semilla)
+        conn.close()
+        print(f"BD: {args.leads} leads, {args.interacciones} interacciones ({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+        resultados = asyncio.run(correr(args))
+    finally:
+        os.chdir(BACKEND)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        "meta": metadatos(
+            benchmark="carga",
+            leads=args.leads,
+            interacciones=args.interacciones,
+            concurrencia=args.concurrencia,
+            duracion_s=args.duracion,
+            semilla=args.semilla,
+            llm_backend=os.getenv("LEADFLOW_LLM_BACKEND", "reglas"),
+            write_behind=os.getenv("LEADFLOW_WRITE_BEHIND", "0"),
+        ),
+        "escenarios": resultados,
+    }
+    escribir_informe(informe, args.salida)
+
+    if args.comparar:
+        regresiones = comparar(leer_informe(args.comparar), informe, "p95_ms", False, args.umbral)
+        sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
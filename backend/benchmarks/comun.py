@@ -0,0 +1,94 @@
+"""
+Utilidades compartidas por los benchmarks: metadatos de la ejecución (para
+comparar resultados entre commits), percentiles y lectura/escritura de los
+informes JSON.
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def commit_actual() -> Optional[str]:
+    try:
+        salida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return salida.stdout.strip() or None
+
+
+def metadatos(**extra) -> Dict:
+    return {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        **extra,
+    }
+
+
+def percentil(ordenados: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, max(0, math.ceil(p / 100 * len(ordenados)) - 1))]
+
+
+def resumen_latencias(latencias: List[float], segundos: float) -> Dict:
+    """p50/p95/p99/máx en milisegundos y peticiones por segundo."""
+    ordenados = sorted(latencias)
+    n = len(ordenados)
+    return {
+        "peticiones": n,
+        "por_segundo": round(n / segundos, 1) if segundos else 0.0,
+        "media_ms": round(sum(ordenados) / n * 1000, 3) if n else 0.0,
+        "p50_ms": round(percentil(ordenados, 50) * 1000, 3),
+        "p95_ms": round(percentil(ordenados, 95) * 1000, 3),
+        "p99_ms": round(percentil(ordenados, 99) * 1000, 3),
+        "max_ms": round(ordenados[-1] * 1000, 3) if n else 0.0,
+    }
+
+
+def escribir_informe(informe: Dict, ruta: Optional[str]) -> None:
+    texto = json.dumps(informe, ensure_ascii=False, indent=2)
+    if ruta:
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    print(texto)
+
+
+def leer_informe(ruta: str) -> Dict:
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def comparar(base: Dict, actual: Dict, metrica: str, mayor_es_mejor: bool, umbral: float, ruta: str = "") -> List[str]:
+    """
+    Recorre en paralelo dos informes y devuelve las regresiones de `metrica`
+    (hojas con ese nombre) peores que `umbral` (fracción, 0.2 = 20 %).
+    Imprime todas las diferencias.
+    """
+    regresiones = []
+    for clave, valor in actual.items():
+        if clave not in base:
+            continue
+        nombre = f"{ruta}/{clave}" if ruta else clave
+        if isinstance(valor, dict) and isinstance(base[clave], dict):
+            regresiones += comparar(base[clave], valor, metrica, mayor_es_mejor, umbral, nombre)
+        elif clave == metrica and isinstance(valor, (int, float)) and base[clave]:
+            cambio = (valor - base[clave]) / base[clave]
+            peor = -cambio if mayor_es_mejor else cambio
+            marca = "❌" if peor > umbral else "  "
+            print(f"{marca} {nombre:60s} {base[clave]:>12} → {valor:>12}  ({cambio:+.1%})", file=sys.stderr)
+            if peor > umbral:
+                regresiones.append(nombre)
+    return regresiones
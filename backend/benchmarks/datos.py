@@ -0,0 +1,228 @@
+"""
+Generador de datos sintéticos para benchmarks y pruebas de carga.
+
+Amplía init_db.seed_data (los 6 leads de ejemplo) hasta N leads y M
+interacciones con texto en español parecido al real: mensajes que mezclan
+dolores, contexto de negocio y frases de urgencia o duda, en los mismos
+sectores y fuentes que la semilla. Con la misma semilla se generan los
+mismos textos y distribuciones (las fechas son relativas al momento de
+ejecución), así que los resultados son comparables entre commits.
+
+Uso (desde backend/):
+    python benchmarks/datos.py --bd /tmp/bench.db --leads 100000 --interacciones 300000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import LEAD_INSERT_SQL  # noqa: E402
+from database import normalize_email  # noqa: E402
+from init_db import create_tables, seed_data  # noqa: E402
+from llm_service import SEGMENTATION_FIELDS, segment_leads_batch  # noqa: E402
+
+NOMBRES = (
+    "Laura", "Carlos", "Ana", "Javier", "Marta", "Diego", "Lucía", "Pablo", "Sofía", "Andrés",
+    "Elena", "Miguel", "Paula", "Raúl", "Carmen", "Sergio", "Irene", "Álvaro", "Nuria", "Jorge",
+)
+APELLIDOS = (
+    "Gómez", "Pérez", "Martínez", "López", "Ruiz", "Sánchez", "García", "Fernández", "Díaz", "Moreno",
+    "Muñoz", "Álvarez", "Romero", "Navarro", "Torres", "Domínguez", "Vázquez", "Ramos", "Gil", "Serrano",
+)
+# sector: (plantillas de empresa, peso)
+SECTORES = {
+    "ecommerce": (("Tienda {x} Online", "{x} Shop", "Moda {x}"), 30),
+    "educacion": (("Academia {x}", "Escuela {x}", "Formación {x}"), 15),
+    "hosteleria": (("Cafetería {x}", "Restaurante {x}", "Bar {x}"), 15),
+    "servicios b2b": (("Agencia {x}", "{x} Consulting", "Soluciones {x}"), 15),
+    "consultoria": (("Consultora {x}", "{x} Asesores"), 10),
+    "eventos": (("Eventos {x}", "{x} Producciones"), 5),
+    "salud": (("Clínica {x}", "Centro {x}", "Fisioterapia {x}"), 10),
+}
+PALABRAS_EMPRESA = ("Verde", "Norte", "Sol", "Hola", "Digital", "Mar", "Luna", "Central", "Plus", "Nova", "Río", "Alba")
+FUENTES = (
+    ("Instagram Ads", 30), ("LinkedIn", 15), ("Formulario web", 25), ("Recomendación", 10),
+    ("Cliente actual", 5), ("Email directo", 5), ("Facebook Ads", 5), ("Webinar", 5),
+)
+
+APERTURAS = (
+    "Hola, os escribo porque", "Buenas,", "Hola equipo,", "Dejé mis datos porque", "Os encontré en redes y",
+    "Me recomendaron vuestro servicio y", "", "",
+)
+DOLORES = (
+    "me llegan muchos mensajes por Instagram y no doy abasto",
+    "llevo todo en Excels y notas sueltas",
+    "pierdo mucho tiempo copiando datos a mano",
+    "tenemos tráfico pero pocas ventas",
+    "los clientes compran una vez y no vuelven",
+    "el equipo comercial no ve la misma información",
+    "se me pierden conversaciones en el DM",
+    "uso varias herramientas distintas y nada está conectado",
+    "quiero automatizar el seguimiento",
+    "los leads no convierten como esperaba",
+)
+CONTEXTOS = (
+    "vendemos por la tienda online", "organizamos webinars cada mes", "tenemos una cafetería en el centro",
+    "trabajamos con empresas B2B", "somos una consultoría pequeña", "hacemos campañas en redes",
+    "damos cursos de formación", "tenemos varios comerciales", "",
+)
+INTENCIONES = (
+    "me urge ordenarlo este mes", "lo necesito lo antes posible", "no sé si tiene sentido invertir ahora",
+    "quiero entender cómo funcionaría", "me interesa ver una demo", "estoy buscando alternativas",
+    "estamos evaluando opciones", "quiero saber el precio", "estoy esperando la cotización",
+    "ya soy cliente actual y quiero renovar", "me pasaron el presupuesto y lo estoy revisando", "", "",
+)
+CIERRES = ("Gracias.", "Un saludo.", "¿Me contáis?", "Quedo atento.", "")
+
+CANALES = (("email", 45), ("whatsapp", 40), ("linkedin", 15))
+TIPOS = (("primer_contacto", 30), ("seguimiento", 50), ("cierre", 10), ("reactivacion", 10))
+RESULTADOS = (("sin_respuesta", 55), ("respondio", 30), ("rechazo", 10), ("cerro_llamada", 5))
+RESPUESTAS_LEAD = (
+    "Gracias, me encaja hablar la semana que viene.", "Ahora mismo no es prioridad, escríbeme en un mes.",
+    "¿Cuánto costaría para un equipo de tres personas?", "Perfecto, ¿el jueves a las 10?",
+    "Lo comento con mi socio y te digo.", "No me interesa, gracias.",
+)
+MENSAJES_AGENTE = (
+    "Hola {n}, te escribo para retomar lo que comentaste sobre {d}.",
+    "Hola {n}, ¿pudiste ver la propuesta? Si quieres lo vemos en una llamada corta.",
+    "Hola {n} 👋 te comparto un ejemplo de cómo otros negocios resolvieron que {d}.",
+    "Hola {n}, ¿te viene bien una llamada de 15 minutos esta semana?",
+)
+
+
+def _ponderado(rnd: random.Random, opciones: Tuple[Tuple[str, int], ...]) -> str:
+    return rnd.choices([o for o, _ in opciones], weights=[p for _, p in opciones])[0]
+
+
+def _frase(rnd: random.Random, *partes: Tuple[str, ...]) -> str:
+    texto = " ".join(p for p in (rnd.choice(opciones) for opciones in partes) if p)
+    return texto[:1].upper() + texto[1:]
+
+
+def generar_leads(n: int, semilla: int = 42, inicio: datetime = None, dias: int = 365) -> Iterator[Dict]:
+    """Leads sin segmentar, con creado_en creciente repartido en los últimos `dias`."""
+    rnd = random.Random(semilla)
+    inicio = inicio or datetime.now().replace(microsecond=0) - timedelta(days=dias)
+    paso = dias * 86400 / max(n, 1)
+    sectores = list(SECTORES)
+    pesos_sector = [SECTORES[s][1] for s in sectores]
+    for i in range(n):
+        nombre, apellido = rnd.choice(NOMBRES), rnd.choice(APELLIDOS)
+        sector = rnd.choices(sectores, weights=pesos_sector)[0]
+        empresa = rnd.choice(SECTORES[sector][0]).format(x=rnd.choice(PALABRAS_EMPRESA))
+        creado = (inicio + timedelta(seconds=int(i * paso))).isoformat(timespec="seconds")
+        email = f"{nombre}.{apellido}.{i}@{empresa.split()[0]}.es"
+        yield {
+            "nombre": f"{nombre} {apellido}",
+            "email": email,
+            "empresa": empresa if rnd.random() > 0.1 else None,
+            "sector": sector if rnd.random() > 0.05 else None,
+            "fuente": _ponderado(rnd, FUENTES),
+            "mensaje_inicial": _frase(rnd, APERTURAS, DOLORES, INTENCIONES, CIERRES) if rnd.random() > 0.03 else None,
+            "necesidades": _frase(rnd, CONTEXTOS, DOLORES) if rnd.random() > 0.2 else None,
+            "tipo_contacto": "lead",
+            "estado": "nuevo",
+            "creado_en": creado,
+        }
+
+
+def generar_interacciones(
+    leads: List[Tuple[int, str, str]], m: int, semilla: int = 43
+) -> Iterator[Tuple]:
+    """
+    M interacciones repartidas entre (id, nombre, creado_en) de `leads`, con
+    más historial en los leads antiguos, siempre posteriores a su creación.
+    """
+    rnd = random.Random(semilla)
+    ahora = datetime.now()
+    for _ in range(m):
+        lead_id, nombre, creado_en = leads[int(len(leads) * rnd.random() ** 2)]
+        desde = datetime.fromisoformat(creado_en)
+        fecha = desde + (ahora - desde) * rnd.random()
+        rol = "agente" if rnd.random() < 0.6 else "lead"
+        if rol == "agente":
+            mensaje = rnd.choice(MENSAJES_AGENTE).format(n=nombre.split()[0], d=rnd.choice(DOLORES))
+        else:
+            mensaje = rnd.choice(RESPUESTAS_LEAD)
+        yield (
+            lead_id, _ponderado(rnd, CANALES), rol, mensaje, _ponderado(rnd, TIPOS),
+            _ponderado(rnd, RESULTADOS), fecha.isoformat(timespec="seconds"),
+        )
+
+
+def poblar(
+    conn: sqlite3.Connection,
+    n_leads: int,
+    n_interacciones: int,
+    semilla: int = 42,
+    segmentados: float = 0.7,
+    bloque: int = 10000,
+) -> None:
+    """
+    Crea el esquema, inserta la semilla de init_db y añade leads hasta
+    `n_leads` y `n_interacciones` interacciones. Una fracción `segmentados`
+    de los leads generados se guarda ya segmentada con el motor de reglas.
+    """
+    create_tables(conn)
+    seed_data(conn)
+    rnd = random.Random(semilla + 1)
+    generados = generar_leads(max(0, n_leads - 6), semilla)
+    while True:
+        leads = [lead for _, lead in zip(range(bloque), generados)]
+        if not leads:
+            break
+        segs = segment_leads_batch(*([lead.get(c) for lead in leads] for c in SEGMENTATION_FIELDS))
+        filas = []
+        for i, lead in enumerate(leads):
+            segmentar = rnd.random() < segmentados
+            filas.append((
+                None, lead["nombre"], lead["email"], lead["empresa"], lead["sector"], lead["fuente"],
+                lead["mensaje_inicial"], lead["necesidades"],
+                segs["etapa_funnel"][i] if segmentar else None,
+                segs["temperatura"][i] if segmentar else None,
+                segs["tipo_contacto"][i] if segmentar else lead["tipo_contacto"],
+                lead["estado"], lead["creado_en"], lead["creado_en"], normalize_email(lead["email"]),
+            ))
+        conn.executemany(LEAD_INSERT_SQL, filas)
+        conn.commit()
+
+    if n_interacciones:
+        leads = conn.execute("SELECT id, nombre, creado_en FROM leads ORDER BY id").fetchall()
+        interacciones = generar_interacciones(leads, n_interacciones, semilla + 2)
+        while True:
+            filas = [f for _, f in zip(range(bloque), interacciones)]
+            if not filas:
+                break
+            conn.executemany(
+                "INSERT INTO interacciones (lead_id, canal, rol, mensaje, tipo, resultado, fecha) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                filas,
+            )
+            conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bd", required=True, help="Ruta de la BD a crear (no debe existir)")
+    parser.add_argument("--leads", type=int, default=100_000)
+    parser.add_argument("--interacciones", type=int, default=300_000)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--segmentados", type=float, default=0.7, help="Fracción de leads ya segmentados")
+    args = parser.parse_args()
+
+    if os.path.exists(args.bd):
+        parser.error(f"{args.bd} ya existe")
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(args.bd)
+    poblar(conn, args.leads, args.interacciones, args.semilla, args.segmentados)
+    conn.close()
+    print(f"✅ {args.bd}: {args.leads} leads y {args.interacciones} interacciones en {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Micro-benchmarks del motor de reglas (llm_service) sobre leads sintéticos
+de benchmarks/datos.py: segment_lead_with_llm, _detectar_dolor,
+_detectar_contexto_negocio y generate_next_message_with_llm.
+
+Cada función se ejecuta sobre los mismos leads varias veces; se informa la
+mejor y la mediana de las repeticiones (µs por llamada y llamadas/s) en
+JSON. Las cachés de llm_service (detectores memorizados, plantillas) se
+vacían antes de cada repetición, así que se mide el cálculo y no aciertos;
+las entradas "[caché]" miden aparte el camino con la caché caliente. Con --comparar se marcan las funciones que empeoran más que --umbral
+respecto a un informe anterior (código de salida 1).
+
+Uso (desde backend/):
+    python benchmarks/micro.py --leads 20000 --salida micro.json
+    python benchmarks/micro.py --comparar micro.json
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from comun import comparar, escribir_informe, leer_informe, metadatos  # noqa: E402
+from datos import generar_leads  # noqa: E402
+import llm_service  # noqa: E402
+
+CANALES = ("email", "whatsapp", "linkedin")
+OBJETIVOS = ("conseguir_llamada", "seguimiento", "reactivar")
+
+
+def _texto(lead):
+    return " ".join(lead.get(c) or "" for c in ("mensaje_inicial", "necesidades", "sector", "fuente"))
+
+
+def vaciar_caches():
+    llm_service._detectar_dolor.cache_clear()
+    llm_service._contexto_de_textos.cache_clear()
+    llm_service._plantilla.cache_clear()
+
+
+def casos(leads):
+    """(nombre, función sin argumentos que recorre todos los leads, preparación antes de cada repetición)."""
+    textos = [_texto(lead) for lead in leads]
+    segmentados = [{**lead, **llm_service.segment_lead_with_llm(lead)} for lead in leads]
+    variantes = [(CANALES[i % 3], OBJETIVOS[i // 3 % 3]) for i in range(len(leads))]
+
+    def segmentar():
+        for lead in leads:
+            llm_service.segment_lead_with_llm(lead)
+
+    def dolor():
+        for texto in textos:
+            llm_service._detectar_dolor(texto)
+
+    def contexto():
+        for lead in leads:
+            llm_service._detectar_contexto_negocio(lead)
+
+    def mensaje():
+        for lead, (canal, objetivo) in zip(segmentados, variantes):
+            llm_service.generate_next_message_with_llm(lead, [], canal, objetivo, "cercano_profesional")
+
+    return (
+        ("segment_lead_with_llm", segmentar, vaciar_caches),
+        ("_detectar_dolor", dolor, vaciar_caches),
+        ("_detectar_contexto_negocio", contexto, vaciar_caches),
+        ("generate_next_message_with_llm", mensaje, vaciar_caches),
+        # Caché caliente: cada texto ya se vio en la repetición anterior (o en el calentamiento)
+        ("_detectar_dolor [caché]", dolor, None),
+        ("_detectar_contexto_negocio [caché]", contexto, None),
+        ("generate_next_message_with_llm [caché]", mensaje, None),
+    )
+
+
+def medir(funcion, n: int, repeticiones: int, preparar=None):
+    tiempos = []
+    if preparar is None:
+        funcion()  # calentamiento: las repeticiones miden el estado estable
+    for _ in range(repeticiones):
+        if preparar is not None:
+            preparar()
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    mejor, mediana = min(tiempos), statistics.median(tiempos)
+    return {
+        "llamadas": n,
+        "repeticiones": repeticiones,
+        "mejor_us": round(mejor / n * 1e6, 3),
+        "mediana_us": round(mediana / n * 1e6, 3),
+        "por_segundo": round(n / mejor, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=20000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="Guardar el informe JSON en este fichero")
+    parser.add_argument("--comparar", help="Informe JSON anterior con el que comparar")
+    parser.add_argument("--umbral", type=float, default=0.2, help="Empeoramiento tolerado (0.2 = 20 %%)")
+    args = parser.parse_args()
+
+    leads = list(generar_leads(args.leads, args.semilla))
+    informe = {
+        "meta": metadatos(benchmark="micro", leads=args.leads, semilla=args.semilla),
+        "funciones": {
+            nombre: medir(funcion, len(leads), args.repeticiones, preparar) for nombre, funcion, preparar in casos(leads)
+        },
+    }
+    escribir_informe(informe, args.salida)
+
+    if args.comparar:
+        regresiones = comparar(leer_informe(args.comparar), informe, "por_segundo", True, args.umbral)
+        sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: segment_lead_with_llm (lead a lead) frente a segment_leads_batch
+(por columnas) sobre leads sintéticos, comprobando que los resultados son
+idénticos fila a fila.
+
+Uso (desde backend/):
+    python benchmarks/segmentacion_batch.py --leads 1000000
+    python benchmarks/segmentacion_batch.py --desde-bd leadflow.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_service import (  # noqa: E402
+    REGLAS_TEMPERATURA,
+    REGLAS_TIPO_CONTACTO,
+    SEGMENTATION_FIELDS,
+    segment_lead_with_llm,
+    segment_leads_batch,
+)
+
+RELLENO = (
+    "Hola", "quería información", "sobre el servicio", "para mi negocio", "tenemos una tienda",
+    "vendemos por Instagram", "el equipo es pequeño", "gracias", "un saludo", "nos llegan muchos mensajes",
+)
+SECTORES = ("ecommerce", "educacion", "hosteleria", "salud", "servicios", None)
+FUENTES = ("Instagram Ads", "LinkedIn", "Formulario web", "Referido", None)
+
+
+def generar_columnas(n: int, semilla: int = 42):
+    """Columnas de texto con frases de las reglas mezcladas con relleno y mayúsculas."""
+    rnd = random.Random(semilla)
+    frases = [f for regla in REGLAS_TEMPERATURA + REGLAS_TIPO_CONTACTO for f in regla[0]]
+
+    def texto():
+        if rnd.random() < 0.05:
+            return None
+        partes = rnd.choices(RELLENO, k=rnd.randint(1, 6))
+        if rnd.random() < 0.4:
+            frase = rnd.choice(frases)
+            partes.insert(rnd.randint(0, len(partes)), frase.upper() if rnd.random() < 0.2 else frase)
+        return " ".join(partes)
+
+    return (
+        [texto() for _ in range(n)],
+        [texto() for _ in range(n)],
+        [rnd.choice(SECTORES) for _ in range(n)],
+        [rnd.choice(FUENTES) for _ in range(n)],
+    )
+
+
+def leer_columnas(db_path: str):
+    conn = sqlite3.connect(db_path)
+    filas = conn.execute(f"SELECT {', '.join(SEGMENTATION_FIELDS)} FROM leads ORDER BY id").fetchall()
+    conn.close()
+    return tuple(list(c) for c in zip(*filas)) if filas else ([], [], [], [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=1_000_000, help="Leads sintéticos a generar")
+    parser.add_argument("--desde-bd", help="Leer las columnas de la tabla leads de esta BD en lugar de generarlas")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    columnas = leer_columnas(args.desde_bd) if args.desde_bd else generar_columnas(args.leads)
+    n = len(columnas[0])
+    print(f"{n} leads preparados en {time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    por_lead = [segment_lead_with_llm(dict(zip(SEGMENTATION_FIELDS, fila))) for fila in zip(*columnas)]
+    t_por_lead = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    por_columnas = segment_leads_batch(*columnas)
+    t_batch = time.perf_counter() - t0
+
+    diferencias = sum(
+        1
+        for i, r in enumerate(por_lead)
+        if (r["etapa_funnel"], r["temperatura"], r["tipo_contacto"], r["siguiente_paso"])
+        != tuple(por_columnas[c][i] for c in ("etapa_funnel", "temperatura", "tipo_contacto", "siguiente_paso"))
+    )
+
+    print(f"segment_lead_with_llm : {t_por_lead:8.2f}s  ({n / t_por_lead:,.0f} leads/s)")
+    print(f"segment_leads_batch   : {t_batch:8.2f}s  ({n / t_batch:,.0f} leads/s)")
+    print(f"aceleración           : {t_por_lead / t_batch:8.2f}x")
+    print("✅ Resultados idénticos" if not diferencias else f"❌ {diferencias} filas distintas")
+    sys.exit(1 if diferencias else 0)
+
+
+if __name__ == "__main__":
+    main()
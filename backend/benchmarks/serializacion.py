@@ -0,0 +1,136 @@
+"""
+Benchmark: filas por segundo de GET /leads y GET /leads/{id}/interacciones
+con la serialización normal (sqlite3.Row → dict → response_model → json)
+frente al camino rápido de LEADFLOW_FAST_JSON (tuplas → orjson),
+comprobando que los cuerpos son idénticos byte a byte.
+
+Las peticiones pasan por la aplicación completa (TestClient) sobre una BD
+temporal; la caché de respuestas se vacía antes de cada una para medir
+consulta y serialización.
+
+Uso (desde backend/):
+    python benchmarks/serializacion.py --leads 20000 --interacciones 500
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+RELLENO = (
+    "Hola", "quería información", "sobre el servicio", "para mi negocio", "tenemos una tienda",
+    "vendemos por Instagram", "el equipo es pequeño", "gracias", "un saludo", "nos llegan muchos mensajes",
+)
+
+
+def poblar(db_path: str, n_leads: int, n_interacciones: int, semilla: int = 42) -> None:
+    from init_db import create_tables
+
+    rnd = random.Random(semilla)
+    conn = sqlite3.connect(db_path)
+    create_tables(conn)
+    texto = lambda k: " ".join(rnd.choices(RELLENO, k=k))  # noqa: E731
+    conn.executemany(
+        """
+        INSERT INTO leads (nombre, email, empresa, sector, fuente, mensaje_inicial, necesidades,
+                           etapa_funnel, temperatura, tipo_contacto, estado, creado_en, actualizado_en, email_norm)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'nuevo', ?, ?, ?)
+        """,
+        (
+            (
+                f"Lead {i}", f"lead{i}@ejemplo.com", f"Empresa {i % 500}",
+                rnd.choice(("ecommerce", "educacion", "salud", None)), rnd.choice(("Instagram Ads", "LinkedIn")),
+                texto(8), texto(4), rnd.choice(("awareness", "consideration", "decision")),
+                rnd.choice(("frio", "tibio", "caliente")), "lead",
+                f"2026-01-{1 + i % 28:02d}T10:{i % 60:02d}:00", f"2026-01-{1 + i % 28:02d}T10:{i % 60:02d}:00",
+                f"lead{i}@ejemplo.com",
+            )
+            for i in range(n_leads)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO interacciones (lead_id, canal, rol, mensaje, tipo, resultado, fecha) VALUES (1, ?, ?, ?, ?, ?, ?)",
+        (
+            (
+                rnd.choice(("email", "whatsapp")), rnd.choice(("agente", "lead")), texto(12),
+                "seguimiento", rnd.choice(("sin_respuesta", "respondio")), f"2026-02-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+            )
+            for i in range(n_interacciones)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def medir(cliente, response_cache, urls, repeticiones: int):
+    """Segundos, filas servidas y cuerpos de la primera pasada."""
+    cuerpos = []
+    filas = 0
+    t0 = time.perf_counter()
+    for vuelta in range(repeticiones):
+        for url in urls:
+            response_cache.invalidate_leads(())
+            r = cliente.get(url)
+            r.raise_for_status()
+            filas += r.content.count(b'"id":')
+            if vuelta == 0:
+                cuerpos.append(r.content)
+    return time.perf_counter() - t0, filas, cuerpos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=20000)
+    parser.add_argument("--interacciones", type=int, default=500, help="Interacciones del lead 1 (máx. 500 por página)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="leadflow-bench-")
+    shutil.copy(os.path.join(BACKEND, "models.sql"), directorio)
+    os.chdir(directorio)  # database.DB_PATH y models.sql son relativos
+    try:
+        poblar("leadflow.db", args.leads, args.interacciones)
+
+        from fastapi.testclient import TestClient
+        import main as api
+        from response_cache import response_cache
+
+        with TestClient(api.app) as cliente:
+            # Páginas de 1000 leads recorriendo el cursor, una vez, para fijar las URLs
+            urls_leads, cursor = [], None
+            while True:
+                url = "/leads?limit=1000" + (f"&cursor={cursor}" if cursor else "")
+                urls_leads.append(url)
+                cursor = cliente.get(url).headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+            urls_interacciones = [f"/leads/1/interacciones?limit={min(500, args.interacciones)}"] * 20
+
+            print(f"{args.leads} leads, {args.interacciones} interacciones, {args.repeticiones} repeticiones")
+            distintos = 0
+            for nombre, urls in (("list_leads", urls_leads), ("list_interacciones", urls_interacciones)):
+                resultados = {}
+                for rapido in (False, True):
+                    api.FAST_JSON = rapido
+                    medir(cliente, response_cache, urls[:2], 1)  # calentamiento
+                    resultados[rapido] = medir(cliente, response_cache, urls, args.repeticiones)
+                (t_normal, filas, c_normal), (t_rapido, _, c_rapido) = resultados[False], resultados[True]
+                iguales = c_normal == c_rapido
+                distintos += not iguales
+                print(f"{nombre:20s} normal : {filas / t_normal:12,.0f} filas/s")
+                print(f"{nombre:20s} rápido : {filas / t_rapido:12,.0f} filas/s  ({t_normal / t_rapido:.2f}x)"
+                      f"  {'✅ idénticos' if iguales else '❌ cuerpos distintos'}")
+    finally:
+        os.chdir(BACKEND)
+        shutil.rmtree(directorio, ignore_errors=True)
+    sys.exit(1 if distintos else 0)
+
+
+if __name__ == "__main__":
+    main()
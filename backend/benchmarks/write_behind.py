@@ -0,0 +1,156 @@
+"""
+Benchmark: registro de interacciones con el camino normal (un commit por
+petición) frente a la escritura diferida con commit agrupado
+(LEADFLOW_WRITE_BEHIND=1, ver write_behind.py).
+
+Dos medidas por modo:
+- http: el escenario `interacciones` de benchmarks/carga.py, cada modo en
+  su propio proceso (la configuración se lee al importar) y con la misma
+  BD sintética. En un solo proceso el techo suele ser la CPU de la pila
+  HTTP, no SQLite.
+- bd: --concurrencia hilos escribiendo directamente por cada camino
+  (main._guardar_interaccion frente a InteractionWriter), sin HTTP.
+
+Informa peticiones/s y latencias de cada modo y la aceleración. Las
+opciones tras `--` se pasan tal cual a carga.py.
+
+Uso (desde backend/):
+    python benchmarks/write_behind.py --concurrencia 64 --duracion 10
+    python benchmarks/write_behind.py --salida write_behind.json -- --leads 5000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from comun import escribir_informe, metadatos, resumen_latencias  # noqa: E402
+from datos import DOLORES, poblar  # noqa: E402
+
+CARGA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "carga.py")
+MODOS = (("directo", "0"), ("write_behind", "1"))
+
+
+def ejecutar(modo: str, valor: str, extra: List[str], entorno: Dict[str, str]) -> Dict:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        ruta = f.name
+    try:
+        subprocess.run(
+            [sys.executable, CARGA, "--escenarios", "interacciones", "--salida", ruta, *extra],
+            env={**entorno, "LEADFLOW_WRITE_BEHIND": valor},
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        with open(ruta, encoding="utf-8") as f:
+            informe = json.load(f)
+    finally:
+        os.unlink(ruta)
+    resultado = informe["escenarios"]["interacciones"]
+    print(f"http/{modo:13s} {resultado['total']}", file=sys.stderr)
+    return resultado
+
+
+def _hilos(escribir, n_leads: int, concurrencia: int, duracion: float) -> Dict:
+    latencias: List[List[float]] = [[] for _ in range(concurrencia)]
+    fin = time.perf_counter() + duracion
+
+    def cliente(i: int):
+        rnd = random.Random(i)
+        while time.perf_counter() < fin:
+            fila = (rnd.randint(1, n_leads), "whatsapp", "lead", rnd.choice(DOLORES), "seguimiento", "respondio",
+                    time.strftime("%Y-%m-%dT%H:%M:%S"))
+            t0 = time.perf_counter()
+            escribir(fila)
+            latencias[i].append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resumen_latencias([lat for lista in latencias for lat in lista], time.perf_counter() - t0)
+
+
+def almacenamiento(leads: int, concurrencia: int, duracion: float) -> Dict:
+    directorio = tempfile.mkdtemp(prefix="leadflow-write-behind-")
+    shutil.copy(os.path.join(BACKEND, "models.sql"), directorio)
+    os.chdir(directorio)  # database.DB_PATH y models.sql son relativos
+    try:
+        conn = sqlite3.connect("leadflow.db")
+        poblar(conn, leads, 0, 42)
+        conn.close()
+        import main as api
+        from write_behind import InteractionWriter
+
+        resultados = {"directo": _hilos(api._guardar_interaccion, leads, concurrencia, duracion)}
+        escritor = InteractionWriter(enabled=True)
+        escritor.start()
+        try:
+            resultados["write_behind"] = _hilos(lambda fila: escritor.submit(fila).result(), leads, concurrencia, duracion)
+            resultados["write_behind"]["escritor"] = escritor.stats()
+        finally:
+            escritor.stop()
+            api.pool.close()
+    finally:
+        os.chdir(BACKEND)
+        shutil.rmtree(directorio, ignore_errors=True)
+    for modo, resultado in resultados.items():
+        print(f"bd/{modo:13s} {resultado}", file=sys.stderr)
+    return resultados
+
+
+def _aceleracion(directo: Dict, diferido: Dict) -> Dict:
+    return {
+        "por_segundo": round(diferido["por_segundo"] / directo["por_segundo"], 2) if directo["por_segundo"] else None,
+        "p95": round(directo["p95_ms"] / diferido["p95_ms"], 2) if diferido["p95_ms"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, default=64, help="Clientes simultáneos")
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos por modo")
+    parser.add_argument("--leads", type=int, default=5000, help="Leads de la BD de la medida bd")
+    parser.add_argument("--salida", help="Guardar el informe JSON en este fichero")
+    parser.add_argument("extra", nargs="*", help="Opciones adicionales para carga.py (tras --)")
+    args = parser.parse_args()
+
+    extra = ["--concurrencia", str(args.concurrencia), "--duracion", str(args.duracion), *args.extra]
+    entorno = dict(os.environ)
+    http = {modo: ejecutar(modo, valor, extra, entorno) for modo, valor in MODOS}
+    bd = almacenamiento(args.leads, args.concurrencia, args.duracion)
+
+    informe = {
+        "meta": metadatos(
+            benchmark="write_behind",
+            concurrencia=args.concurrencia,
+            duracion_s=args.duracion,
+            extra=args.extra,
+            synchronous=os.getenv("LEADFLOW_DB_SYNCHRONOUS", "NORMAL"),
+        ),
+        "http": http,
+        "bd": bd,
+        "aceleracion": {
+            "http": _aceleracion(http["directo"]["total"], http["write_behind"]["total"]),
+            "bd": _aceleracion(bd["directo"], bd["write_behind"]),
+        },
+    }
+    escribir_informe(informe, args.salida)
+    errores = sum(sum(r["errores"].values()) for r in http.values())
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == "__main__":
+    main()
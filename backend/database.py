@@ -1,18 +1,331 @@
+import base64
+import json
+import os
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from observability import add_stage, stage_end, stage_start
+from profiling import SLOW_QUERY_TRACE, slow_query_log
 
 DB_PATH = "leadflow.db"
 
+# Configuración del pool (variables de entorno con valores por defecto)
+POOL_SIZE = int(os.getenv("LEADFLOW_DB_POOL_SIZE", "16"))
+POOL_TIMEOUT = float(os.getenv("LEADFLOW_DB_POOL_TIMEOUT", "10"))
+
+# PRAGMAs que se aplican una sola vez al abrir cada conexión del pool
+DB_PRAGMAS = {
+    "journal_mode": os.getenv("LEADFLOW_DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("LEADFLOW_DB_SYNCHRONOUS", "NORMAL"),
+    "cache_size": int(os.getenv("LEADFLOW_DB_CACHE_SIZE", "-32000")),  # negativo = KiB
+    "mmap_size": int(os.getenv("LEADFLOW_DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "foreign_keys": os.getenv("LEADFLOW_DB_FOREIGN_KEYS", "ON"),
+    "busy_timeout": int(os.getenv("LEADFLOW_DB_BUSY_TIMEOUT_MS", "5000")),
+}
+
+# Columnas de la tabla leads que se exponen en la API (proyección con fields=)
+LEAD_COLUMNS = (
+    "id", "nombre", "email", "empresa", "sector", "fuente",
+    "mensaje_inicial", "necesidades",
+    "etapa_funnel", "temperatura", "tipo_contacto", "estado", "creado_en", "actualizado_en", "version",
+    "ultima_interaccion_en", "ultimo_resultado",
+)
+
+# Columnas de leads por las que se puede filtrar en listados y operaciones masivas
+LEAD_FILTER_COLUMNS = ("etapa_funnel", "temperatura", "tipo_contacto", "estado", "sector", "fuente")
+
+
+class PoolTimeout(RuntimeError):
+    """No hubo ninguna conexión libre dentro del tiempo de espera del pool."""
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor que mide cada sentencia (execute/executemany y sus fetch*): suma
+    el tiempo a la etapa "db" de la petición en curso (observability) y, si
+    en total pasa del umbral, la guarda en el log de consultas lentas
+    (profiling).
+    """
+
+    _sentencia: Optional[Tuple] = None  # (sql, parámetros, executemany)
+    _acumulado = 0.0
+    _lenta: Optional[Dict] = None  # entrada del log a la que sumar los fetch siguientes
+
+    def _registrar_lenta(self) -> None:
+        sql, parametros, muchas = self._sentencia
+        self._lenta = slow_query_log.record(
+            self.connection, sql, parametros, self._acumulado, muchas, self.connection.traza
+        )
+
+    def _ejecutada(self, inicio: float, sql: str, parametros, muchas: bool) -> None:
+        segundos = time.perf_counter() - inicio
+        add_stage("db", segundos)
+        self._sentencia = (sql, parametros, muchas)
+        self._acumulado = segundos
+        self._lenta = None
+        if segundos >= slow_query_log.umbral:
+            self._registrar_lenta()
+
+    def _leida(self, inicio: float) -> None:
+        segundos = time.perf_counter() - inicio
+        add_stage("db", segundos)
+        if self._lenta is not None:
+            slow_query_log.add_time(self._lenta, segundos)
+        elif self._sentencia is not None:
+            self._acumulado += segundos
+            if self._acumulado >= slow_query_log.umbral:
+                self._registrar_lenta()
+
+    def execute(self, sql, parameters=()):
+        if self.connection.traza is not None:
+            self.connection.traza.clear()
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._ejecutada(inicio, sql, parameters, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.connection.traza is not None:
+            self.connection.traza.clear()
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._ejecutada(inicio, sql, seq_of_parameters, True)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._leida(inicio)
+
+    def fetchmany(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            self._leida(inicio)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._leida(inicio)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Conexión del pool con los ganchos de tiempo: todos sus cursores son
+    TimedCursor y commit también cuenta como "db". Iterar un cursor fila a
+    fila (exportaciones en streaming) no se mide.
+    """
+
+    # Sentencias que SQLite ejecuta por cada execute (LEADFLOW_SLOW_QUERY_TRACE=1)
+    traza: Optional[List[str]] = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute* crean el cursor en C sin pasar por cursor()
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        inicio = stage_start()
+        try:
+            super().commit()
+        finally:
+            stage_end("db", inicio)
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones SQLite reutilizables.
+
+    Las conexiones se abren bajo demanda hasta `size`, se configuran una vez
+    con los PRAGMAs y se devuelven al pool al terminar cada petición. Solo
+    una petición usa cada conexión a la vez, pero puede pasar de un hilo del
+    threadpool de FastAPI a otro, por eso se abren con check_same_thread=False.
+    Las libres se guardan en una pila (LIFO) para reutilizar primero la que
+    tiene la caché de páginas más caliente.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT, pragmas: Optional[Dict] = None):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(DB_PRAGMAS if pragmas is None else pragmas)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            "creadas": 0,
+            "checkouts": 0,
+            "esperas": 0,
+            "timeouts": 0,
+            "descartadas": 0,
+            "en_uso": 0,
+            "espera_total_s": 0.0,
+            "espera_max_s": 0.0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        if SLOW_QUERY_TRACE:
+            conn.traza = []
+            conn.set_trace_callback(conn.traza.append)
+        for nombre, valor in self.pragmas.items():
+            conn.execute(f"PRAGMA {nombre} = {valor}")
+        with self._lock:
+            self._stats["creadas"] += 1
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        inicio = time.perf_counter()
+        esperada = not self._slots.acquire(blocking=False)
+        if esperada and not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["esperas"] += 1
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"Sin conexiones libres tras {self.timeout}s (pool de {self.size})")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        espera = time.perf_counter() - inicio
+        add_stage("conexion", espera)
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["en_uso"] += 1
+            self._stats["esperas"] += int(esperada)
+            self._stats["espera_total_s"] += espera
+            self._stats["espera_max_s"] = max(self._stats["espera_max_s"], espera)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        reutilizable = not self._closed
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            reutilizable = False
+        if reutilizable:
+            self._idle.put(conn)
+        else:
+            conn.close()
+        with self._lock:
+            self._stats["en_uso"] -= 1
+            self._stats["descartadas"] += int(not reutilizable and not self._closed)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            datos = dict(self._stats)
+        checkouts = datos["checkouts"] or 1
+        datos.update(
+            {
+                "tamano": self.size,
+                "libres": self._idle.qsize(),
+                "espera_media_ms": round(datos.pop("espera_total_s") / checkouts * 1000, 4),
+                "espera_max_ms": round(datos.pop("espera_max_s") * 1000, 4),
+            }
+        )
+        return datos
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+pool = ConnectionPool(DB_PATH)
+
+
 def get_db():
     """
     Dependencia para FastAPI.
-    Abre una conexión a SQLite, la cede con yield y luego la cierra.
+    Toma una conexión del pool, la cede con yield y luego la devuelve
+    (deshaciendo cualquier transacción que haya quedado abierta).
     """
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
+    with pool.connection() as conn:
         yield conn
-    finally:
-        conn.close()
+
 
 def row_to_dict(row):
     return dict(row) if row is not None else None
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Clave de deduplicación de leads: email sin espacios y en minúsculas."""
+    if not email:
+        return None
+    return email.strip().lower() or None
+
+
+def build_lead_filter(
+    filtros: Dict[str, Optional[str]],
+    ids: Optional[Sequence[int]] = None,
+    solo_sin_segmentar: bool = False,
+) -> Tuple[str, List]:
+    """
+    Construye la parte WHERE (sin la palabra WHERE) para filtrar leads.
+    Solo acepta columnas de LEAD_FILTER_COLUMNS; devuelve (condiciones, parámetros).
+    Las listas de ids se pasan como un único parámetro JSON para no chocar
+    con el límite de variables de SQLite.
+    """
+    condiciones = []
+    params: List = []
+    for columna in LEAD_FILTER_COLUMNS:
+        valor = filtros.get(columna)
+        if valor is not None:
+            condiciones.append(f"{columna} = ?")
+            params.append(valor)
+    if ids is not None:
+        condiciones.append("id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(ids)))
+    if solo_sin_segmentar:
+        condiciones.append("etapa_funnel IS NULL")
+    return " AND ".join(condiciones) or "1 = 1", params
+
+
+def encode_cursor(*valores) -> str:
+    """Cursor opaco para paginación por clave (keyset) a partir de los valores de la última fila."""
+    return base64.urlsafe_b64encode(json.dumps(valores).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, n_valores: int) -> List:
+    """Inverso de encode_cursor; lanza ValueError si el cursor no es válido."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError("Cursor inválido") from exc
+    if not isinstance(valores, list) or len(valores) != n_valores:
+        raise ValueError("Cursor inválido")
+    return valores
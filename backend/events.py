@@ -0,0 +1,176 @@
+"""
+Eventos de cambios en leads e interacciones para GET /events (SSE).
+
+Los endpoints de escritura publican eventos compactos después del commit.
+Se guardan en un buffer circular en memoria con ids crecientes, de modo que
+un cliente que se reconecta (Last-Event-ID o ?since=) recibe lo que se
+perdió sin volver a descargar el listado. Si su id ya salió del buffer, o
+es de otro arranque de la API, recibe un evento "reset" y recarga.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+EVENTS_BUFFER_SIZE = int(os.getenv("LEADFLOW_EVENTS_BUFFER", "10000"))
+# Cada stream se cierra tras este tiempo; EventSource se reconecta solo con
+# Last-Event-ID, así que no se pierden eventos y un apagado no espera para siempre
+EVENTS_MAX_STREAM_SECONDS = float(os.getenv("LEADFLOW_EVENTS_MAX_STREAM_SECONDS", "300"))
+EVENTS_HEARTBEAT_SECONDS = 15.0
+
+# Campos de lead que se envían en lead.creado / lead.actualizado (sin textos largos de necesidades)
+LEAD_EVENT_FIELDS = (
+    "id", "nombre", "empresa", "sector", "fuente", "mensaje_inicial",
+    "etapa_funnel", "temperatura", "tipo_contacto", "estado", "actualizado_en", "version",
+)
+SEGMENTATION_EVENT_FIELDS = ("etapa_funnel", "temperatura", "tipo_contacto")
+
+
+def lead_event_data(lead: Dict) -> Dict:
+    return {c: lead.get(c) for c in LEAD_EVENT_FIELDS}
+
+
+def interaccion_event_data(interaccion: Dict) -> Dict:
+    # Sin el texto del mensaje: el panel solo necesita saber que hubo actividad
+    return {c: interaccion.get(c) for c in ("id", "lead_id", "canal", "rol", "tipo", "resultado", "fecha")}
+
+
+class EventBus:
+    def __init__(self, size: int = EVENTS_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._buffer: deque = deque(maxlen=size)   # (id, línea SSE ya formateada)
+        # Ids basados en el reloj de arranque: los de un arranque posterior son
+        # siempre mayores, así que un Last-Event-ID antiguo nunca se confunde
+        self._ultimo_id = time.time_ns() // 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._aviso: Optional[asyncio.Event] = None
+        self._publicados = 0
+        self._suscriptores = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._aviso = asyncio.Event()
+
+    def publish(self, tipo: str, datos: Dict) -> int:
+        """Publica un evento; se puede llamar desde el event loop o desde un hilo."""
+        with self._lock:
+            self._ultimo_id += 1
+            evento_id = self._ultimo_id
+            cuerpo = json.dumps({"id": evento_id, "tipo": tipo, **datos}, ensure_ascii=False, separators=(",", ":"))
+            self._buffer.append((evento_id, f"id: {evento_id}\nevent: {tipo}\ndata: {cuerpo}\n\n"))
+            self._publicados += 1
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._despertar)
+            except RuntimeError:
+                pass  # el loop ya se cerró (apagado)
+        return evento_id
+
+    def _despertar(self) -> None:
+        # Un Event por "generación": los que esperaban despiertan y los nuevos esperan al siguiente
+        aviso, self._aviso = self._aviso, asyncio.Event()
+        aviso.set()
+
+    def since(self, desde: int) -> Tuple[Optional[List[Tuple[int, str]]], int]:
+        """
+        Eventos con id > desde y el último id. Devuelve None en lugar de la
+        lista si `desde` ya no está cubierto por el buffer (hay que recargar).
+        """
+        with self._lock:
+            ultimo = self._ultimo_id
+            if desde == ultimo:
+                return [], ultimo
+            primero = self._buffer[0][0] if self._buffer else ultimo + 1
+            if desde > ultimo or desde < primero - 1:
+                return None, ultimo
+            # Los ids del buffer son consecutivos: se salta directamente a la posición
+            return list(islice(self._buffer, desde - primero + 1, None)), ultimo
+
+    @property
+    def last_id(self) -> int:
+        return self._ultimo_id
+
+    def signal(self) -> asyncio.Event:
+        """
+        Aviso que se activará con el próximo publish. Hay que tomarlo antes
+        de since(): un evento publicado después de leer ya no se pierde
+        aunque _despertar cambie de aviso antes de que se espere.
+        """
+        return self._aviso
+
+    async def wait(self, timeout: float, aviso: Optional[asyncio.Event] = None) -> None:
+        aviso = aviso or self._aviso
+        try:
+            await asyncio.wait_for(aviso.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def subscribe(self) -> None:
+        with self._lock:
+            self._suscriptores += 1
+
+    def unsubscribe(self) -> None:
+        with self._lock:
+            self._suscriptores -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "publicados": self._publicados,
+            "en_buffer": len(self._buffer),
+            "tamano_buffer": self._buffer.maxlen,
+            "ultimo_id": self._ultimo_id,
+            "suscriptores": self._suscriptores,
+        }
+
+
+event_bus = EventBus()
+
+
+def publish_segmentations(resultados: Iterable[Tuple[int, Dict]]) -> None:
+    """lead.segmentado para un lead; leads.segmentados (un solo evento) para un bloque."""
+    leads = [
+        {"id": lead_id, **{c: seg.get(c) for c in SEGMENTATION_EVENT_FIELDS}}
+        for lead_id, seg in resultados
+    ]
+    if len(leads) == 1:
+        event_bus.publish("lead.segmentado", {"lead_id": leads[0]["id"], "lead": leads[0]})
+    elif leads:
+        event_bus.publish("leads.segmentados", {"leads": leads})
+
+
+async def sse_stream(request, desde: Optional[int]):
+    """
+    Generador para StreamingResponse: repite lo posterior a `desde` y luego
+    emite los eventos nuevos, con un comentario de latido cada
+    EVENTS_HEARTBEAT_SECONDS para que los proxies no corten la conexión.
+    """
+    bus = event_bus
+    bus.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        if desde is None:
+            desde = bus.last_id
+        fin = time.monotonic() + EVENTS_MAX_STREAM_SECONDS
+        while time.monotonic() < fin:
+            aviso = bus.signal()
+            eventos, ultimo = bus.since(desde)
+            if eventos is None:
+                # El cliente se quedó atrás (o viene de otro arranque): que recargue
+                yield f"id: {ultimo}\nevent: reset\ndata: {{\"id\": {ultimo}, \"tipo\": \"reset\"}}\n\n"
+                desde = ultimo
+                continue
+            if eventos:
+                yield "".join(linea for _, linea in eventos)
+                desde = eventos[-1][0]
+                continue
+            if await request.is_disconnected():
+                return
+            await bus.wait(min(EVENTS_HEARTBEAT_SECONDS, max(0.0, fin - time.monotonic())), aviso)
+            if bus.last_id == desde:
+                yield ": ping\n\n"
+    finally:
+        bus.unsubscribe()
@@ -0,0 +1,74 @@
+"""
+Exportación en streaming de tablas completas (NDJSON / CSV).
+
+Cada exportación abre su propia conexión del pool durante toda la respuesta
+(la de get_db se devuelve antes de que termine el streaming) y lee con
+fetchmany en bloques de tamaño fijo, así que la memoria no depende del
+tamaño de la tabla. Se exportan las mismas columnas que devuelve la API
+(nunca SELECT *: las internas como email_norm o prioridad no salen).
+"""
+import csv
+import io
+import json
+from typing import Iterator, Optional, Sequence
+
+from database import pool
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Tablas exportables y su columna de marca de agua
+EXPORT_TABLES = {
+    "leads": "actualizado_en",
+    "interacciones": "fecha",
+}
+
+
+def iter_export(
+    tabla: str,
+    columna_marca: str,
+    columnas: Sequence[str],
+    formato: str,
+    updated_since: Optional[str],
+    batch_size: int,
+) -> Iterator[str]:
+    """
+    Genera el contenido de la exportación bloque a bloque, con `columnas`
+    en ese orden. `updated_since` es inclusivo (>=): quien importa debe
+    deduplicar por id.
+    """
+    if EXPORT_TABLES.get(tabla) != columna_marca:
+        raise ValueError(f"Tabla no exportable: {tabla}")
+
+    where = f"WHERE {columna_marca} >= ?" if updated_since else ""
+    params = [updated_since] if updated_since else []
+
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None  # tuplas: evitamos crear un sqlite3.Row por fila
+        cur.execute(f"SELECT {', '.join(columnas)} FROM {tabla} {where} ORDER BY {columna_marca}, id", params)
+
+        if formato == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columnas)
+            while True:
+                filas = cur.fetchmany(batch_size)
+                if not filas:
+                    break
+                writer.writerows(filas)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            while True:
+                filas = cur.fetchmany(batch_size)
+                if not filas:
+                    break
+                yield "".join(
+                    json.dumps(dict(zip(columnas, fila)), ensure_ascii=False) + "\n" for fila in filas
+                )
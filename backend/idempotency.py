@@ -0,0 +1,90 @@
+"""
+Respuestas guardadas por cabecera Idempotency-Key.
+
+Un reintento con la misma clave sobre la misma ruta devuelve la respuesta
+original sin volver a escribir nada. En POST /leads la respuesta se guarda
+en la misma transacción que la escritura que la produjo.
+
+POST /leads/bulk escribe en varias transacciones (una por bloque): la clave
+se reserva en estado EN_CURSO dentro de la transacción del primer bloque que
+se guarda y la respuesta se completa al terminar. Una petición duplicada
+simultánea no puede reservarla y recibe 409 sin haber escrito nada.
+"""
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+# Horas que se conserva una clave antes de poder reutilizarse
+IDEMPOTENCY_TTL_HOURS = 24
+
+# estado_http de una clave reservada cuya petición todavía no ha terminado
+EN_CURSO = 0
+
+
+class IdempotencyKeyInUse(Exception):
+    """La clave ya está reservada o usada; `respuesta` es lo que hay que devolver."""
+
+    def __init__(self, respuesta: JSONResponse):
+        super().__init__("Idempotency-Key en uso")
+        self.respuesta = respuesta
+
+
+def get_saved_response(db: sqlite3.Connection, ruta: str, clave: str) -> Optional[JSONResponse]:
+    fila = db.execute(
+        "SELECT estado_http, respuesta FROM idempotencia WHERE ruta = ? AND clave = ? AND creado_en >= ?",
+        (ruta, clave, _limite_ttl()),
+    ).fetchone()
+    if fila is None:
+        return None
+    if fila["estado_http"] == EN_CURSO:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Hay una petición con esta Idempotency-Key en curso"},
+        )
+    return JSONResponse(
+        status_code=fila["estado_http"],
+        content=json.loads(fila["respuesta"]),
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def reserve_key(db: sqlite3.Connection, ruta: str, clave: str) -> None:
+    """
+    Reserva la clave en estado EN_CURSO (sin commit; debe llamarse dentro de
+    una transacción de escritura). Si ya existe lanza IdempotencyKeyInUse con
+    la respuesta guardada o el 409 de "en curso".
+    """
+    db.execute("DELETE FROM idempotencia WHERE creado_en < ?", (_limite_ttl(),))
+    cur = db.execute(
+        """
+        INSERT OR IGNORE INTO idempotencia (ruta, clave, estado_http, respuesta, creado_en)
+        VALUES (?, ?, ?, 'null', ?)
+        """,
+        (ruta, clave, EN_CURSO, datetime.now().isoformat(timespec="seconds")),
+    )
+    if cur.rowcount == 0:
+        raise IdempotencyKeyInUse(get_saved_response(db, ruta, clave))
+
+
+def release_key(db: sqlite3.Connection, ruta: str, clave: str) -> None:
+    """Libera (sin commit) una clave que quedó EN_CURSO porque la petición falló."""
+    db.execute("DELETE FROM idempotencia WHERE ruta = ? AND clave = ? AND estado_http = ?", (ruta, clave, EN_CURSO))
+
+
+def save_response(db: sqlite3.Connection, ruta: str, clave: str, estado_http: int, cuerpo: Dict) -> None:
+    """Guarda la respuesta (sin commit), completando la reserva si la hay, y purga las claves caducadas."""
+    db.execute("DELETE FROM idempotencia WHERE creado_en < ?", (_limite_ttl(),))
+    db.execute(
+        """
+        INSERT OR REPLACE INTO idempotencia (ruta, clave, estado_http, respuesta, creado_en)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (ruta, clave, estado_http, json.dumps(cuerpo, ensure_ascii=False), datetime.now().isoformat(timespec="seconds")),
+    )
+
+
+def _limite_ttl() -> str:
+    return (datetime.now() - timedelta(hours=IDEMPOTENCY_TTL_HOURS)).isoformat(timespec="seconds")
@@ -1,8 +1,64 @@
 import sqlite3
 from datetime import datetime
 
+from batch import refresh_priorities
+from database import normalize_email
+from metrics import rebuild_metrics
+from search import rebuild_search_index
+
 DB_PATH = "leadflow.db"
 
+def _rellenar_email_norm(conn):
+    """
+    Normaliza los emails existentes. Si había duplicados, solo el lead más
+    antiguo recibe la clave (el resto queda con NULL) para que el índice
+    único se pueda crear sin borrar datos.
+    """
+    vistos = set()
+    cambios = []
+    for lead_id, email in conn.execute("SELECT id, email FROM leads WHERE email IS NOT NULL ORDER BY id"):
+        norma = normalize_email(email)
+        if norma and norma not in vistos:
+            vistos.add(norma)
+            cambios.append((norma, lead_id))
+    conn.executemany("UPDATE leads SET email_norm = ? WHERE id = ?", cambios)
+
+
+# Columnas añadidas después de la primera versión de models.sql.
+# (tabla, columna, definición, relleno para las filas existentes o None)
+# El relleno (SQL o función que recibe la conexión) se ejecuta después de
+# models.sql, cuando ya existen índices y triggers.
+NEW_COLUMNS = [
+    ("leads", "actualizado_en", "TEXT", "UPDATE leads SET actualizado_en = creado_en WHERE actualizado_en IS NULL"),
+    ("leads", "email_norm", "TEXT", _rellenar_email_norm),
+    ("leads", "version", "INTEGER NOT NULL DEFAULT 1", None),
+    # Última interacción de cada lead (desde entonces la mantiene un trigger)
+    (
+        "leads",
+        "ultima_interaccion_en",
+        "TEXT",
+        """
+        UPDATE leads SET (ultima_interaccion_en, ultimo_resultado) = (
+            SELECT fecha, resultado FROM interacciones i
+            WHERE i.lead_id = leads.id AND i.fecha IS NOT NULL
+            ORDER BY fecha DESC, id DESC LIMIT 1
+        ), version = version + 1, actualizado_en = strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')
+        WHERE id IN (SELECT lead_id FROM interacciones WHERE fecha IS NOT NULL)
+        """,
+    ),
+    ("leads", "ultimo_resultado", "TEXT", None),
+    # Puntuación de GET /leads/next; se calcula con la vista de models.sql
+    ("leads", "prioridad", "REAL", refresh_priorities),
+]
+
+# Tablas derivadas de leads/interacciones: si la BD es anterior a ellas,
+# se calculan desde cero tras crearlas (cada función rellena su grupo de
+# tablas: métricas, índices de búsqueda).
+DERIVED_TABLES = [
+    ("metricas_leads", rebuild_metrics),
+    ("leads_fts", rebuild_search_index),
+]
+
 
 def create_tables(conn):
     with open("models.sql", "r", encoding="utf-8") as f:
@@ -11,6 +67,45 @@ def create_tables(conn):
     conn.commit()
 
 
+def _quitar_prioridad_generada(conn):
+    """
+    La primera versión de leads.prioridad era una columna generada; se borra
+    (con su índice) para que NEW_COLUMNS la vuelva a crear como columna normal.
+    """
+    generadas = {fila[1] for fila in conn.execute("PRAGMA table_xinfo(leads)") if fila[6] in (2, 3)}
+    if "prioridad" in generadas:
+        conn.execute("DROP INDEX IF EXISTS idx_leads_prioridad")
+        conn.execute("ALTER TABLE leads DROP COLUMN prioridad")
+
+
+def ensure_schema(conn):
+    """
+    Pone al día una BD existente: añade las columnas de NEW_COLUMNS que
+    falten y aplica models.sql (todo es IF NOT EXISTS, así que es idempotente).
+    En una BD nueva equivale a create_tables.
+    """
+    _quitar_prioridad_generada(conn)
+    rellenos = []
+    for tabla, columna, definicion, relleno in NEW_COLUMNS:
+        existentes = {fila[1] for fila in conn.execute(f"PRAGMA table_xinfo({tabla})")}  # xinfo: incluye columnas generadas
+        if existentes and columna not in existentes:
+            conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+            if relleno:
+                rellenos.append(relleno)
+    tablas = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    derivadas = [reconstruir for tabla, reconstruir in DERIVED_TABLES if "leads" in tablas and tabla not in tablas]
+    conn.commit()
+    create_tables(conn)
+    for relleno in rellenos:
+        if callable(relleno):
+            relleno(conn)
+        else:
+            conn.execute(relleno)
+    conn.commit()
+    for reconstruir in derivadas:
+        reconstruir(conn)
+
+
 def seed_data(conn):
     ahora = datetime.now().isoformat(timespec="seconds")
 
@@ -112,18 +207,33 @@ def seed_data(conn):
         INSERT INTO leads (
             nombre, email, empresa, sector, fuente,
             mensaje_inicial, necesidades,
-            etapa_funnel, temperatura, tipo_contacto, estado, creado_en
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            etapa_funnel, temperatura, tipo_contacto, estado, creado_en, actualizado_en, email_norm
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
-        leads,
+        [lead + (ahora, normalize_email(lead[1])) for lead in leads],
     )
 
     conn.commit()
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crea o migra la base de datos de Lead Flow AI")
+    parser.add_argument(
+        "--migrar",
+        action="store_true",
+        help="Solo actualiza el esquema de una BD existente (columnas, índices, tablas), sin datos de ejemplo",
+    )
+    args = parser.parse_args()
+
     conn = sqlite3.connect(DB_PATH)
-    create_tables(conn)
-    seed_data(conn)
-    conn.close()
-    print("✅ Base de datos creada y poblada: leadflow.db")
+    if args.migrar:
+        ensure_schema(conn)
+        conn.close()
+        print("✅ Esquema actualizado: leadflow.db")
+    else:
+        create_tables(conn)
+        seed_data(conn)
+        conn.close()
+        print("✅ Base de datos creada y poblada: leadflow.db")
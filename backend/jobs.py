@@ -0,0 +1,153 @@
+"""
+Cola persistente de trabajos en segundo plano (tabla jobs).
+
+La API encola con create_job y worker.py los reclama con claim_job. Un
+trabajo en_curso cuyo worker deja de dar señales (latido_en) durante más
+de JOB_LEASE_SECONDS se considera caído y otro worker lo retoma desde su
+checkpoint (ultimo_id). Los trabajos periódicos (el recálculo de
+prioridades) los encola el propio worker con enqueue_periodic_job.
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+JOB_TYPES = ("segmentar", "mensajes", "prioridad")
+
+# Segundos sin latido tras los que un trabajo en_curso se puede reclamar
+JOB_LEASE_SECONDS = int(os.getenv("LEADFLOW_JOB_LEASE_SECONDS", "60"))
+
+# Segundos entre dos recálculos de leads.prioridad que encola worker.py (0 = nunca)
+PRIORITY_REFRESH_SECONDS = int(os.getenv("LEADFLOW_PRIORIDAD_INTERVALO", "3600"))
+
+
+def _ahora() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def create_job(db: sqlite3.Connection, tipo: str, parametros: Dict) -> int:
+    """Encola un trabajo pendiente. No hace commit."""
+    cur = db.execute(
+        "INSERT INTO jobs (tipo, parametros, estado, creado_en) VALUES (?, ?, 'pendiente', ?)",
+        (tipo, json.dumps(parametros, ensure_ascii=False), _ahora()),
+    )
+    return cur.lastrowid
+
+
+def job_to_dict(fila: sqlite3.Row) -> Dict:
+    job = dict(fila)
+    job["parametros"] = json.loads(job["parametros"])
+    job["leads_por_segundo"] = round(job["procesados"] / job["segundos"], 1) if job["segundos"] else 0.0
+    job["progreso"] = (
+        round(min(job["procesados"] / job["total"], 1.0), 4)
+        if job["total"]
+        else (1.0 if job["estado"] == "completado" else None)
+    )
+    return job
+
+
+def get_job(db: sqlite3.Connection, job_id: int) -> Optional[Dict]:
+    fila = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return job_to_dict(fila) if fila else None
+
+
+def claim_job(db: sqlite3.Connection, worker: str, lease_seconds: int = JOB_LEASE_SECONDS) -> Optional[Dict]:
+    """
+    Reclama el trabajo más antiguo pendiente (o en_curso con el latido
+    caducado) para `worker`, dentro de una transacción IMMEDIATE para que
+    dos workers no se lleven el mismo.
+    """
+    caducado = (datetime.now() - timedelta(seconds=lease_seconds)).isoformat(timespec="seconds")
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        fila = db.execute(
+            """
+            SELECT * FROM jobs
+            WHERE estado = 'pendiente' OR (estado = 'en_curso' AND latido_en < ?)
+            ORDER BY id LIMIT 1
+            """,
+            (caducado,),
+        ).fetchone()
+        if fila is None:
+            db.commit()
+            return None
+        ahora = _ahora()
+        db.execute(
+            """
+            UPDATE jobs
+            SET estado = 'en_curso', worker = ?, latido_en = ?, iniciado_en = COALESCE(iniciado_en, ?)
+            WHERE id = ?
+            """,
+            (worker, ahora, ahora, fila["id"]),
+        )
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return get_job(db, fila["id"])
+
+
+def enqueue_periodic_job(db: sqlite3.Connection, tipo: str, parametros: Dict, intervalo: int) -> Optional[int]:
+    """
+    Encola un trabajo `tipo` si no hay otro pendiente o en curso y el último
+    se creó hace más de `intervalo` segundos. Transacción IMMEDIATE para que
+    varios workers no lo encolen a la vez. Devuelve su id o None.
+    """
+    limite = (datetime.now() - timedelta(seconds=intervalo)).isoformat(timespec="seconds")
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        reciente = db.execute(
+            """
+            SELECT 1 FROM jobs
+            WHERE tipo = ? AND (estado IN ('pendiente', 'en_curso') OR creado_en > ?)
+            LIMIT 1
+            """,
+            (tipo, limite),
+        ).fetchone()
+        job_id = None if reciente else create_job(db, tipo, parametros)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return job_id
+
+
+def set_total(db: sqlite3.Connection, job_id: int, total: int) -> None:
+    db.execute("UPDATE jobs SET total = ? WHERE id = ? AND total IS NULL", (total, job_id))
+    db.commit()
+
+
+def checkpoint(
+    db: sqlite3.Connection,
+    job_id: int,
+    worker: str,
+    ultimo_id: int,
+    procesados: int,
+    segundos: float,
+) -> bool:
+    """
+    Avanza el checkpoint dentro de la transacción abierta por el llamante,
+    junto con los resultados del bloque. Devuelve False si el trabajo ya no
+    pertenece a este worker (otro lo reclamó): el llamante debe deshacer.
+    """
+    cur = db.execute(
+        """
+        UPDATE jobs
+        SET ultimo_id = ?, procesados = procesados + ?, segundos = segundos + ?, latido_en = ?
+        WHERE id = ? AND worker = ? AND estado = 'en_curso'
+        """,
+        (ultimo_id, procesados, segundos, _ahora(), job_id, worker),
+    )
+    return cur.rowcount == 1
+
+
+def finish_job(db: sqlite3.Connection, job_id: int, worker: str, error: Optional[str] = None) -> None:
+    db.execute(
+        """
+        UPDATE jobs SET estado = ?, error = ?, terminado_en = ?, latido_en = ?
+        WHERE id = ? AND worker = ?
+        """,
+        ("error" if error else "completado", error, _ahora(), _ahora(), job_id, worker),
+    )
+    db.commit()
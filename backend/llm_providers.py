@@ -0,0 +1,286 @@
+"""
+Proveedores de LLM intercambiables para segmentación y generación de mensajes.
+
+- RuleBasedProvider: el motor de reglas actual de llm_service (sin red).
+- HTTPLLMProvider: cliente asyncio de un servicio LLM por HTTP
+  (ver mock_llm_server.py para un sustituto local con latencia simulada).
+- ResilientProvider: envuelve a otro proveedor con límite de concurrencia,
+  agrupación de peticiones idénticas en vuelo, timeout, reintentos con
+  backoff y, si todo falla, vuelta al motor de reglas.
+
+El proveedor activo se elige con variables de entorno (build_provider_from_env).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+from observability import timed_stage
+from llm_service import (
+    SEGMENTATION_FIELDS,
+    SEGMENTATION_VERSION,
+    generate_next_message_with_llm,
+    segment_lead_with_llm,
+    segment_leads,
+)
+
+LLM_BACKEND = os.getenv("LEADFLOW_LLM_BACKEND", "reglas")  # reglas / http
+LLM_URL = os.getenv("LEADFLOW_LLM_URL", "http://127.0.0.1:8100")
+LLM_MODEL = os.getenv("LEADFLOW_LLM_MODEL") or None  # identifica el modelo en la caché de segmentación
+LLM_CONCURRENCY = int(os.getenv("LEADFLOW_LLM_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.getenv("LEADFLOW_LLM_TIMEOUT", "10"))
+LLM_RETRIES = int(os.getenv("LEADFLOW_LLM_RETRIES", "2"))
+LLM_BACKOFF = float(os.getenv("LEADFLOW_LLM_BACKOFF", "0.2"))
+LLM_BATCH_SIZE = int(os.getenv("LEADFLOW_LLM_BATCH_SIZE", "32"))
+
+
+class LLMProvider:
+    """Interfaz común. Las implementaciones solo necesitan segment y generate_message."""
+
+    name = "base"
+    # Parte de la clave de la caché de segmentación: resultados de distintos
+    # proveedores o modelos nunca se mezclan
+    version = "base"
+
+    async def segment(self, lead: Dict) -> Dict:
+        raise NotImplementedError
+
+    async def segment_many(self, leads: List[Dict]) -> List[Dict]:
+        return list(await asyncio.gather(*(self.segment(lead) for lead in leads)))
+
+    async def segment_many_with_fallback(self, leads: List[Dict]) -> Tuple[List[Dict], List[bool]]:
+        """Como segment_many, y para cada lead si el resultado viene de un proveedor de respaldo."""
+        return await self.segment_many(leads), [False] * len(leads)
+
+    async def generate_message(
+        self, lead: Dict, last_interactions: List[Dict], canal: str, objetivo: str, tono: str
+    ) -> Dict:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"proveedor": self.name, "version": self.version}
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RuleBasedProvider(LLMProvider):
+    """Motor de reglas local: microsegundos por lead, sin E/S."""
+
+    name = "reglas"
+    version = SEGMENTATION_VERSION
+
+    async def segment(self, lead: Dict) -> Dict:
+        return segment_lead_with_llm(lead)
+
+    async def segment_many(self, leads: List[Dict]) -> List[Dict]:
+        return segment_leads(leads)
+
+    async def generate_message(self, lead, last_interactions, canal, objetivo, tono) -> Dict:
+        return generate_next_message_with_llm(
+            lead=lead, last_interactions=last_interactions, canal=canal, objetivo=objetivo, tono=tono
+        )
+
+
+class HTTPLLMProvider(LLMProvider):
+    """
+    Cliente de un servicio LLM por HTTP (JSON):
+    POST /v1/segment {"lead"}, POST /v1/segment/batch {"leads"} y
+    POST /v1/message {"lead", "last_interactions", "canal", "objetivo", "tono"}.
+    """
+
+    name = "http"
+
+    def __init__(self, base_url: str = LLM_URL, timeout: float = LLM_TIMEOUT, model: Optional[str] = LLM_MODEL):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # Sin LEADFLOW_LLM_MODEL, el servicio se identifica por su URL
+        self.version = f"http:{model or self.base_url}"
+        self._client = None
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        return self._client
+
+    @timed_stage("llm")
+    async def _post(self, ruta: str, cuerpo: Dict) -> Dict:
+        respuesta = await self._http().post(ruta, json=cuerpo)
+        respuesta.raise_for_status()
+        return respuesta.json()
+
+    async def segment(self, lead: Dict) -> Dict:
+        return await self._post("/v1/segment", {"lead": _solo_entrada(lead)})
+
+    async def segment_many(self, leads: List[Dict]) -> List[Dict]:
+        datos = await self._post("/v1/segment/batch", {"leads": [_solo_entrada(lead) for lead in leads]})
+        return datos["resultados"]
+
+    async def generate_message(self, lead, last_interactions, canal, objetivo, tono) -> Dict:
+        return await self._post(
+            "/v1/message",
+            {
+                "lead": lead,
+                "last_interactions": last_interactions,
+                "canal": canal,
+                "objetivo": objetivo,
+                "tono": tono,
+            },
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class ResilientProvider(LLMProvider):
+    """
+    Protege a un proveedor lento o poco fiable:
+    - semáforo con como mucho `concurrency` llamadas a la vez;
+    - las peticiones idénticas en vuelo comparten una única llamada;
+    - timeout por intento y `retries` reintentos con backoff exponencial y jitter;
+    - si se agotan los reintentos, responde el motor de reglas (`fallback`).
+    segment_many parte la lista en lotes de `batch_size` para el proveedor;
+    segment_many_with_fallback indica además qué lotes respondió el fallback.
+    """
+
+    def __init__(
+        self,
+        primary: LLMProvider,
+        fallback: Optional[LLMProvider] = None,
+        concurrency: int = LLM_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT,
+        retries: int = LLM_RETRIES,
+        backoff: float = LLM_BACKOFF,
+        batch_size: int = LLM_BATCH_SIZE,
+    ):
+        self.primary = primary
+        self.fallback = fallback or RuleBasedProvider()
+        self.name = f"{primary.name}+resiliente"
+        self.version = primary.version
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+        self._stats = {
+            "llamadas": 0,
+            "agrupadas": 0,
+            "reintentos": 0,
+            "timeouts": 0,
+            "errores": 0,
+            "fallbacks": 0,
+        }
+
+    async def _con_reintentos(self, llamada, respaldo) -> Tuple[object, bool]:
+        """(resultado, True si lo dio el fallback)."""
+        for intento in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    self._stats["llamadas"] += 1
+                    return await asyncio.wait_for(llamada(), timeout=self.timeout), False
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+            except Exception:
+                self._stats["errores"] += 1
+            if intento < self.retries:
+                self._stats["reintentos"] += 1
+                await asyncio.sleep(self.backoff * (2 ** intento) * (0.5 + random.random()))
+        self._stats["fallbacks"] += 1
+        return await respaldo(), True
+
+    async def _agrupada(self, clave: str, llamada, respaldo):
+        futuro = self._en_vuelo.get(clave)
+        if futuro is not None:
+            self._stats["agrupadas"] += 1
+            return await asyncio.shield(futuro)
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_vuelo[clave] = futuro
+        try:
+            resultado = await self._con_reintentos(llamada, respaldo)
+            futuro.set_result(resultado)
+            return resultado
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except Exception as exc:
+            futuro.set_exception(exc)
+            futuro.exception()  # marcado como recuperado si nadie más lo esperaba
+            raise
+        finally:
+            del self._en_vuelo[clave]
+
+    async def segment(self, lead: Dict) -> Dict:
+        resultado, _ = await self._agrupada(
+            "seg:" + _huella(_solo_entrada(lead)),
+            lambda: self.primary.segment(lead),
+            lambda: self.fallback.segment(lead),
+        )
+        return resultado
+
+    async def segment_many(self, leads: List[Dict]) -> List[Dict]:
+        return (await self.segment_many_with_fallback(leads))[0]
+
+    async def segment_many_with_fallback(self, leads: List[Dict]) -> Tuple[List[Dict], List[bool]]:
+        lotes = [leads[i:i + self.batch_size] for i in range(0, len(leads), self.batch_size)]
+        resultados = await asyncio.gather(
+            *(
+                self._agrupada(
+                    "lote:" + _huella([_solo_entrada(lead) for lead in lote]),
+                    lambda lote=lote: self.primary.segment_many(lote),
+                    lambda lote=lote: self.fallback.segment_many(lote),
+                )
+                for lote in lotes
+            )
+        )
+        return (
+            [r for lote, _ in resultados for r in lote],
+            [respaldo for lote, respaldo in resultados for _ in lote],
+        )
+
+    async def generate_message(self, lead, last_interactions, canal, objetivo, tono) -> Dict:
+        mensaje, _ = await self._agrupada(
+            "msg:" + _huella([lead, last_interactions, canal, objetivo, tono]),
+            lambda: self.primary.generate_message(lead, last_interactions, canal, objetivo, tono),
+            lambda: self.fallback.generate_message(lead, last_interactions, canal, objetivo, tono),
+        )
+        return mensaje
+
+    def stats(self) -> Dict:
+        return {
+            "proveedor": self.name,
+            "version": self.version,
+            "concurrencia_max": self.concurrency,
+            "en_vuelo": len(self._en_vuelo),
+            **self._stats,
+        }
+
+    async def aclose(self) -> None:
+        await self.primary.aclose()
+
+
+def _solo_entrada(lead: Dict) -> Dict:
+    """Campos del lead que necesita la segmentación (no se envía el resto)."""
+    return {campo: lead.get(campo) for campo in SEGMENTATION_FIELDS}
+
+
+def _huella(datos) -> str:
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def build_provider_from_env() -> LLMProvider:
+    if LLM_BACKEND == "http":
+        return ResilientProvider(HTTPLLMProvider(LLM_URL, LLM_TIMEOUT), RuleBasedProvider())
+    if LLM_BACKEND != "reglas":
+        raise ValueError(f"LEADFLOW_LLM_BACKEND desconocido: {LLM_BACKEND}")
+    return RuleBasedProvider()
+
+
+llm_provider = build_provider_from_env()
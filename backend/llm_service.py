@@ -1,9 +1,89 @@
-from typing import Dict
+import os
+import string
+import time
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 
+from observability import timed_stage
+
 
 # ========= SEGMENTACIÓN "TIPO LLM" =========
 
+# Versión de las reglas / modelo de segmentación. Forma parte de la clave de
+# la caché de segmentaciones: cambiarla invalida todos los resultados guardados.
+SEGMENTATION_VERSION = "reglas-v1"
+
+# Campos del lead de los que depende la segmentación
+SEGMENTATION_FIELDS = ("mensaje_inicial", "necesidades", "sector", "fuente")
+
+# Frases por categoría, en orden de prioridad dentro de cada eje.
+# Eje temperatura/etapa: gana la categoría de mayor prioridad presente en el texto.
+FRASES_URGENCIA = ("me urge", "urgente", "ya mismo", "lo antes posible", "este mes")
+FRASES_DUDA = ("tiene sentido", "si tiene sentido", "no sé si tiene sentido", "no se si tiene sentido")
+FRASES_INTERES = ("me interesa", "quiero entender", "quiero saber", "estoy buscando", "evaluando opciones")
+
+# Eje tipo de contacto
+FRASES_CLIENTE = ("cliente actual", "ya trabajo con", "renovar", "renovación", "renovacion")
+FRASES_OPORTUNIDAD = ("propuesta", "cotización", "cotizacion", "presupuesto")
+
+# (frases, temperatura, etapa, siguiente_paso) en orden de prioridad.
+# La última fila no tiene frases: es el caso genérico / poco contexto.
+REGLAS_TEMPERATURA = (
+    (
+        FRASES_URGENCIA,
+        "caliente",
+        "decision",
+        "Proponer una llamada de cierre con una propuesta concreta y próximos pasos.",
+    ),
+    (
+        FRASES_DUDA,
+        "tibio",
+        "awareness",
+        "Ayudarle primero a entender el problema y si realmente tiene sentido hacer la inversión.",
+    ),
+    (
+        FRASES_INTERES,
+        "tibio",
+        "consideration",
+        "Proponer una llamada corta para entender mejor el caso y adaptar la solución al negocio.",
+    ),
+    (
+        (),
+        "frio",
+        "awareness",
+        "Enviar contenido educativo sencillo para que vea el valor antes de tomar una decisión.",
+    ),
+)
+
+# (frases, tipo_contacto) en orden de prioridad; la última fila es el defecto.
+REGLAS_TIPO_CONTACTO = (
+    (FRASES_CLIENTE, "cliente"),
+    (FRASES_OPORTUNIDAD, "oportunidad"),
+    ((), "lead"),
+)
+
+JUSTIFICACION_SEGMENTACION = (
+    "Clasificación basada en expresiones de urgencia, duda e interés dentro del texto recibido. "
+    "En un entorno real se podría sustituir por un modelo LLM entrenado."
+)
+
+
+def _primera_regla(texto: str, reglas: Tuple) -> Tuple:
+    """
+    Devuelve la primera regla (por prioridad) con alguna frase contenida en el texto.
+    La última regla no tiene frases y actúa como valor por defecto.
+    """
+    for regla in reglas[:-1]:
+        for frase in regla[0]:
+            if frase in texto:
+                return regla
+    return reglas[-1]
+
+
+@timed_stage("llm")
 def segment_lead_with_llm(lead: Dict) -> Dict:
     """
     Simula segmentación con LLM.
@@ -20,172 +100,288 @@ def segment_lead_with_llm(lead: Dict) -> Dict:
         + (lead.get("fuente") or "")
     ).lower()
 
-    # ---- Temperatura / etapa según el tipo de frase ----
-
-    # 1) Urgencia clara -> caliente / decision
-    if any(p in texto for p in ["me urge", "urgente", "ya mismo", "lo antes posible", "este mes"]):
-        temperatura = "caliente"
-        etapa = "decision"
-        siguiente_paso = "Proponer una llamada de cierre con una propuesta concreta y próximos pasos."
+    # Temperatura / etapa según el tipo de frase (urgencia > duda > interés > genérico)
+    _, temperatura, etapa, siguiente_paso = _primera_regla(texto, REGLAS_TEMPERATURA)
 
-    # 2) Duda tipo “no sé si tiene sentido / quiero entender si tiene sentido”
-    elif any(p in texto for p in ["tiene sentido", "si tiene sentido", "no sé si tiene sentido", "no se si tiene sentido"]):
-        temperatura = "tibio"
-        etapa = "awareness"
-        siguiente_paso = "Ayudarle primero a entender el problema y si realmente tiene sentido hacer la inversión."
-
-    # 3) Interés activo / está buscando opciones
-    elif any(p in texto for p in ["me interesa", "quiero entender", "quiero saber", "estoy buscando", "evaluando opciones"]):
-        temperatura = "tibio"
-        etapa = "consideration"
-        siguiente_paso = "Proponer una llamada corta para entender mejor el caso y adaptar la solución al negocio."
-
-    # 4) Genérico / poco contexto
-    else:
-        temperatura = "frio"
-        etapa = "awareness"
-        siguiente_paso = "Enviar contenido educativo sencillo para que vea el valor antes de tomar una decisión."
-
-    # Tipo de contacto (lead / oportunidad / cliente)
-    if any(p in texto for p in ["cliente actual", "ya trabajo con", "renovar", "renovación", "renovacion"]):
-        tipo_contacto = "cliente"
-    elif any(p in texto for p in ["propuesta", "cotización", "cotizacion", "presupuesto"]):
-        tipo_contacto = "oportunidad"
-    else:
-        tipo_contacto = "lead"
+    # Tipo de contacto (cliente > oportunidad > lead)
+    _, tipo_contacto = _primera_regla(texto, REGLAS_TIPO_CONTACTO)
 
     return {
         "etapa_funnel": etapa,
         "temperatura": temperatura,
         "tipo_contacto": tipo_contacto,
         "siguiente_paso": siguiente_paso,
-        "justificacion": (
-            "Clasificación basada en expresiones de urgencia, duda e interés dentro del texto recibido. "
-            "En un entorno real se podría sustituir por un modelo LLM entrenado."
-        ),
+        "justificacion": JUSTIFICACION_SEGMENTACION,
     }
 
 
-# ========= HELPERS PARA PERSONALIZAR MENSAJES =========
+# ========= SEGMENTACIÓN POR COLUMNAS =========
 
-def _detectar_dolor(texto: str) -> str:
+# Separador de filas en el texto concatenado. Ninguna frase lo contiene, así
+# que una coincidencia nunca cruza de una fila a otra.
+_SEPARADOR_FILAS = "\x00"
+
+# Filas por bloque: el texto de un bloque (~1 MB) cabe en caché mientras se
+# recorre una vez por frase.
+BATCH_BLOCK_SIZE = 10000
+
+# str.lower() de cada carácter Latin-1 es otro carácter Latin-1, así que un
+# bloque representable en Latin-1 se pasa a minúsculas con bytes.translate
+# (en C y sin tablas Unicode) con el mismo resultado que str.lower().
+_MINUSCULAS_LATIN1 = bytes(ord(chr(i).lower()) for i in range(256))
+
+
+def _frases_necesarias(reglas: Tuple) -> Tuple[Tuple[str, ...], ...]:
     """
-    Detecta el dolor principal que menciona la persona
-    (caos, tiempo, conversión, recurrencia, equipo, tech, etc.)
-    y devuelve una frase ya lista para usar en el mensaje.
+    Frases a buscar por regla. Una frase que contiene otra de la misma regla
+    o de una anterior ("si tiene sentido" ⊃ "tiene sentido") no cambia el
+    resultado y se omite.
     """
-    t = texto.lower()
+    vistas: List[str] = []
+    necesarias = []
+    for regla in reglas[:-1]:
+        vistas.extend(regla[0])
+        necesarias.append(tuple(f for f in regla[0] if not any(v != f and v in f for v in vistas)))
+    return tuple(necesarias)
 
-    # Caos / desorden
-    if any(p in t for p in ["desorden", "caos", "muchos mensajes", "se me pierden", "no doy abasto", "no alcanzo", "saturado"]):
-        return (
-            "bajar el caos de mensajes y tener claro en un solo sitio quién te escribió, "
-            "qué pidió y en qué punto de la conversación se quedó."
-        )
 
-    # Tiempo
-    if any(p in t for p in ["tiempo", "horas", "manual", "manualmente", "automatizar", "automatice", "automatización", "automatizacion"]):
-        return (
-            "dejar de hacerlo todo de forma manual y recuperar horas de trabajo, "
-            "sin perder seguimiento de las oportunidades importantes."
-        )
+_FRASES_TEMPERATURA = _frases_necesarias(REGLAS_TEMPERATURA)
+_FRASES_TIPO_CONTACTO = _frases_necesarias(REGLAS_TIPO_CONTACTO)
+_FRASES_TEMPERATURA_LATIN1 = tuple(tuple(f.encode("latin-1") for f in fr) for fr in _FRASES_TEMPERATURA)
+_FRASES_TIPO_CONTACTO_LATIN1 = tuple(tuple(f.encode("latin-1") for f in fr) for fr in _FRASES_TIPO_CONTACTO)
 
-    # Conversión / ventas
-    if any(p in t for p in ["no convierten", "no compran", "pocas ventas", "ventas", "cerrar", "cierres", "cierre", "tasa de conversión", "conversion"]):
-        return (
-            "entender qué contactos tienen más probabilidad de convertirse en venta "
-            "y priorizarlos en lugar de tratar todo por igual."
-        )
 
-    # Recurrencia / fidelización
-    if any(p in t for p in ["recurrente", "recurrentes", "que vuelvan", "fidelizar", "fidelidad", "retener", "retencion", "retención"]):
-        return (
-            "identificar quién ya te ha comprado y crear acciones específicas para que vuelvan, "
-            "en lugar de vivir solo de clientes nuevos."
-        )
+def _columna(valores: Iterable) -> List[str]:
+    # None (o NaN de pandas, o cualquier no-str) cuenta como texto vacío
+    return [v if isinstance(v, str) else "" for v in valores]
 
-    # Equipo / coordinación comercial
-    if any(p in t for p in ["equipo", "vendedores", "agentes", "comercial", "equipo de ventas", "comerciales"]):
-        return (
-            "que todo el equipo comercial vea la misma información y no se dupliquen mensajes, "
-            "evitando que dos personas contacten al mismo cliente sin saberlo."
-        )
-
-    # Tecnología / herramientas dispersas
-    if any(p in t for p in ["excel", "hoja de cálculo", "hoja de calculo", "google sheets", "herramientas distintas", "múltiples sistemas", "varias herramientas"]):
-        return (
-            "pasar de tener la información repartida en mil sitios (Excel, chats, notas) "
-            "a un flujo simple donde puedas seguir cada oportunidad."
-        )
 
-    # Genérico si no detecta nada claro
+def _prioridades(corpus, inicios: List[int], frases_por_regla: Tuple, defecto: int) -> List[int]:
+    """
+    Índice de la primera regla que se cumple en cada fila del bloque. Cada
+    frase se busca con find sobre el texto de todo el bloque (un recorrido
+    en C por frase, no por fila) y cada aparición se asigna a su fila con bisect.
+    """
+    prioridad = [defecto] * (len(inicios) - 1)
+    for indice, frases in enumerate(frases_por_regla):
+        for frase in frases:
+            pos = corpus.find(frase)
+            while pos != -1:
+                fila = bisect_right(inicios, pos) - 1
+                if prioridad[fila] > indice:
+                    prioridad[fila] = indice
+                # Basta una aparición por fila: se salta al inicio de la siguiente
+                pos = corpus.find(frase, inicios[fila + 1])
+    return prioridad
+
+
+def _segmentar_bloque(filas: List[str]) -> Tuple[List[int], List[int]]:
+    """(regla de temperatura, regla de tipo de contacto) de cada fila del bloque."""
+    crudo = _SEPARADOR_FILAS.join(filas) + _SEPARADOR_FILAS
+    try:
+        corpus = crudo.encode("latin-1").translate(_MINUSCULAS_LATIN1)
+        frases_temperatura, frases_tipo = _FRASES_TEMPERATURA_LATIN1, _FRASES_TIPO_CONTACTO_LATIN1
+    except UnicodeEncodeError:
+        frases_temperatura, frases_tipo = _FRASES_TEMPERATURA, _FRASES_TIPO_CONTACTO
+        corpus = crudo.lower()
+        if len(corpus) != len(crudo):
+            # Algún carácter se expande al pasar a minúsculas (p. ej. "İ"): fila a fila
+            filas = [fila.lower() for fila in filas]
+            corpus = _SEPARADOR_FILAS.join(filas) + _SEPARADOR_FILAS
+    # Con longitudes iguales, los desplazamientos de las filas originales valen
+    inicios = list(accumulate(map((1).__add__, map(len, filas)), initial=0))
     return (
-        "tener un flujo de seguimiento claro, sin depender solo de la memoria y sin perder oportunidades importantes por el camino."
+        _prioridades(corpus, inicios, frases_temperatura, len(REGLAS_TEMPERATURA) - 1),
+        _prioridades(corpus, inicios, frases_tipo, len(REGLAS_TIPO_CONTACTO) - 1),
     )
 
 
-def _detectar_contexto_negocio(lead: Dict) -> str:
+@timed_stage("llm")
+def segment_leads_batch(
+    mensaje_inicial: Iterable[Optional[str]],
+    necesidades: Iterable[Optional[str]],
+    sector: Iterable[Optional[str]],
+    fuente: Iterable[Optional[str]],
+) -> Dict[str, List[str]]:
     """
-    Devuelve una descripción del tipo de negocio / contexto
-    para que el mensaje no hable solo de 'leads'.
+    Segmenta muchos leads a la vez a partir de columnas de texto (listas,
+    arrays de NumPy, Series de pandas, columnas de Arrow con to_pylist...).
+    Devuelve columnas alineadas con la entrada: etapa_funnel, temperatura,
+    tipo_contacto y siguiente_paso. Fila a fila, el resultado es idéntico
+    al de segment_lead_with_llm.
     """
-    empresa = (lead.get("empresa") or "").lower()
-    sector = (lead.get("sector") or "").lower()
-    fuente = (lead.get("fuente") or "").lower()
-    texto = (
-        (lead.get("mensaje_inicial") or "")
-        + " "
-        + (lead.get("necesidades") or "")
-        + " "
-        + empresa
-        + " "
-        + sector
-        + " "
-        + fuente
-    ).lower()
+    # Igual que `campo or ""` en segment_lead_with_llm
+    columnas = [[v or "" for v in c] for c in (mensaje_inicial, necesidades, sector, fuente)]
+    n = len(columnas[0])
+    if any(len(c) != n for c in columnas):
+        raise ValueError("Las columnas deben tener la misma longitud")
+
+    # Mismo texto por fila que segment_lead_with_llm (antes de pasar a minúsculas)
+    try:
+        filas = list(map(" ".join, zip(*columnas)))
+    except TypeError:
+        filas = list(map(" ".join, zip(*map(_columna, columnas))))
+    temperatura: List[int] = []
+    tipo: List[int] = []
+    for inicio in range(0, n, BATCH_BLOCK_SIZE):
+        t, c = _segmentar_bloque(filas[inicio:inicio + BATCH_BLOCK_SIZE])
+        temperatura += t
+        tipo += c
 
-    # Redes / Instagram / social media
-    if any(p in texto for p in ["instagram", "dm", "redes", "facebook ads", "tiktok", "social"]):
-        return (
-            "cómo conectar lo que pasa en tus redes sociales (DM, comentarios, formularios) "
-            "con un sistema donde no se pierdan las conversaciones valiosas."
-        )
+    return {
+        "etapa_funnel": [REGLAS_TEMPERATURA[i][2] for i in temperatura],
+        "temperatura": [REGLAS_TEMPERATURA[i][1] for i in temperatura],
+        "tipo_contacto": [REGLAS_TIPO_CONTACTO[i][1] for i in tipo],
+        "siguiente_paso": [REGLAS_TEMPERATURA[i][3] for i in temperatura],
+    }
 
-    # E-commerce
-    if "ecommerce" in texto or "tienda online" in texto:
-        return (
-            "identificar qué personas pasan de solo mirar productos a realmente tener intención de compra "
-            "y acompañarlas mejor hasta el pago."
-        )
 
-    # Academias / cursos / formaciones
-    if "academia" in texto or "curso" in texto or "formación" in texto or "formacion" in texto or "webinar" in texto:
-        return (
-            "saber entre todos los registros de tus cursos y webinars quién está listo para una oferta de mayor valor, "
-            "sin tener que revisar uno a uno."
+def segment_leads(leads: List[Dict]) -> List[Dict]:
+    """
+    Equivalente a [segment_lead_with_llm(l) for l in leads] pasando por
+    segment_leads_batch: un dict de resultado (nuevo) por lead.
+    """
+    columnas = segment_leads_batch(*([lead.get(campo) for lead in leads] for campo in SEGMENTATION_FIELDS))
+    return [
+        {
+            "etapa_funnel": etapa,
+            "temperatura": temperatura,
+            "tipo_contacto": tipo,
+            "siguiente_paso": paso,
+            "justificacion": JUSTIFICACION_SEGMENTACION,
+        }
+        for etapa, temperatura, tipo, paso in zip(
+            columnas["etapa_funnel"], columnas["temperatura"], columnas["tipo_contacto"], columnas["siguiente_paso"]
         )
+    ]
 
-    # Hostelería / cafetería / restaurantes
-    if "cafetería" in texto or "cafeteria" in texto or "hosteleria" in texto or "restaurante" in texto:
-        return (
-            "pasar de visitas puntuales a clientes recurrentes, "
-            "sabiendo quién vuelve, cada cuánto y qué tipo de comunicación les funciona mejor."
-        )
 
-    # Servicios B2B / consultoría
-    if "consultoría" in texto or "consultoria" in texto or "b2b" in texto or "empresa" in texto or "servicio" in texto:
-        return (
-            "tener visibilidad clara de en qué fase está cada empresa con la que hablas "
-            "y priorizar a las que están más cerca de tomar una decisión."
-        )
+# ========= HELPERS PARA PERSONALIZAR MENSAJES =========
 
-    # Genérico
-    return (
+# Los detectores dependen solo del texto del lead y las plantillas solo de
+# (etapa, temperatura, canal, objetivo): se memorizan con lru_cache (clave =
+# hash del contenido) para que repetir un lead o generar una campaña entera
+# con la misma combinación cueste poco más que interpolar cadenas.
+MESSAGE_CACHE_SIZE = int(os.getenv("LEADFLOW_MESSAGE_CACHE_SIZE", "65536"))
+TEMPLATE_CACHE_SIZE = 1024
+
+# (frases, frase para el mensaje) en orden de prioridad; la última fila es el defecto.
+REGLAS_DOLOR = (
+    (
+        # Caos / desorden
+        ("desorden", "caos", "muchos mensajes", "se me pierden", "no doy abasto", "no alcanzo", "saturado"),
+        "bajar el caos de mensajes y tener claro en un solo sitio quién te escribió, "
+        "qué pidió y en qué punto de la conversación se quedó.",
+    ),
+    (
+        # Tiempo
+        ("tiempo", "horas", "manual", "manualmente", "automatizar", "automatice", "automatización", "automatizacion"),
+        "dejar de hacerlo todo de forma manual y recuperar horas de trabajo, "
+        "sin perder seguimiento de las oportunidades importantes.",
+    ),
+    (
+        # Conversión / ventas
+        ("no convierten", "no compran", "pocas ventas", "ventas", "cerrar", "cierres", "cierre", "tasa de conversión", "conversion"),
+        "entender qué contactos tienen más probabilidad de convertirse en venta "
+        "y priorizarlos en lugar de tratar todo por igual.",
+    ),
+    (
+        # Recurrencia / fidelización
+        ("recurrente", "recurrentes", "que vuelvan", "fidelizar", "fidelidad", "retener", "retencion", "retención"),
+        "identificar quién ya te ha comprado y crear acciones específicas para que vuelvan, "
+        "en lugar de vivir solo de clientes nuevos.",
+    ),
+    (
+        # Equipo / coordinación comercial
+        ("equipo", "vendedores", "agentes", "comercial", "equipo de ventas", "comerciales"),
+        "que todo el equipo comercial vea la misma información y no se dupliquen mensajes, "
+        "evitando que dos personas contacten al mismo cliente sin saberlo.",
+    ),
+    (
+        # Tecnología / herramientas dispersas
+        ("excel", "hoja de cálculo", "hoja de calculo", "google sheets", "herramientas distintas", "múltiples sistemas", "varias herramientas"),
+        "pasar de tener la información repartida en mil sitios (Excel, chats, notas) "
+        "a un flujo simple donde puedas seguir cada oportunidad.",
+    ),
+    (
+        # Genérico si no detecta nada claro
+        (),
+        "tener un flujo de seguimiento claro, sin depender solo de la memoria y sin perder oportunidades importantes por el camino.",
+    ),
+)
+
+REGLAS_CONTEXTO = (
+    (
+        # Redes / Instagram / social media
+        ("instagram", "dm", "redes", "facebook ads", "tiktok", "social"),
+        "cómo conectar lo que pasa en tus redes sociales (DM, comentarios, formularios) "
+        "con un sistema donde no se pierdan las conversaciones valiosas.",
+    ),
+    (
+        # E-commerce
+        ("ecommerce", "tienda online"),
+        "identificar qué personas pasan de solo mirar productos a realmente tener intención de compra "
+        "y acompañarlas mejor hasta el pago.",
+    ),
+    (
+        # Academias / cursos / formaciones
+        ("academia", "curso", "formación", "formacion", "webinar"),
+        "saber entre todos los registros de tus cursos y webinars quién está listo para una oferta de mayor valor, "
+        "sin tener que revisar uno a uno.",
+    ),
+    (
+        # Hostelería / cafetería / restaurantes
+        ("cafetería", "cafeteria", "hosteleria", "restaurante"),
+        "pasar de visitas puntuales a clientes recurrentes, "
+        "sabiendo quién vuelve, cada cuánto y qué tipo de comunicación les funciona mejor.",
+    ),
+    (
+        # Servicios B2B / consultoría
+        ("consultoría", "consultoria", "b2b", "empresa", "servicio"),
+        "tener visibilidad clara de en qué fase está cada empresa con la que hablas "
+        "y priorizar a las que están más cerca de tomar una decisión.",
+    ),
+    (
+        # Genérico
+        (),
         "organizar mejor tus oportunidades, tener claras las prioridades "
-        "y no depender solo de la memoria o de revisar chats antiguos para saber qué sigue."
+        "y no depender solo de la memoria o de revisar chats antiguos para saber qué sigue.",
+    ),
+)
+
+
+@lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _detectar_dolor(texto: str) -> str:
+    """
+    Detecta el dolor principal que menciona la persona
+    (caos, tiempo, conversión, recurrencia, equipo, tech, etc.)
+    y devuelve una frase ya lista para usar en el mensaje.
+    """
+    return _primera_regla(texto.lower(), REGLAS_DOLOR)[1]
+
+
+def _detectar_contexto_negocio(lead: Dict) -> str:
+    """
+    Devuelve una descripción del tipo de negocio / contexto
+    para que el mensaje no hable solo de 'leads'.
+    """
+    return _contexto_de_textos(
+        lead.get("mensaje_inicial") or "",
+        lead.get("necesidades") or "",
+        lead.get("empresa") or "",
+        lead.get("sector") or "",
+        lead.get("fuente") or "",
     )
 
 
+@lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _contexto_de_textos(mensaje_inicial: str, necesidades: str, empresa: str, sector: str, fuente: str) -> str:
+    texto = (
+        mensaje_inicial + " " + necesidades + " " + empresa.lower() + " " + sector.lower() + " " + fuente.lower()
+    ).lower()
+    return _primera_regla(texto, REGLAS_CONTEXTO)[1]
+
+
 def _beneficio_principal(etapa: str) -> str:
     """
     Según la etapa del funnel enfatizamos un beneficio distinto.
@@ -232,8 +428,88 @@ def _saludo_y_cierre(canal: str, nombre: str):
     return saludo, cierre
 
 
+def _asunto(canal: str, objetivo: str) -> Optional[str]:
+    """Asunto para email / linkedin; None en el resto de canales."""
+    if canal not in ("email", "linkedin"):
+        return None
+    if objetivo == "conseguir_llamada":
+        return "¿Vemos juntos cómo ordenar mejor tu flujo de oportunidades?"
+    if objetivo == "reactivar":
+        return "¿Retomamos la conversación sobre tu sistema de seguimiento?"
+    return "Ideas para mejorar tu flujo de trabajo comercial"
+
+
+def _literal(texto: str) -> str:
+    """Escapa las llaves de un texto fijo que va dentro de una plantilla de str.format."""
+    return texto.replace("{", "{{").replace("}", "}}")
+
+
+class PlantillaMensaje:
+    """
+    Mensaje precompilado para una combinación (etapa, temperatura, canal,
+    objetivo): saludo, cuerpo según etapa, CTA y cierre se escriben una vez
+    como plantilla de str.format y se trocean en (texto fijo, campo). Al
+    generar solo se intercalan los datos del lead (nombre, empresa, dolor,
+    contexto) con un join, bastante más rápido que format sobre texto no ASCII.
+    """
+
+    __slots__ = ("piezas", "asunto")
+
+    def __init__(self, etapa: str, temperatura: str, canal: str, objetivo: str):
+        beneficio = _literal(_beneficio_principal(etapa))
+        # Cuerpo principal según etapa
+        if etapa == "awareness":
+            cuerpo_base = (
+                "Por lo que comentaste, estás empezando a explorar cómo mejorar el día a día en {empresa}. "
+                f"Podemos ayudarte a {{contexto}}. La idea es que ganes claridad y {beneficio}, sin presión."
+            )
+        elif etapa == "decision":
+            cuerpo_base = (
+                "Por lo que nos has contado, ya tienes bastante claro el problema y estás cerca de tomar una decisión. "
+                f"Si trabajamos en {{dolor}}, aplicado a tu contexto, podrás {beneficio}."
+            )
+        else:  # consideration
+            cuerpo_base = (
+                "En {empresa} ya has visto que {dolor}. "
+                "Ahora estás valorando opciones para mejorar la forma en que gestionas tu flujo de oportunidades. "
+                f"Si empezamos por ahí, será más fácil {beneficio} y, sobre esa base, podremos ver {{contexto}}."
+            )
+        # El saludo ya sale con el hueco {nombre}; el resto de textos fijos se escapan
+        saludo, cierre = _saludo_y_cierre(canal, "{nombre}")
+        cta = _construir_cta(objetivo, temperatura, canal)
+        cuerpo = f"{saludo}\n\n{cuerpo_base}\n\n{_literal(cta)}\n\n{_literal(cierre)}"
+        self.piezas = tuple((literal, campo) for literal, campo, _, _ in string.Formatter().parse(cuerpo))
+        self.asunto = _asunto(canal, objetivo)
+
+    def render(self, valores: Dict[str, str]) -> str:
+        partes = []
+        for literal, campo in self.piezas:
+            partes.append(literal)
+            if campo is not None:
+                partes.append(valores[campo])
+        return "".join(partes)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _plantilla(etapa: str, temperatura: str, canal: str, objetivo: str) -> PlantillaMensaje:
+    return PlantillaMensaje(etapa, temperatura, canal, objetivo)
+
+
+_segundo_iso: Tuple[int, str] = (-1, "")
+
+
+def _ahora_iso() -> str:
+    """datetime.now().isoformat(timespec="seconds"), formateado una sola vez por segundo."""
+    global _segundo_iso
+    segundo = int(time.time())
+    if _segundo_iso[0] != segundo:
+        _segundo_iso = (segundo, datetime.fromtimestamp(segundo).isoformat(timespec="seconds"))
+    return _segundo_iso[1]
+
+
 # ========= GENERACIÓN DE MENSAJE "TIPO LLM" =========
 
+@timed_stage("llm")
 def generate_next_message_with_llm(
     lead: Dict,
     last_interactions: Dict,
@@ -247,14 +523,13 @@ def generate_next_message_with_llm(
     - empresa / sector / fuente
     - mensaje_inicial / necesidades
     - etapa_funnel + temperatura
+
+    Los detectores se memorizan por texto y la plantilla por
+    (etapa, temperatura, canal, objetivo): ver PlantillaMensaje.
     """
-    nombre = lead.get("nombre", "allí")
-    empresa = lead.get("empresa") or ""
     etapa = lead.get("etapa_funnel") or "consideration"
     temp = lead.get("temperatura") or "tibio"
 
-    saludo, cierre = _saludo_y_cierre(canal, nombre)
-
     texto_completo = (
         (lead.get("mensaje_inicial") or "")
         + " "
@@ -265,47 +540,21 @@ def generate_next_message_with_llm(
         + (lead.get("fuente") or "")
     )
 
-    dolor = _detectar_dolor(texto_completo)
-    contexto = _detectar_contexto_negocio(lead)
-    beneficio = _beneficio_principal(etapa)
-    cta = _construir_cta(objetivo, temp, canal)
-
-    # Cuerpo principal según etapa
-    if etapa == "awareness":
-        cuerpo_base = (
-            f"Por lo que comentaste, estás empezando a explorar cómo mejorar el día a día en {empresa or 'tu negocio'}. "
-            f"Podemos ayudarte a {contexto}. La idea es que ganes claridad y {beneficio}, sin presión."
-        )
-    elif etapa == "decision":
-        cuerpo_base = (
-            f"Por lo que nos has contado, ya tienes bastante claro el problema y estás cerca de tomar una decisión. "
-            f"Si trabajamos en {dolor}, aplicado a tu contexto, podrás {beneficio}."
-        )
-    else:  # consideration
-        cuerpo_base = (
-            f"En {empresa or 'tu negocio'} ya has visto que {dolor}. "
-            f"Ahora estás valorando opciones para mejorar la forma en que gestionas tu flujo de oportunidades. "
-            f"Si empezamos por ahí, será más fácil {beneficio} y, sobre esa base, podremos ver {contexto}."
-        )
-
-    cuerpo = f"{saludo}\n\n{cuerpo_base}\n\n{cta}\n\n{cierre}"
-
-    # Asunto para email / linkedin
-    if canal in ("email", "linkedin"):
-        if objetivo == "conseguir_llamada":
-            asunto = "¿Vemos juntos cómo ordenar mejor tu flujo de oportunidades?"
-        elif objetivo == "reactivar":
-            asunto = "¿Retomamos la conversación sobre tu sistema de seguimiento?"
-        else:
-            asunto = "Ideas para mejorar tu flujo de trabajo comercial"
-    else:
-        asunto = None
+    plantilla = _plantilla(etapa, temp, canal, objetivo)
+    cuerpo = plantilla.render(
+        {
+            "nombre": f"{lead.get('nombre', 'allí')}",
+            "empresa": lead.get("empresa") or "tu negocio",
+            "dolor": _detectar_dolor(texto_completo),
+            "contexto": _detectar_contexto_negocio(lead),
+        }
+    )
 
     return {
-        "asunto": asunto,
+        "asunto": plantilla.asunto,
         "cuerpo": cuerpo,
         "canal": canal,
-        "generado_en": datetime.now().isoformat(timespec="seconds"),
+        "generado_en": _ahora_iso(),
         "etapa_funnel": etapa,
         "temperatura": temp,
     }
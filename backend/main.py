@@ -1,27 +1,121 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from functools import partial
+from anyio import from_thread
+from pydantic import BaseModel, EmailStr, Field, ValidationError
+from typing import Dict, Optional, List
 from datetime import datetime
+import asyncio
+import json
+import time
 
-from database import get_db, row_to_dict
-from llm_service import segment_lead_with_llm, generate_next_message_with_llm
+from database import (
+    get_db,
+    row_to_dict,
+    build_lead_filter,
+    encode_cursor,
+    decode_cursor,
+    pool,
+    PoolTimeout,
+    LEAD_COLUMNS,
+    normalize_email,
+)
+from init_db import ensure_schema
+from export import iter_export, EXPORT_MEDIA_TYPES
+from metrics import funnel_metrics
+from search import build_fts_query, search_leads
+from llm_service import SEGMENTATION_FIELDS
+from llm_providers import llm_provider
+from segmentation_cache import segmentation_cache, segment_leads_cached, segment_leads_cached_async
+from batch import (
+    iter_lead_chunks,
+    save_segmentations,
+    insert_leads,
+    lead_insert_params,
+    leads_with_history_chunk,
+    save_generated_messages,
+    LEAD_UPSERT_SQL,
+)
+from idempotency import IdempotencyKeyInUse, get_saved_response, release_key, reserve_key, save_response
+from jobs import create_job, get_job
+from autosegment import AutoSegmenter
+from response_cache import (
+    etag_matches,
+    lead_etag,
+    leads_table_version,
+    list_etag,
+    list_key,
+    response_cache,
+)
+from serialization import FAST_JSON, RowEncoder, fetch_rows, model_columns
+from observability import CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS_ENABLED, MetricsMiddleware, mark_endpoint_end, registry, stage
+from profiling import PROFILE_MAX_SECONDS, ProfilerBusy, admin_token_ok, collapsed, profiler, slow_query_log
+from write_behind import InteractionWriter, LeadNotFound, WriteBehindFull, insert_interaccion
+from events import event_bus, interaccion_event_data, lead_event_data, publish_segmentations, sse_stream
 
 import sqlite3
 
+# Segmentación en segundo plano tras crear/editar leads (LEADFLOW_AUTOSEGMENT=1)
+autosegmenter = AutoSegmenter(llm_provider)
+interaction_writer = InteractionWriter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Migra BDs existentes: columnas nuevas + tablas e índices de models.sql
+    with pool.connection() as conn:
+        ensure_schema(conn)
+        segmentation_cache.purge_old_versions(conn)
+    event_bus.bind(asyncio.get_running_loop())
+    await autosegmenter.start()
+    interaction_writer.start()
+    yield
+    # Antes de cerrar el proveedor y el pool: segmentar y escribir todo lo pendiente
+    await autosegmenter.stop()
+    await run_in_threadpool(interaction_writer.stop)
+    await llm_provider.aclose()
+    pool.close()
+
+
 app = FastAPI(
     title="Lead Flow AI – Segmentación + Nutrición con Copy",
     description="API en FastAPI con SQLite y LLM (simulada) para segmentar leads y generar mensajes de nutrición.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+
+class TimedRoute(APIRoute):
+    """Ruta que marca el fin del endpoint para medir la serialización aparte (ver observability)."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, mark_endpoint_end(endpoint), **kwargs)
+
+
+if METRICS_ENABLED:
+    # Antes de declarar las rutas: add_api_route usa route_class al registrarlas
+    app.router.route_class = TimedRoute
+
 # CORS sencillo para permitir acceso desde el front-end
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Next-Before", "X-Search-Truncated", "ETag", "Server-Timing"],
 )
+if METRICS_ENABLED:
+    # Último en añadirse = el más externo: mide también CORS y los manejadores de errores
+    app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "Base de datos saturada, reintenta en unos segundos"})
 
 
 # ======== Pydantic Schemas ========
@@ -54,11 +148,25 @@ class LeadOut(LeadBase):
     tipo_contacto: Optional[str] = None
     estado: Optional[str] = None
     creado_en: str
+    actualizado_en: Optional[str] = None
+    version: Optional[int] = None  # sube con cada escritura; es la base del ETag
 
     class Config:
         from_attributes = True
 
 
+class LeadBusquedaOut(LeadOut):
+    puntuacion: float  # BM25: menor es más relevante
+    origen: str        # lead / interaccion: dónde está la mejor coincidencia
+    fragmento: Optional[str]
+
+
+class LeadSiguienteOut(LeadOut):
+    puntuacion: float  # prioridad actual: mayor es más urgente
+    ultima_interaccion_en: Optional[str] = None
+    ultimo_resultado: Optional[str] = None
+
+
 class InteraccionBase(BaseModel):
     canal: str           # email / whatsapp / linkedin
     rol: str             # agente / lead
@@ -77,6 +185,12 @@ class InteraccionOut(InteraccionBase):
     fecha: str
 
 
+# Camino rápido (LEADFLOW_FAST_JSON=1): columnas de SQLite en el orden de los
+# campos de cada modelo, emparejadas una sola vez
+LEAD_OUT_ENCODER = RowEncoder(model_columns(LeadOut))
+INTERACCION_OUT_ENCODER = RowEncoder(model_columns(InteraccionOut))
+
+
 class SegmentacionOut(BaseModel):
     etapa_funnel: str
     temperatura: str
@@ -85,12 +199,102 @@ class SegmentacionOut(BaseModel):
     justificacion: str
 
 
+class LeadFiltroQuery(BaseModel):
+    """Filtros por igualdad sobre columnas de leads (query params en GET /leads)."""
+    etapa_funnel: Optional[str] = None
+    temperatura: Optional[str] = None
+    tipo_contacto: Optional[str] = None
+    estado: Optional[str] = None
+    sector: Optional[str] = None
+    fuente: Optional[str] = None
+
+
+class LeadFiltro(LeadFiltroQuery):
+    """
+    Selección de leads para operaciones masivas.
+    Sin ningún campo informado se seleccionan todos los leads.
+    """
+    ids: Optional[List[int]] = None
+    solo_sin_segmentar: bool = False
+
+
+class SegmentacionMasivaRequest(LeadFiltro):
+    tamano_bloque: int = Field(1000, ge=1, le=20000)
+
+
+class BloqueSegmentacionOut(BaseModel):
+    bloque: int
+    procesados: int
+    acumulado: int
+    segundos: float
+    leads_por_segundo: float
+
+
+class SegmentacionMasivaOut(BaseModel):
+    total: int
+    segundos: float
+    leads_por_segundo: float
+    bloques: List[BloqueSegmentacionOut]
+
+
+class ResultadoFilaBulk(BaseModel):
+    indice: int                  # posición de la fila en el array / línea NDJSON (desde 0)
+    id: Optional[int] = None
+    fusionado: bool = False      # True si se fusionó en un lead existente (upsert)
+    error: Optional[str] = None
+
+
+class LeadsBulkOut(BaseModel):
+    recibidos: int
+    insertados: int
+    fusionados: int
+    errores: int
+    resultados: List[ResultadoFilaBulk]
+
+
 class NextMessageRequest(BaseModel):
     canal: str                     # email / whatsapp / linkedin
     objetivo: str                  # conseguir_llamada / reactivar / seguimiento
     tono: Optional[str] = "cercano_profesional"
 
 
+class CampanaRequest(NextMessageRequest):
+    filtro: LeadFiltro = LeadFiltro()
+    persistir: bool = False        # guardar cada mensaje como interacción (rol agente)
+    limite: Optional[int] = Field(None, ge=1)
+    tamano_bloque: int = Field(500, ge=1, le=5000)
+
+
+class PrioridadJobRequest(BaseModel):
+    tamano_bloque: int = Field(5000, ge=1, le=50000)
+
+
+class JobRequest(BaseModel):
+    tipo: str = Field(..., pattern="^(segmentar|mensajes|prioridad)$")
+    # segmentar: SegmentacionMasivaRequest; mensajes: CampanaRequest (siempre se persisten);
+    # prioridad: PrioridadJobRequest (worker.py ya lo encola periódicamente)
+    parametros: Dict = {}
+
+
+class JobOut(BaseModel):
+    id: int
+    tipo: str
+    estado: str                    # pendiente / en_curso / completado / error
+    parametros: Dict
+    procesados: int
+    total: Optional[int]
+    progreso: Optional[float]
+    ultimo_id: int
+    segundos: float
+    leads_por_segundo: float
+    error: Optional[str]
+    worker: Optional[str]
+    creado_en: Optional[str]
+    iniciado_en: Optional[str]
+    latido_en: Optional[str]
+    terminado_en: Optional[str]
+
+
 class NextMessageResponse(BaseModel):
     asunto: Optional[str]
     cuerpo: str
@@ -100,61 +304,504 @@ class NextMessageResponse(BaseModel):
     temperatura: Optional[str]
 
 
+class EmbudoFila(BaseModel):
+    etapa_funnel: Optional[str]
+    temperatura: Optional[str]
+    total: int
+
+
+class SectorFila(BaseModel):
+    sector: Optional[str]
+    total: int
+
+
+class DiaFila(BaseModel):
+    dia: Optional[str]
+    total: int
+
+
+class RespuestaCanal(BaseModel):
+    canal: Optional[str]
+    enviados: int
+    respuestas: int
+    tasa_respuesta: float
+    por_resultado: Dict[str, int]
+
+
+class MetricasFunnelOut(BaseModel):
+    total_leads: int
+    embudo: List[EmbudoFila]
+    por_sector: List[SectorFila]
+    por_dia: List[DiaFila]
+    respuesta_por_canal: List[RespuestaCanal]
+
+
 # ======== Endpoints CRUD Leads ========
 
+def _json_cacheable(cuerpo: bytes, etag: str, cabeceras: Optional[Dict[str, str]] = None) -> Response:
+    # no-cache: el navegador guarda la respuesta pero revalida siempre con If-None-Match
+    return Response(
+        cuerpo,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache", **(cabeceras or {})},
+    )
+
+
+def _no_modificado(etag: str) -> Response:
+    response_cache.not_modified()
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
 @app.get("/leads", response_model=List[LeadOut])
-def list_leads(db: sqlite3.Connection = Depends(get_db)):
-    cur = db.execute("SELECT * FROM leads ORDER BY creado_en DESC")
-    rows = cur.fetchall()
-    return [row_to_dict(r) for r in rows]
+def list_leads(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    fields: Optional[str] = Query(None, description="Columnas a devolver, separadas por comas"),
+    filtros: LeadFiltroQuery = Depends(),
+    if_none_match: Optional[str] = Header(None),
+    db: sqlite3.Connection = Depends(get_db),
+):
+    """
+    Lista leads del más reciente al más antiguo, paginando por (creado_en, id).
+    Si hay más resultados, la cabecera X-Next-Cursor trae el cursor de la siguiente página.
+
+    El ETag depende de la versión de la tabla y de los parámetros: mientras
+    no se escriba ningún lead, If-None-Match responde 304 y sin él la
+    página sale ya serializada de la caché.
+    """
+    # La versión se lee antes que las filas: el cuerpo nunca es más viejo que su ETag
+    clave = list_key(request.query_params)
+    etag = list_etag(leads_table_version(db), clave)
+    if etag_matches(if_none_match, etag):
+        return _no_modificado(etag)
+    guardada = response_cache.get_list(clave, etag)
+    if guardada is not None:
+        return _json_cacheable(guardada[1], etag, guardada[2])
+
+    where, params = build_lead_filter(filtros.dict())
+    if cursor:
+        try:
+            creado_en, ultimo_id = decode_cursor(cursor, 2)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        where += " AND (creado_en, id) < (?, ?)"
+        params += [creado_en, ultimo_id]
+
+    if fields:
+        proyeccion = list(dict.fromkeys(c.strip() for c in fields.split(",") if c.strip()))
+        desconocidas = sorted(set(proyeccion) - set(LEAD_COLUMNS))
+        if desconocidas:
+            raise HTTPException(status_code=422, detail=f"Columnas no válidas en fields: {', '.join(desconocidas)}")
+        encoder = RowEncoder(proyeccion)
+    else:
+        proyeccion = None
+        encoder = LEAD_OUT_ENCODER
+    # Columnas de salida primero; detrás, las del cursor si no están ya
+    columnas = list(dict.fromkeys(encoder.columnas + ("creado_en", "id")))
+
+    rows = fetch_rows(
+        db,
+        f"SELECT {', '.join(columnas)} FROM leads WHERE {where} ORDER BY creado_en DESC, id DESC LIMIT ?",
+        params + [limit + 1],
+        tuplas=FAST_JSON,
+    )
+
+    siguiente = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        siguiente = encode_cursor(rows[-1][columnas.index("creado_en")], rows[-1][columnas.index("id")])
+
+    if FAST_JSON:
+        cuerpo = encoder.encode_many(rows)
+    elif proyeccion is not None:
+        # La proyección no cumple LeadOut: se devuelve tal cual, sin validar
+        with stage("serializacion"):
+            cuerpo = JSONResponse([{c: r[c] for c in proyeccion} for r in rows]).body
+    else:
+        with stage("serializacion"):
+            cuerpo = JSONResponse([LeadOut(**row_to_dict(r)).dict() for r in rows]).body
+    cabeceras = {"X-Next-Cursor": siguiente} if siguiente else {}
+    response_cache.put_list(clave, etag, cuerpo, cabeceras)
+    return _json_cacheable(cuerpo, etag, cabeceras)
+
+
+@app.get("/leads/search", response_model=List[LeadBusquedaOut])
+def search_leads_endpoint(
+    response: Response,
+    q: str = Query(..., min_length=1, description="Palabras a buscar (todas deben aparecer; 'pala*' busca por prefijo)"),
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    interacciones: bool = Query(True, description="Buscar también en los mensajes de las interacciones"),
+    filtros: LeadFiltroQuery = Depends(),
+    db: sqlite3.Connection = Depends(get_db),
+):
+    """
+    Busca en mensaje_inicial, necesidades, empresa y (opcionalmente) en las
+    interacciones de cada lead. Resultados por relevancia BM25, con un
+    fragmento que marca las coincidencias con <mark>. Si una búsqueda
+    coincide con más de LEADFLOW_SEARCH_MAX_CANDIDATES filas, solo se
+    ordenan las coincidencias más recientes y todas las páginas llevan
+    X-Search-Truncated: true (una coincidencia antigua puede no salir).
+
+    Las páginas siguientes (cursor) no incluyen filas añadidas después de la
+    primera, pero la paginación no es estable frente a ediciones: si cambia
+    el texto de un lead o las estadísticas de BM25, un resultado puede
+    saltarse o repetirse entre páginas.
+    """
+    consulta = build_fts_query(q)
+    if consulta is None:
+        raise HTTPException(status_code=400, detail="La búsqueda no contiene palabras")
+    despues = ventana = None
+    if cursor:
+        try:
+            puntuacion, ultimo_id, *ventana = decode_cursor(cursor, 7)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        despues = (puntuacion, ultimo_id)
+        ventana = tuple(ventana)
+
+    where, params = build_lead_filter(filtros.dict())
+    rows, ventana = search_leads(
+        db, consulta, where, params, limit,
+        despues=despues, incluir_interacciones=interacciones, ventana=ventana,
+    )
+    if ventana[4]:
+        response.headers["X-Search-Truncated"] = "true"
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["puntuacion"], rows[-1]["id"], *ventana)
+    return rows
+
+
+# Mismo WHERE que el índice parcial idx_leads_prioridad (models.sql): así
+# SQLite recorre el índice hacia atrás y para en n, sin ordenar
+NEXT_LEADS_SQL = f"""
+    SELECT {LEAD_OUT_ENCODER.select}, ultima_interaccion_en, ultimo_resultado,
+           round(prioridad, 2) AS puntuacion
+    FROM leads
+    WHERE prioridad IS NOT NULL AND (estado IS NULL OR estado NOT IN ('ganado', 'perdido'))
+    ORDER BY prioridad DESC, id DESC
+    LIMIT ?
+"""
+
+
+@app.get("/leads/next", response_model=List[LeadSiguienteOut])
+def next_leads(
+    n: int = Query(10, ge=1, le=100),
+    db: sqlite3.Connection = Depends(get_db),
+):
+    """
+    Los n leads abiertos a los que conviene contactar antes, por prioridad
+    descendente. leads.prioridad la recalculan triggers en cada cambio del
+    lead (pesos en models.sql) y worker.py la envejece periódicamente: cada
+    día sin contacto suma un punto, hasta 30.
+    """
+    return [row_to_dict(r) for r in db.execute(NEXT_LEADS_SQL, (n,)).fetchall()]
 
 
 @app.post("/leads", response_model=LeadOut, status_code=201)
-def create_lead(lead: LeadCreate, db: sqlite3.Connection = Depends(get_db)):
+def create_lead(
+    lead: LeadCreate,
+    response: Response,
+    upsert: bool = Query(False, description="Si ya existe un lead con ese email, fusiona los datos en él (200)"),
+    idempotency_key: Optional[str] = Header(None),
+    db: sqlite3.Connection = Depends(get_db),
+):
+    # Transacción de escritura desde el principio: la comprobación de email
+    # y de Idempotency-Key no puede cruzarse con otra petición igual
+    db.execute("BEGIN IMMEDIATE")
+    if idempotency_key:
+        guardada = get_saved_response(db, "POST /leads", idempotency_key)
+        if guardada is not None:
+            db.rollback()
+            return guardada
+
+    email_norm = normalize_email(lead.email)
+    existente = None
+    if email_norm:
+        existente = db.execute("SELECT id FROM leads WHERE email_norm = ?", (email_norm,)).fetchone()
+    if existente is not None and not upsert:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Ya existe un lead con ese email (usa upsert=true para fusionar)")
+
     ahora = datetime.now().isoformat(timespec="seconds")
     cur = db.execute(
-        """
-        INSERT INTO leads (
-            nombre, email, empresa, sector, fuente,
-            mensaje_inicial, necesidades,
-            etapa_funnel, temperatura, tipo_contacto, estado, creado_en
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            lead.nombre,
-            lead.email,
-            lead.empresa,
-            lead.sector,
-            lead.fuente,
-            lead.mensaje_inicial,
-            lead.necesidades,
-            None,
-            None,
-            "lead",
-            "nuevo",
-            ahora,
-        ),
+        LEAD_UPSERT_SQL + " RETURNING id",
+        lead_insert_params(None, lead.dict(), {}, ahora),
     )
-    db.commit()
-    new_id = cur.lastrowid
+    new_id = cur.fetchone()[0]
     cur = db.execute("SELECT * FROM leads WHERE id = ?", (new_id,))
     row = cur.fetchone()
-    return row_to_dict(row)
+    resultado = row_to_dict(row)
+
+    response.status_code = 200 if existente is not None else 201
+    if idempotency_key:
+        save_response(db, "POST /leads", idempotency_key, response.status_code, LeadOut(**resultado).dict())
+    db.commit()
+    response_cache.invalidate_leads([new_id])
+    event_bus.publish(
+        "lead.actualizado" if existente is not None else "lead.creado",
+        {"lead_id": new_id, "lead": lead_event_data(resultado)},
+    )
+    autosegmenter.enqueue([new_id])
+    return resultado
+
+
+def _segmentar_desde_hilo(leads: List[dict]):
+    """
+    Segmenta con el proveedor LLM (async) desde un hilo del threadpool:
+    bloquea ese hilo mientras espera, pero no el event loop. Devuelve
+    (resultados, de_respaldo) para que la caché no guarde los del fallback.
+    """
+    return from_thread.run(llm_provider.segment_many_with_fallback, leads)
+
+
+def _segmentar_con_cache(db: sqlite3.Connection, leads: List[dict]) -> List[dict]:
+    return segment_leads_cached(
+        db, leads, segment_many=_segmentar_desde_hilo, version=llm_provider.version, con_respaldo=True
+    )
+
+
+def _insertar_bloque_leads(
+    leads: List[LeadCreate], segmentar: bool, upsert: bool, reservar_clave: Optional[str] = None
+) -> List[dict]:
+    """Con reservar_clave, la Idempotency-Key se reserva en la misma transacción que el bloque."""
+    datos = [lead.dict() for lead in leads]
+    with pool.connection() as db:
+        segmentaciones = None
+        if segmentar:
+            segmentaciones = _segmentar_con_cache(db, datos)
+            db.commit()
+        reservar = partial(reserve_key, ruta="POST /leads/bulk", clave=reservar_clave) if reservar_clave else None
+        resultados = insert_leads(db, datos, segmentaciones, upsert=upsert, en_transaccion=reservar)
+        if segmentar:
+            _resegmentar_fusionados(db, resultados)
+        return resultados
+
+
+def _resegmentar_fusionados(db: sqlite3.Connection, resultados: List[dict]) -> None:
+    """
+    LEAD_UPSERT_SQL fusiona el texto en el lead existente sin tocar su
+    segmentación, y la calculada para la fila entrante no sirve (el texto
+    final mezcla los dos): los fusionados se segmentan de nuevo ya fusionados.
+    """
+    ids = list(dict.fromkeys(r["id"] for r in resultados if r.get("fusionado")))
+    if not ids:
+        return
+    filas = db.execute(
+        "SELECT * FROM leads WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id", (json.dumps(ids),)
+    ).fetchall()
+    segmentaciones = _segmentar_con_cache(db, [row_to_dict(fila) for fila in filas])
+    fusionados = [(fila["id"], seg) for fila, seg in zip(filas, segmentaciones)]
+    save_segmentations(db, fusionados)
+    db.commit()
+    publish_segmentations(fusionados)
+
+
+def _respuesta_guardada(ruta: str, clave: str):
+    with pool.connection() as db:
+        return get_saved_response(db, ruta, clave)
+
+
+def _guardar_respuesta(ruta: str, clave: str, estado_http: int, cuerpo: dict) -> None:
+    with pool.connection() as db:
+        save_response(db, ruta, clave, estado_http, cuerpo)
+        db.commit()
+
+
+def _liberar_clave(ruta: str, clave: str) -> None:
+    with pool.connection() as db:
+        release_key(db, ruta, clave)
+        db.commit()
+
+
+async def _leer_filas_bulk(request: Request):
+    """
+    Devuelve las filas del cuerpo una a una: array JSON o NDJSON (una por línea)
+    según el Content-Type. El NDJSON se lee en streaming, sin cargarlo entero.
+    """
+    if "ndjson" in request.headers.get("content-type", ""):
+        pendiente = b""
+        async for trozo in request.stream():
+            pendiente += trozo
+            *lineas, pendiente = pendiente.split(b"\n")
+            for linea in lineas:
+                if linea.strip():
+                    yield linea
+        if pendiente.strip():
+            yield pendiente
+        return
+
+    try:
+        filas = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El cuerpo no es JSON válido")
+    if not isinstance(filas, list):
+        raise HTTPException(status_code=400, detail="Se esperaba un array JSON de leads")
+    for fila in filas:
+        yield fila
+
+
+async def _enumerar(filas):
+    indice = 0
+    async for fila in filas:
+        yield indice, fila
+        indice += 1
+
+
+def _describir_error(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in exc.errors())
+    return str(exc)
+
+
+@app.post(
+    "/leads/bulk",
+    response_model=LeadsBulkOut,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/LeadCreate"}}
+                },
+                "application/x-ndjson": {"schema": {"type": "string", "description": "Un LeadCreate JSON por línea"}},
+            },
+        }
+    },
+)
+async def create_leads_bulk(
+    request: Request,
+    segmentar: bool = Query(False, description="Segmenta cada lead antes de guardarlo"),
+    upsert: bool = Query(False, description="Fusiona en el lead existente si el email ya existe"),
+    tamano_bloque: int = Query(1000, ge=1, le=20000),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """
+    Alta masiva de leads. Las filas se validan con LeadCreate y las válidas se
+    insertan con executemany, una transacción por bloque. Las filas con error
+    (incluido un email ya existente sin upsert) se informan en `resultados`
+    sin abortar el resto. Con segmentar y upsert, los leads fusionados se
+    segmentan de nuevo con el texto ya fusionado.
+
+    Con Idempotency-Key la clave se reserva en la transacción del primer
+    bloque y la respuesta se guarda al terminar; un reintento con la misma
+    clave la devuelve sin volver a procesar el cuerpo, y un duplicado
+    simultáneo recibe 409 sin escribir nada.
+    """
+    if idempotency_key:
+        guardada = await run_in_threadpool(_respuesta_guardada, "POST /leads/bulk", idempotency_key)
+        if guardada is not None:
+            return guardada
+
+    resultados: List[dict] = []
+    bloque: List[LeadCreate] = []
+    indices: List[int] = []
+    reservada = False
+
+    async def volcar():
+        nonlocal reservada
+        clave = idempotency_key if idempotency_key and not reservada else None
+        try:
+            guardados = await run_in_threadpool(_insertar_bloque_leads, bloque, segmentar, upsert, clave)
+        except sqlite3.Error as exc:
+            resultados.extend({"indice": i, "error": f"Error al guardar el bloque: {exc}"} for i in indices)
+        else:
+            reservada = reservada or clave is not None
+            resultados.extend({"indice": i, **r} for i, r in zip(indices, guardados))
+            # Un solo evento por bloque: el panel recarga su primera página
+            ids = [r["id"] for r in guardados if r.get("id") is not None]
+            if ids:
+                response_cache.invalidate_leads(ids)
+                event_bus.publish("leads.creados", {"lead_ids": ids})
+            if not segmentar:
+                autosegmenter.enqueue(r.get("id") for r in guardados)
+        bloque.clear()
+        indices.clear()
+
+    indice = -1
+    try:
+        async for indice, fila in _enumerar(_leer_filas_bulk(request)):
+            try:
+                if isinstance(fila, bytes):
+                    fila = json.loads(fila)
+                if not isinstance(fila, dict):
+                    raise ValueError("Se esperaba un objeto JSON")
+                bloque.append(LeadCreate(**fila))
+                indices.append(indice)
+            except (ValueError, ValidationError) as exc:
+                resultados.append({"indice": indice, "error": _describir_error(exc)})
+                continue
+            if len(bloque) >= tamano_bloque:
+                await volcar()
+        if bloque:
+            await volcar()
+    except IdempotencyKeyInUse as exc:
+        # Otra petición con la misma clave reservó antes; el bloque no se escribió
+        return exc.respuesta
+    except Exception:
+        # Sin liberar la clave, los reintentos recibirían 409 hasta que caducara
+        if reservada:
+            await run_in_threadpool(_liberar_clave, "POST /leads/bulk", idempotency_key)
+        raise
+
+    resultados.sort(key=lambda r: r["indice"])
+    guardados = [r for r in resultados if r.get("id") is not None]
+    fusionados = sum(1 for r in guardados if r.get("fusionado"))
+    respuesta = {
+        "recibidos": indice + 1,
+        "insertados": len(guardados) - fusionados,
+        "fusionados": fusionados,
+        "errores": len(resultados) - len(guardados),
+        "resultados": resultados,
+    }
+    if idempotency_key:
+        await run_in_threadpool(
+            _guardar_respuesta, "POST /leads/bulk", idempotency_key, 200, LeadsBulkOut(**respuesta).dict()
+        )
+    return respuesta
 
 
 @app.get("/leads/{lead_id}", response_model=LeadOut)
-def get_lead(lead_id: int, db: sqlite3.Connection = Depends(get_db)):
-    cur = db.execute("SELECT * FROM leads WHERE id = ?", (lead_id,))
-    row = cur.fetchone()
-    if row is None:
+def get_lead(
+    lead_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: sqlite3.Connection = Depends(get_db),
+):
+    """Lead por id, con ETag de su versión (If-None-Match → 304)."""
+    fila = db.execute("SELECT version FROM leads WHERE id = ?", (lead_id,)).fetchone()
+    if fila is None:
         raise HTTPException(status_code=404, detail="Lead no encontrado")
-    return row_to_dict(row)
+    etag = lead_etag(lead_id, fila[0])
+    if etag_matches(if_none_match, etag):
+        return _no_modificado(etag)
+    guardada = response_cache.get_lead(lead_id, etag)
+    if guardada is not None:
+        return _json_cacheable(guardada[1], etag)
+
+    filas = fetch_rows(
+        db, f"SELECT {LEAD_OUT_ENCODER.select} FROM leads WHERE id = ?", (lead_id,), tuplas=FAST_JSON
+    )
+    if not filas:
+        raise HTTPException(status_code=404, detail="Lead no encontrado")
+    row = filas[0]
+    # Si se escribió entre las dos lecturas, el ETag es el de la fila leída
+    etag = lead_etag(lead_id, row[LEAD_OUT_ENCODER.columnas.index("version")])
+    if FAST_JSON:
+        cuerpo = LEAD_OUT_ENCODER.encode_one(row)
+    else:
+        with stage("serializacion"):
+            cuerpo = JSONResponse(LeadOut(**row_to_dict(row)).dict()).body
+    response_cache.put_lead(lead_id, etag, cuerpo)
+    return _json_cacheable(cuerpo, etag)
 
 
 @app.put("/leads/{lead_id}", response_model=LeadOut)
 def update_lead(lead_id: int, lead: LeadUpdate, db: sqlite3.Connection = Depends(get_db)):
     cur = db.execute("SELECT * FROM leads WHERE id = ?", (lead_id,))
-    if cur.fetchone() is None:
+    anterior = row_to_dict(cur.fetchone())
+    if anterior is None:
         raise HTTPException(status_code=404, detail="Lead no encontrado")
 
     data = lead.dict(exclude_unset=True)
@@ -163,16 +810,36 @@ def update_lead(lead_id: int, lead: LeadUpdate, db: sqlite3.Connection = Depends
         row = cur.fetchone()
         return row_to_dict(row)
 
-    set_clause = ", ".join(f"{k} = ?" for k in data.keys())
+    if "email" in data:
+        data["email_norm"] = normalize_email(data["email"])
+    data["actualizado_en"] = datetime.now().isoformat(timespec="seconds")
+    set_clause = ", ".join(f"{k} = ?" for k in data.keys()) + ", version = version + 1"
     values = list(data.values())
     values.append(lead_id)
 
-    db.execute(f"UPDATE leads SET {set_clause} WHERE id = ?", values)
+    # La segmentación guardada para el texto anterior ya no se usará
+    texto_cambiado = any(campo in data and data[campo] != anterior[campo] for campo in SEGMENTATION_FIELDS)
+    if texto_cambiado:
+        segmentation_cache.invalidate(db, anterior)
+
+    try:
+        db.execute(f"UPDATE leads SET {set_clause} WHERE id = ?", values)
+    except sqlite3.IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Ya existe otro lead con ese email")
     db.commit()
+    response_cache.invalidate_leads([lead_id])
+    # Si la petición fija la segmentación a mano, se respeta
+    if texto_cambiado and not any(data.get(c) for c in ("etapa_funnel", "temperatura", "tipo_contacto")):
+        autosegmenter.enqueue([lead_id])
 
     cur = db.execute("SELECT * FROM leads WHERE id = ?", (lead_id,))
-    row = cur.fetchone()
-    return row_to_dict(row)
+    resultado = row_to_dict(cur.fetchone())
+    if resultado is None:
+        # Borrado por otra petición entre la lectura inicial y esta
+        raise HTTPException(status_code=404, detail="Lead no encontrado")
+    event_bus.publish("lead.actualizado", {"lead_id": lead_id, "lead": lead_event_data(resultado)})
+    return resultado
 
 
 @app.delete("/leads/{lead_id}", status_code=204)
@@ -183,105 +850,465 @@ def delete_lead(lead_id: int, db: sqlite3.Connection = Depends(get_db)):
     db.execute("DELETE FROM interacciones WHERE lead_id = ?", (lead_id,))
     db.execute("DELETE FROM leads WHERE id = ?", (lead_id,))
     db.commit()
+    response_cache.invalidate_leads([lead_id])
+    event_bus.publish("lead.eliminado", {"lead_id": lead_id})
     return
 
 
 # ======== Endpoints Interacciones ========
 
 @app.get("/leads/{lead_id}/interacciones", response_model=List[InteraccionOut])
-def list_interacciones(lead_id: int, db: sqlite3.Connection = Depends(get_db)):
-    cur = db.execute("SELECT * FROM interacciones WHERE lead_id = ? ORDER BY fecha ASC", (lead_id,))
-    rows = cur.fetchall()
+def list_interacciones(
+    lead_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = Query(None, description="Valor de X-Next-Before para ver interacciones más antiguas"),
+    db: sqlite3.Connection = Depends(get_db),
+):
+    """
+    Devuelve las `limit` interacciones más recientes (o las anteriores a `before`)
+    en orden cronológico. Si quedan más antiguas, la cabecera X-Next-Before trae
+    el cursor para pedirlas.
+    """
+    where = "lead_id = ?"
+    params: list = [lead_id]
+    if before:
+        try:
+            fecha, ultimo_id = decode_cursor(before, 2)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        where += " AND (fecha, id) < (?, ?)"
+        params += [fecha, ultimo_id]
+
+    columnas = INTERACCION_OUT_ENCODER.columnas
+    rows = fetch_rows(
+        db,
+        f"SELECT {INTERACCION_OUT_ENCODER.select} FROM interacciones WHERE {where} ORDER BY fecha DESC, id DESC LIMIT ?",
+        params + [limit + 1],
+        tuplas=FAST_JSON,
+    )
+    cabeceras = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cabeceras["X-Next-Before"] = encode_cursor(rows[-1][columnas.index("fecha")], rows[-1][columnas.index("id")])
+    rows.reverse()
+    if FAST_JSON:
+        return Response(INTERACCION_OUT_ENCODER.encode_many(rows), media_type="application/json", headers=cabeceras)
+    response.headers.update(cabeceras)
     return [row_to_dict(r) for r in rows]
 
 
-@app.post("/leads/{lead_id}/interacciones", response_model=InteraccionOut, status_code=201)
-def create_interaccion(lead_id: int, inter: InteraccionCreate, db: sqlite3.Connection = Depends(get_db)):
-    cur = db.execute("SELECT * FROM leads WHERE id = ?", (lead_id,))
-    if cur.fetchone() is None:
-        raise HTTPException(status_code=404, detail="Lead no encontrado")
+def _guardar_interaccion(fila) -> Dict:
+    with pool.connection() as db:
+        if db.execute("SELECT 1 FROM leads WHERE id = ?", (fila[0],)).fetchone() is None:
+            raise LeadNotFound(fila[0])
+        resultado = insert_interaccion(db, fila)
+        db.commit()
+    return resultado
 
+
+@app.post("/leads/{lead_id}/interacciones", response_model=InteraccionOut, status_code=201)
+async def create_interaccion(lead_id: int, inter: InteraccionCreate):
+    """
+    Con LEADFLOW_WRITE_BEHIND=1 la fila pasa por el escritor de
+    write_behind (commit agrupado); en ambos casos se responde después del
+    commit.
+    """
     ahora = datetime.now().isoformat(timespec="seconds")
-    cur = db.execute(
-        """
-        INSERT INTO interacciones (
-            lead_id, canal, rol, mensaje, tipo, resultado, fecha
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            lead_id,
-            inter.canal,
-            inter.rol,
-            inter.mensaje,
-            inter.tipo,
-            inter.resultado,
-            ahora,
-        ),
-    )
-    db.commit()
-    new_id = cur.lastrowid
-    cur = db.execute("SELECT * FROM interacciones WHERE id = ?", (new_id,))
-    row = cur.fetchone()
-    return row_to_dict(row)
+    fila = (lead_id, inter.canal, inter.rol, inter.mensaje, inter.tipo, inter.resultado, ahora)
+    try:
+        if interaction_writer.active:
+            with stage("db"):
+                resultado = await interaction_writer.write(fila)
+        else:
+            resultado = await run_in_threadpool(_guardar_interaccion, fila)
+    except LeadNotFound:
+        raise HTTPException(status_code=404, detail="Lead no encontrado")
+    except WriteBehindFull:
+        raise HTTPException(
+            status_code=503, detail="Cola de escritura llena, reintenta en unos segundos", headers={"Retry-After": "1"}
+        )
+    event_bus.publish("interaccion.creada", {"lead_id": lead_id, "interaccion": interaccion_event_data(resultado)})
+    return resultado
 
 
 # ======== Endpoints IA: segmentación + siguiente mensaje ========
 
-@app.post("/leads/{lead_id}/segmentar", response_model=SegmentacionOut)
-def segmentar_lead(lead_id: int, db: sqlite3.Connection = Depends(get_db)):
-    cur = db.execute("SELECT * FROM leads WHERE id = ?", (lead_id,))
-    row = cur.fetchone()
+@app.post("/leads/segmentar", response_model=SegmentacionMasivaOut)
+def segmentar_leads(req: SegmentacionMasivaRequest, db: sqlite3.Connection = Depends(get_db)):
+    """
+    Segmenta en bloque los leads seleccionados (por ids, filtros o solo los
+    que aún no están segmentados). Cada bloque se escribe con executemany
+    dentro de una única transacción.
+    """
+    where, params = build_lead_filter(req.dict(), ids=req.ids, solo_sin_segmentar=req.solo_sin_segmentar)
+
+    inicio = time.perf_counter()
+    bloques = []
+    total = 0
+    for numero, filas in enumerate(iter_lead_chunks(db, where, params, req.tamano_bloque), start=1):
+        t0 = time.perf_counter()
+        segmentaciones = _segmentar_con_cache(db, [row_to_dict(fila) for fila in filas])
+        resultados = [(fila["id"], seg) for fila, seg in zip(filas, segmentaciones)]
+        save_segmentations(db, resultados)
+        db.commit()
+        response_cache.invalidate_leads(lead_id for lead_id, _ in resultados)
+        publish_segmentations(resultados)
+        segundos = time.perf_counter() - t0
+        total += len(resultados)
+        bloques.append(
+            {
+                "bloque": numero,
+                "procesados": len(resultados),
+                "acumulado": total,
+                "segundos": round(segundos, 4),
+                "leads_por_segundo": round(len(resultados) / segundos, 1) if segundos else 0.0,
+            }
+        )
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "total": total,
+        "segundos": round(segundos, 4),
+        "leads_por_segundo": round(total / segundos, 1) if segundos else 0.0,
+        "bloques": bloques,
+    }
+
+
+def _leer_lead(lead_id: int) -> dict:
+    with pool.connection() as db:
+        row = db.execute("SELECT * FROM leads WHERE id = ?", (lead_id,)).fetchone()
     if row is None:
         raise HTTPException(status_code=404, detail="Lead no encontrado")
+    return row_to_dict(row)
+
 
-    lead_dict = row_to_dict(row)
-    resultado = segment_lead_with_llm(lead_dict)
+def _guardar_segmentacion(lead_id: int, resultado: dict) -> None:
+    with pool.connection() as db:
+        save_segmentations(db, [(lead_id, resultado)])
+        db.commit()
+    response_cache.invalidate_leads([lead_id])
+    publish_segmentations([(lead_id, resultado)])
+
+
+@app.post("/leads/{lead_id}/segmentar", response_model=SegmentacionOut)
+async def segmentar_lead(lead_id: int):
+    # Las consultas van al threadpool; la llamada al proveedor LLM se espera
+    # en el event loop sin ocupar un hilo mientras dura
+    lead_dict = await run_in_threadpool(_leer_lead, lead_id)
+    resultado = (await segment_leads_cached_async([lead_dict], llm_provider))[0]
 
     # Guardar en la BD
-    db.execute(
-        """
-        UPDATE leads
-        SET etapa_funnel = ?, temperatura = ?, tipo_contacto = ?
-        WHERE id = ?
-        """,
-        (
-            resultado["etapa_funnel"],
-            resultado["temperatura"],
-            resultado["tipo_contacto"],
-            lead_id,
-        ),
-    )
-    db.commit()
+    await run_in_threadpool(_guardar_segmentacion, lead_id, resultado)
 
     return resultado
 
 
-@app.post("/leads/{lead_id}/siguiente-mensaje", response_model=NextMessageResponse)
-def siguiente_mensaje(
-    lead_id: int,
-    req: NextMessageRequest,
-    db: sqlite3.Connection = Depends(get_db),
-):
-    # Obtener lead
-    cur = db.execute("SELECT * FROM leads WHERE id = ?", (lead_id,))
-    row = cur.fetchone()
-    if row is None:
-        raise HTTPException(status_code=404, detail="Lead no encontrado")
-    lead_dict = row_to_dict(row)
+def _leer_lead_e_historial(lead_id: int):
+    lead_dict = _leer_lead(lead_id)
+    with pool.connection() as db:
+        # Últimas interacciones (por ahora no las usamos mucho, pero podrían usarse en la LLM)
+        cur = db.execute(
+            "SELECT * FROM interacciones WHERE lead_id = ? ORDER BY fecha DESC LIMIT 5",
+            (lead_id,),
+        )
+        interacciones = [row_to_dict(r) for r in cur.fetchall()]
+    return lead_dict, interacciones
 
-    # Últimas interacciones (por ahora no las usamos mucho, pero podrían usarse en la LLM)
-    cur = db.execute(
-        "SELECT * FROM interacciones WHERE lead_id = ? ORDER BY fecha DESC LIMIT 5",
-        (lead_id,),
-    )
-    interacciones = [row_to_dict(r) for r in cur.fetchall()]
 
-    mensaje = generate_next_message_with_llm(
-        lead=lead_dict,
-        last_interactions=interacciones,
+@app.post("/leads/{lead_id}/siguiente-mensaje", response_model=NextMessageResponse)
+async def siguiente_mensaje(lead_id: int, req: NextMessageRequest):
+    # Obtener lead + últimas interacciones
+    lead_dict, interacciones = await run_in_threadpool(_leer_lead_e_historial, lead_id)
+
+    mensaje = await llm_provider.generate_message(
+        lead_dict,
+        interacciones,
         canal=req.canal,
         objetivo=req.objetivo,
         tono=req.tono,
     )
 
     return mensaje
+
+
+# ======== Campañas ========
+
+def _leer_bloque_campana(where: str, params: list, desde_id: int, n: int):
+    with pool.connection() as db:
+        return leads_with_history_chunk(db, where, params, desde_id, n)
+
+
+def _persistir_mensajes(mensajes, objetivo: str) -> List[int]:
+    with pool.connection() as db:
+        ids = save_generated_messages(db, mensajes, objetivo)
+    event_bus.publish("interacciones.creadas", {"lead_ids": [lead["id"] for lead, _, _ in mensajes]})
+    return ids
+
+
+async def _generar_campana(req: CampanaRequest):
+    where, params = build_lead_filter(
+        req.filtro.dict(), ids=req.filtro.ids, solo_sin_segmentar=req.filtro.solo_sin_segmentar
+    )
+    inicio = time.perf_counter()
+    total = persistidos = 0
+    ultimo_id = 0
+    while req.limite is None or total < req.limite:
+        n = req.tamano_bloque if req.limite is None else min(req.tamano_bloque, req.limite - total)
+        bloque = await run_in_threadpool(_leer_bloque_campana, where, params, ultimo_id, n)
+        if not bloque:
+            break
+        ultimo_id = bloque[-1][0]["id"]
+
+        # El proveedor LLM limita la concurrencia (semáforo) cuando es remoto
+        mensajes = await asyncio.gather(
+            *(
+                llm_provider.generate_message(lead, historial, req.canal, req.objetivo, req.tono)
+                for lead, historial in bloque
+            )
+        )
+        ids = [None] * len(mensajes)
+        if req.persistir:
+            ids = await run_in_threadpool(
+                _persistir_mensajes,
+                [(lead, historial, m) for (lead, historial), m in zip(bloque, mensajes)],
+                req.objetivo,
+            )
+            persistidos += len(ids)
+
+        total += len(mensajes)
+        yield "".join(
+            json.dumps({"lead_id": lead["id"], "interaccion_id": i_id, **m}, ensure_ascii=False) + "\n"
+            for (lead, _), m, i_id in zip(bloque, mensajes, ids)
+        )
+
+    segundos = time.perf_counter() - inicio
+    yield json.dumps(
+        {
+            "resumen": {
+                "total": total,
+                "persistidos": persistidos,
+                "segundos": round(segundos, 4),
+                "mensajes_por_segundo": round(total / segundos, 1) if segundos else 0.0,
+            }
+        }
+    ) + "\n"
+
+
+@app.post("/campaigns/mensajes")
+async def campana_mensajes(req: CampanaRequest):
+    """
+    Genera el siguiente mensaje para todos los leads del filtro y los
+    devuelve en streaming como NDJSON (una línea por lead y una última
+    línea "resumen"). Los leads y sus 5 últimas interacciones se leen por
+    bloques con una sola consulta de ventana; con persistir=true los
+    mensajes se guardan como interacciones con un executemany por bloque.
+    """
+    return StreamingResponse(_generar_campana(req), media_type="application/x-ndjson")
+
+
+# ======== Trabajos en segundo plano ========
+
+JOB_PARAMETROS = {
+    "segmentar": SegmentacionMasivaRequest,
+    "mensajes": CampanaRequest,
+    "prioridad": PrioridadJobRequest,
+}
+
+
+@app.post("/jobs", response_model=JobOut, status_code=202)
+def encolar_job(req: JobRequest, db: sqlite3.Connection = Depends(get_db)):
+    """
+    Encola una segmentación masiva, una generación de mensajes de campaña o
+    un recálculo de prioridades para worker.py. La respuesta vuelve al instante; el avance se consulta
+    en GET /jobs/{id}.
+    """
+    try:
+        parametros = JOB_PARAMETROS[req.tipo](**req.parametros)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=_describir_error(exc))
+    job_id = create_job(db, req.tipo, parametros.dict())
+    db.commit()
+    return get_job(db, job_id)
+
+
+@app.get("/jobs/{job_id}", response_model=JobOut)
+def ver_job(job_id: int, db: sqlite3.Connection = Depends(get_db)):
+    """Estado, progreso (procesados / total) y rendimiento (leads por segundo de proceso) de un trabajo."""
+    job = get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+# ======== Exportación ========
+
+@app.get("/export/leads")
+def export_leads(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    updated_since: Optional[str] = Query(None, description="Solo leads con actualizado_en >= este valor ISO"),
+    batch_size: int = Query(1000, ge=1, le=20000),
+):
+    """Exporta leads en streaming (NDJSON o CSV), ordenados por (actualizado_en, id)."""
+    return StreamingResponse(
+        iter_export("leads", "actualizado_en", LEAD_COLUMNS, formato, updated_since, batch_size),
+        media_type=EXPORT_MEDIA_TYPES[formato],
+    )
+
+
+@app.get("/export/interacciones")
+def export_interacciones(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    updated_since: Optional[str] = Query(None, description="Solo interacciones con fecha >= este valor ISO"),
+    batch_size: int = Query(1000, ge=1, le=20000),
+):
+    """Exporta interacciones en streaming (NDJSON o CSV), ordenadas por (fecha, id)."""
+    return StreamingResponse(
+        iter_export("interacciones", "fecha", INTERACCION_OUT_ENCODER.columnas, formato, updated_since, batch_size),
+        media_type=EXPORT_MEDIA_TYPES[formato],
+    )
+
+
+# ======== Métricas ========
+
+@app.get("/metrics/funnel", response_model=MetricasFunnelOut)
+def metrics_funnel(
+    desde: Optional[str] = Query(None, description="Día inicial incluido (YYYY-MM-DD)"),
+    hasta: Optional[str] = Query(None, description="Día final incluido (YYYY-MM-DD)"),
+    sector: Optional[str] = None,
+    canal: Optional[str] = None,
+    db: sqlite3.Connection = Depends(get_db),
+):
+    """
+    Embudo etapa × temperatura, leads por sector y por día, y tasa de
+    respuesta por canal/resultado. Se lee de las tablas resumen que
+    mantienen los triggers, no de leads/interacciones.
+    """
+    for valor in (desde, hasta):
+        if valor:
+            try:
+                datetime.strptime(valor, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
+    return funnel_metrics(db, desde=desde, hasta=hasta, sector=sector, canal=canal)
+
+
+# ======== Eventos en vivo ========
+
+@app.get("/events")
+async def eventos(
+    request: Request,
+    since: Optional[int] = Query(None, description="Id del último evento recibido; se repiten los posteriores"),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events con los cambios de leads e interacciones (lead.creado,
+    lead.actualizado, lead.eliminado, lead.segmentado, leads.creados,
+    leads.segmentados, interaccion.creada, interacciones.creadas). Al
+    reconectar, EventSource envía Last-Event-ID y se repite lo perdido; si
+    ya no está en el buffer llega un evento "reset" y hay que recargar.
+    """
+    desde = since
+    if desde is None and last_event_id:
+        # Un Last-Event-ID ilegible equivale a uno demasiado antiguo: reset
+        desde = int(last_event_id) if last_event_id.isdigit() else 0
+    return StreamingResponse(
+        sse_stream(request, desde),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ======== Estado interno ========
+
+@app.get("/stats/db-pool")
+def db_pool_stats():
+    """Contadores del pool de conexiones: checkouts, esperas, timeouts y latencia de checkout."""
+    return pool.stats()
+
+
+@app.get("/stats/llm")
+def llm_stats():
+    """Proveedor LLM activo y, si es remoto, llamadas, reintentos, timeouts y fallbacks."""
+    return llm_provider.stats()
+
+
+@app.get("/stats/segmentation-cache")
+def segmentation_cache_stats():
+    """Aciertos (memoria / SQLite), fallos e invalidaciones de la caché de segmentación."""
+    return segmentation_cache.stats()
+
+
+@app.get("/stats/autosegment")
+def autosegment_stats():
+    """Cola de segmentación automática: encolados, pendientes, tamaño medio de lote y espera hasta guardar."""
+    return autosegmenter.stats()
+
+
+@app.get("/stats/write-behind")
+def write_behind_stats():
+    """Escritura diferida de interacciones: pendientes, lotes, tamaño medio de lote, commit y espera hasta confirmar."""
+    return interaction_writer.stats()
+
+
+@app.get("/stats/events")
+def events_stats():
+    """Eventos publicados, ocupación del buffer de repetición y streams abiertos."""
+    return event_bus.stats()
+
+
+@app.get("/stats/response-cache")
+def response_cache_stats():
+    """Respuestas 304, aciertos y fallos de la caché de GET /leads y GET /leads/{id}."""
+    return response_cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Peticiones y latencias por ruta y por etapa, en formato de texto de Prometheus (LEADFLOW_METRICS)."""
+    return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+# ======== Diagnóstico (LEADFLOW_ADMIN_TOKEN) ========
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Los endpoints /debug/* exigen la cabecera X-Admin-Token; sin LEADFLOW_ADMIN_TOKEN no existen."""
+    if not admin_token_ok(x_admin_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.get("/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def debug_profile(
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100, description="Milisegundos entre muestras"),
+    idle: bool = Query(False, description="Incluir los hilos en reposo"),
+):
+    """
+    Perfil por muestreo de todos los hilos durante `seconds` segundos, con
+    el tráfico real. Devuelve pilas colapsadas (`hilo;marco;... cuenta`)
+    para flamegraph.pl, speedscope o inferno.
+    """
+    try:
+        perfil = await run_in_threadpool(profiler.profile, seconds, interval_ms / 1000, idle)
+    except ProfilerBusy as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    nombre = datetime.now().strftime("leadflow-%Y%m%d-%H%M%S.folded")
+    return PlainTextResponse(
+        collapsed(perfil["pilas"]),
+        headers={
+            "Content-Disposition": f'attachment; filename="{nombre}"',
+            "X-Profile-Samples": str(perfil["muestras"]),
+            "X-Profile-Seconds": str(perfil["segundos"]),
+        },
+    )
+
+
+@app.get("/debug/slow-queries", dependencies=[Depends(require_admin)])
+def debug_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """Sentencias SQL más lentas que LEADFLOW_SLOW_QUERY_MS, las más recientes primero, con su plan."""
+    return {**slow_query_log.stats(), "consultas": slow_query_log.entries(limit)}
+
+
+@app.delete("/debug/slow-queries", status_code=204, dependencies=[Depends(require_admin)])
+def debug_slow_queries_clear():
+    slow_query_log.clear()
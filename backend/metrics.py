@@ -0,0 +1,187 @@
+"""
+Métricas comerciales precalculadas.
+
+metricas_leads y metricas_interacciones (models.sql) son contadores que
+mantienen los triggers de SQLite en cada INSERT/UPDATE/DELETE, así que
+cubren todos los caminos de escritura (alta, edición, segmentación,
+carga masiva, interacciones, borrado) sin tocar los endpoints.
+/metrics/funnel solo suma filas de esas tablas, que crecen con
+días × combinaciones y no con el número de leads.
+
+Uso:
+    python metrics.py --reconstruir   # recalcula desde leads/interacciones
+    python metrics.py --verificar     # compara contra las tablas origen
+"""
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+# Resultados de una interacción del agente que cuentan como respuesta del lead
+RESULTADOS_RESPUESTA = ("respondio", "cerro_llamada")
+
+# (tabla resumen, columnas clave, SELECT que la calcula desde cero)
+RESUMENES = [
+    (
+        "metricas_leads",
+        ("dia", "etapa_funnel", "temperatura", "sector"),
+        """
+        SELECT COALESCE(substr(creado_en, 1, 10), ''), COALESCE(etapa_funnel, ''),
+               COALESCE(temperatura, ''), COALESCE(sector, ''), COUNT(*)
+        FROM leads
+        GROUP BY 1, 2, 3, 4
+        """,
+    ),
+    (
+        "metricas_interacciones",
+        ("dia", "canal", "rol", "resultado"),
+        """
+        SELECT COALESCE(substr(fecha, 1, 10), ''), COALESCE(canal, ''),
+               COALESCE(rol, ''), COALESCE(resultado, ''), COUNT(*)
+        FROM interacciones
+        GROUP BY 1, 2, 3, 4
+        """,
+    ),
+]
+
+
+def rebuild_metrics(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Vacía y recalcula las tablas resumen en una sola transacción."""
+    filas = {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for tabla, claves, consulta in RESUMENES:
+            conn.execute(f"DELETE FROM {tabla}")
+            columnas = ", ".join(claves + ("total",))
+            cur = conn.execute(f"INSERT INTO {tabla} ({columnas}) {consulta}")
+            filas[tabla] = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return filas
+
+
+def verify_metrics(conn: sqlite3.Connection) -> Dict[str, List[Tuple]]:
+    """
+    Compara cada tabla resumen con lo que sale de las tablas origen.
+    Devuelve, por tabla, las claves con diferencias como
+    (*clave, total_resumen, total_real); vacío si todo cuadra.
+    """
+    diferencias = {}
+    for tabla, claves, consulta in RESUMENES:
+        columnas = ", ".join(claves)
+        guardado = {fila[:-1]: fila[-1] for fila in conn.execute(f"SELECT {columnas}, total FROM {tabla}")}
+        real = {fila[:-1]: fila[-1] for fila in conn.execute(consulta)}
+        diferencias[tabla] = [
+            clave + (guardado.get(clave, 0), real.get(clave, 0))
+            for clave in sorted(guardado.keys() | real.keys())
+            if guardado.get(clave, 0) != real.get(clave, 0)
+        ]
+    return diferencias
+
+
+def _rango(desde: Optional[str], hasta: Optional[str]) -> Tuple[List[str], List]:
+    condiciones, params = [], []
+    if desde:
+        condiciones.append("dia >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append("dia <= ?")
+        params.append(hasta)
+    return condiciones, params
+
+
+def _valor(v: str) -> Optional[str]:
+    # '' es el centinela de NULL en las tablas resumen
+    return v or None
+
+
+def funnel_metrics(
+    conn: sqlite3.Connection,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    sector: Optional[str] = None,
+    canal: Optional[str] = None,
+) -> Dict:
+    condiciones, params = _rango(desde, hasta)
+    if sector is not None:
+        condiciones.append("sector = ?")
+        params.append(sector)
+    where = " AND ".join(condiciones) or "1 = 1"
+
+    def agrupar(columnas: str) -> List[sqlite3.Row]:
+        return conn.execute(
+            f"SELECT {columnas}, SUM(total) FROM metricas_leads WHERE {where} GROUP BY {columnas} ORDER BY {columnas}",
+            params,
+        ).fetchall()
+
+    embudo = [
+        {"etapa_funnel": _valor(etapa), "temperatura": _valor(temp), "total": total}
+        for etapa, temp, total in agrupar("etapa_funnel, temperatura")
+    ]
+    por_sector = [{"sector": _valor(s), "total": total} for s, total in agrupar("sector")]
+    por_dia = [{"dia": _valor(d), "total": total} for d, total in agrupar("dia")]
+
+    # Tasa de respuesta: de los mensajes del agente, cuántos obtuvieron respuesta
+    condiciones, params = _rango(desde, hasta)
+    condiciones.append("rol = 'agente'")
+    if canal is not None:
+        condiciones.append("canal = ?")
+        params.append(canal)
+    filas = conn.execute(
+        f"""
+        SELECT canal, resultado, SUM(total) FROM metricas_interacciones
+        WHERE {" AND ".join(condiciones)}
+        GROUP BY canal, resultado ORDER BY canal, resultado
+        """,
+        params,
+    ).fetchall()
+
+    canales: Dict[str, Dict] = {}
+    for canal_fila, resultado, total in filas:
+        c = canales.setdefault(
+            canal_fila,
+            {"canal": _valor(canal_fila), "enviados": 0, "respuestas": 0, "por_resultado": {}},
+        )
+        c["enviados"] += total
+        if resultado in RESULTADOS_RESPUESTA:
+            c["respuestas"] += total
+        c["por_resultado"][resultado or "sin_registrar"] = total
+    for c in canales.values():
+        c["tasa_respuesta"] = round(c["respuestas"] / c["enviados"], 4) if c["enviados"] else 0.0
+
+    return {
+        "total_leads": sum(fila["total"] for fila in por_sector),
+        "embudo": embudo,
+        "por_sector": por_sector,
+        "por_dia": por_dia,
+        "respuesta_por_canal": list(canales.values()),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from init_db import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Reconstruye o verifica las métricas precalculadas")
+    parser.add_argument("--reconstruir", action="store_true", help="Recalcula las tablas resumen desde cero")
+    parser.add_argument("--verificar", action="store_true", help="Compara las tablas resumen con leads/interacciones")
+    args = parser.parse_args()
+    if not (args.reconstruir or args.verificar):
+        parser.error("indica --reconstruir y/o --verificar")
+
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    if args.reconstruir:
+        for tabla, n in rebuild_metrics(conn).items():
+            print(f"✅ {tabla}: {n} filas")
+    if args.verificar:
+        diferencias = verify_metrics(conn)
+        errores = sum(len(d) for d in diferencias.values())
+        for tabla, filas in diferencias.items():
+            for fila in filas[:20]:
+                print(f"❌ {tabla} {fila[:-2]}: resumen={fila[-2]} real={fila[-1]}")
+        print("✅ Métricas correctas" if not errores else f"❌ {errores} diferencias")
+        conn.close()
+        sys.exit(1 if errores else 0)
+    conn.close()
@@ -0,0 +1,99 @@
+"""
+Servidor HTTP local que imita un servicio LLM para probar el backend
+"http" sin red ni costes. Responde con el motor de reglas de llm_service
+después de una latencia simulada (y, opcionalmente, con errores aleatorios).
+
+Uso:
+    python mock_llm_server.py --port 8100 --latencia-ms 300 --jitter-ms 100
+    LEADFLOW_LLM_BACKEND=http LEADFLOW_LLM_URL=http://127.0.0.1:8100 uvicorn main:app
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_service import segment_lead_with_llm, generate_next_message_with_llm
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    latencia_ms = 300.0
+    jitter_ms = 100.0
+    latencia_por_item_ms = 5.0
+    tasa_error = 0.0
+
+    def _esperar(self, items: int = 1) -> None:
+        ms = self.latencia_ms + random.uniform(-self.jitter_ms, self.jitter_ms) + self.latencia_por_item_ms * (items - 1)
+        time.sleep(max(ms, 0) / 1000)
+
+    def _responder(self, estado: int, cuerpo) -> None:
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        try:
+            cuerpo = json.loads(self.rfile.read(largo) or b"{}")
+        except ValueError:
+            self._responder(400, {"detail": "JSON inválido"})
+            return
+
+        if self.path == "/v1/segment":
+            self._esperar()
+            respuesta = segment_lead_with_llm(cuerpo["lead"])
+        elif self.path == "/v1/segment/batch":
+            self._esperar(len(cuerpo["leads"]))
+            respuesta = {"resultados": [segment_lead_with_llm(lead) for lead in cuerpo["leads"]]}
+        elif self.path == "/v1/message":
+            self._esperar()
+            respuesta = generate_next_message_with_llm(
+                lead=cuerpo["lead"],
+                last_interactions=cuerpo.get("last_interactions") or [],
+                canal=cuerpo["canal"],
+                objetivo=cuerpo["objetivo"],
+                tono=cuerpo.get("tono"),
+            )
+        else:
+            self._responder(404, {"detail": "Ruta no encontrada"})
+            return
+
+        if random.random() < self.tasa_error:
+            self._responder(503, {"detail": "Error simulado"})
+            return
+        self._responder(200, respuesta)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor LLM simulado para Lead Flow AI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latencia-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--latencia-por-item-ms", type=float, default=5.0, help="Coste extra por lead en /v1/segment/batch")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de respuestas 503 (0-1)")
+    args = parser.parse_args()
+
+    MockLLMHandler.latencia_ms = args.latencia_ms
+    MockLLMHandler.jitter_ms = args.jitter_ms
+    MockLLMHandler.latencia_por_item_ms = args.latencia_por_item_ms
+    MockLLMHandler.tasa_error = args.tasa_error
+
+    servidor = ThreadingHTTPServer((args.host, args.port), MockLLMHandler)
+    print(f"🤖 LLM simulado en http://{args.host}:{args.port} (latencia {args.latencia_ms} ms)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,13 @@ CREATE TABLE IF NOT EXISTS leads (
     temperatura TEXT,    -- frio / tibio / caliente
     tipo_contacto TEXT,  -- lead / oportunidad / cliente
     estado TEXT,         -- nuevo / en_proceso / ganado / perdido
-    creado_en TEXT       -- ISO timestamp
+    creado_en TEXT,      -- ISO timestamp
+    actualizado_en TEXT, -- ISO timestamp de la última escritura (marca de agua de exportación)
+    email_norm TEXT,     -- email normalizado (minúsculas, sin espacios) para deduplicar
+    version INTEGER NOT NULL DEFAULT 1, -- sube en cada UPDATE (trigger); da el ETag de GET /leads/{id}
+    ultima_interaccion_en TEXT,  -- fecha de la interacción más reciente (trigger de interacciones)
+    ultimo_resultado TEXT,       -- su resultado
+    prioridad REAL               -- puntuación de GET /leads/next (ver "Prioridad" más abajo)
 );
 
 -- Tabla de interacciones
@@ -27,3 +33,303 @@ CREATE TABLE IF NOT EXISTS interacciones (
     fecha TEXT,          -- ISO timestamp
     FOREIGN KEY (lead_id) REFERENCES leads (id)
 );
+
+-- Índices para el listado paginado por (creado_en, id) y sus filtros
+CREATE INDEX IF NOT EXISTS idx_leads_creado ON leads (creado_en, id);
+CREATE INDEX IF NOT EXISTS idx_leads_etapa_creado ON leads (etapa_funnel, creado_en, id);
+CREATE INDEX IF NOT EXISTS idx_leads_temperatura_creado ON leads (temperatura, creado_en, id);
+CREATE INDEX IF NOT EXISTS idx_leads_tipo_creado ON leads (tipo_contacto, creado_en, id);
+CREATE INDEX IF NOT EXISTS idx_leads_estado_creado ON leads (estado, creado_en, id);
+CREATE INDEX IF NOT EXISTS idx_leads_sector_creado ON leads (sector, creado_en, id);
+CREATE INDEX IF NOT EXISTS idx_leads_fuente_creado ON leads (fuente, creado_en, id);
+
+-- Índices para exportaciones incrementales (updated_since)
+CREATE INDEX IF NOT EXISTS idx_leads_actualizado ON leads (actualizado_en, id);
+CREATE INDEX IF NOT EXISTS idx_interacciones_fecha ON interacciones (fecha, id);
+
+-- Un solo lead por email normalizado (los NULL no cuentan como duplicados)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_email_norm ON leads (email_norm);
+
+-- Respuestas guardadas por Idempotency-Key
+CREATE TABLE IF NOT EXISTS idempotencia (
+    ruta TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    estado_http INTEGER NOT NULL,
+    respuesta TEXT NOT NULL,  -- JSON
+    creado_en TEXT,
+    PRIMARY KEY (ruta, clave)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotencia_creado ON idempotencia (creado_en);
+
+-- Caché persistente de segmentaciones (clave = hash de los campos de entrada + versión de reglas)
+CREATE TABLE IF NOT EXISTS segmentacion_cache (
+    clave TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    resultado TEXT NOT NULL,  -- JSON de SegmentacionOut
+    creado_en TEXT
+);
+
+-- Historial por lead: filtro por lead_id y orden por fecha sin escanear la tabla
+CREATE INDEX IF NOT EXISTS idx_interacciones_lead_fecha ON interacciones (lead_id, fecha, id);
+
+-- ======== Métricas precalculadas (dashboard) ========
+-- Contadores que mantienen los triggers de abajo en cada escritura, para que
+-- /metrics/funnel no tenga que agrupar leads e interacciones en cada consulta.
+-- Los NULL se guardan como '' para que la clave primaria agrupe bien.
+CREATE TABLE IF NOT EXISTS metricas_leads (
+    dia TEXT NOT NULL,           -- YYYY-MM-DD de creado_en
+    etapa_funnel TEXT NOT NULL,
+    temperatura TEXT NOT NULL,
+    sector TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (dia, etapa_funnel, temperatura, sector)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS metricas_interacciones (
+    dia TEXT NOT NULL,           -- YYYY-MM-DD de fecha
+    canal TEXT NOT NULL,
+    rol TEXT NOT NULL,
+    resultado TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (dia, canal, rol, resultado)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_metricas_leads_insert AFTER INSERT ON leads
+BEGIN
+    INSERT INTO metricas_leads (dia, etapa_funnel, temperatura, sector, total)
+    VALUES (COALESCE(substr(NEW.creado_en, 1, 10), ''), COALESCE(NEW.etapa_funnel, ''),
+            COALESCE(NEW.temperatura, ''), COALESCE(NEW.sector, ''), 1)
+    ON CONFLICT (dia, etapa_funnel, temperatura, sector) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_metricas_leads_delete AFTER DELETE ON leads
+BEGIN
+    UPDATE metricas_leads SET total = total - 1
+    WHERE dia = COALESCE(substr(OLD.creado_en, 1, 10), '') AND etapa_funnel = COALESCE(OLD.etapa_funnel, '')
+      AND temperatura = COALESCE(OLD.temperatura, '') AND sector = COALESCE(OLD.sector, '');
+    DELETE FROM metricas_leads
+    WHERE dia = COALESCE(substr(OLD.creado_en, 1, 10), '') AND etapa_funnel = COALESCE(OLD.etapa_funnel, '')
+      AND temperatura = COALESCE(OLD.temperatura, '') AND sector = COALESCE(OLD.sector, '') AND total <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_metricas_leads_update
+AFTER UPDATE OF creado_en, etapa_funnel, temperatura, sector ON leads
+WHEN OLD.creado_en IS NOT NEW.creado_en OR OLD.etapa_funnel IS NOT NEW.etapa_funnel
+  OR OLD.temperatura IS NOT NEW.temperatura OR OLD.sector IS NOT NEW.sector
+BEGIN
+    UPDATE metricas_leads SET total = total - 1
+    WHERE dia = COALESCE(substr(OLD.creado_en, 1, 10), '') AND etapa_funnel = COALESCE(OLD.etapa_funnel, '')
+      AND temperatura = COALESCE(OLD.temperatura, '') AND sector = COALESCE(OLD.sector, '');
+    DELETE FROM metricas_leads
+    WHERE dia = COALESCE(substr(OLD.creado_en, 1, 10), '') AND etapa_funnel = COALESCE(OLD.etapa_funnel, '')
+      AND temperatura = COALESCE(OLD.temperatura, '') AND sector = COALESCE(OLD.sector, '') AND total <= 0;
+    INSERT INTO metricas_leads (dia, etapa_funnel, temperatura, sector, total)
+    VALUES (COALESCE(substr(NEW.creado_en, 1, 10), ''), COALESCE(NEW.etapa_funnel, ''),
+            COALESCE(NEW.temperatura, ''), COALESCE(NEW.sector, ''), 1)
+    ON CONFLICT (dia, etapa_funnel, temperatura, sector) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_metricas_interacciones_insert AFTER INSERT ON interacciones
+BEGIN
+    INSERT INTO metricas_interacciones (dia, canal, rol, resultado, total)
+    VALUES (COALESCE(substr(NEW.fecha, 1, 10), ''), COALESCE(NEW.canal, ''),
+            COALESCE(NEW.rol, ''), COALESCE(NEW.resultado, ''), 1)
+    ON CONFLICT (dia, canal, rol, resultado) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_metricas_interacciones_delete AFTER DELETE ON interacciones
+BEGIN
+    UPDATE metricas_interacciones SET total = total - 1
+    WHERE dia = COALESCE(substr(OLD.fecha, 1, 10), '') AND canal = COALESCE(OLD.canal, '')
+      AND rol = COALESCE(OLD.rol, '') AND resultado = COALESCE(OLD.resultado, '');
+    DELETE FROM metricas_interacciones
+    WHERE dia = COALESCE(substr(OLD.fecha, 1, 10), '') AND canal = COALESCE(OLD.canal, '')
+      AND rol = COALESCE(OLD.rol, '') AND resultado = COALESCE(OLD.resultado, '') AND total <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_metricas_interacciones_update
+AFTER UPDATE OF fecha, canal, rol, resultado ON interacciones
+WHEN OLD.fecha IS NOT NEW.fecha OR OLD.canal IS NOT NEW.canal
+  OR OLD.rol IS NOT NEW.rol OR OLD.resultado IS NOT NEW.resultado
+BEGIN
+    UPDATE metricas_interacciones SET total = total - 1
+    WHERE dia = COALESCE(substr(OLD.fecha, 1, 10), '') AND canal = COALESCE(OLD.canal, '')
+      AND rol = COALESCE(OLD.rol, '') AND resultado = COALESCE(OLD.resultado, '');
+    DELETE FROM metricas_interacciones
+    WHERE dia = COALESCE(substr(OLD.fecha, 1, 10), '') AND canal = COALESCE(OLD.canal, '')
+      AND rol = COALESCE(OLD.rol, '') AND resultado = COALESCE(OLD.resultado, '') AND total <= 0;
+    INSERT INTO metricas_interacciones (dia, canal, rol, resultado, total)
+    VALUES (COALESCE(substr(NEW.fecha, 1, 10), ''), COALESCE(NEW.canal, ''),
+            COALESCE(NEW.rol, ''), COALESCE(NEW.resultado, ''), 1)
+    ON CONFLICT (dia, canal, rol, resultado) DO UPDATE SET total = total + 1;
+END;
+
+-- ======== Versiones para ETag / GET condicional ========
+-- leads.version sube con cada UPDATE de la fila y cambios.version con cada
+-- alta, edición o borrado de la tabla: GET /leads/{id} y GET /leads comparan
+-- If-None-Match con una sola lectura por clave primaria, sin rehacer la
+-- consulta ni serializar. Las escrituras de la API ya hacen
+-- version = version + 1; el trigger de versión solo cubre las demás (un
+-- UPDATE anidado que toca version y no dispara métricas ni FTS).
+CREATE TABLE IF NOT EXISTS cambios (
+    tabla TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO cambios (tabla, version) VALUES ('leads', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_cambios_leads_insert AFTER INSERT ON leads
+BEGIN
+    UPDATE cambios SET version = version + 1 WHERE tabla = 'leads';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cambios_leads_delete AFTER DELETE ON leads
+BEGIN
+    UPDATE cambios SET version = version + 1 WHERE tabla = 'leads';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cambios_leads_update AFTER UPDATE ON leads
+BEGIN
+    UPDATE cambios SET version = version + 1 WHERE tabla = 'leads';
+END;
+
+-- Un cambio que solo toca prioridad (triggers de prioridad, trabajo
+-- "prioridad") no es una edición del lead: no sube version
+-- (_v2: la primera versión no miraba prioridad; se sustituye en las BD que la tengan)
+DROP TRIGGER IF EXISTS trg_leads_version;
+CREATE TRIGGER IF NOT EXISTS trg_leads_version_v2 AFTER UPDATE ON leads
+WHEN NEW.version = OLD.version AND NEW.prioridad IS OLD.prioridad
+BEGIN
+    UPDATE leads SET version = OLD.version + 1 WHERE id = NEW.id;
+END;
+
+-- ======== Prioridad (GET /leads/next) ========
+-- prioridad = puntos por temperatura, etapa, tipo de contacto y último
+-- resultado + 1 punto por día completo sin contacto (desde la última interacción o,
+-- si no hay, desde el alta) con un tope de 30: los demás factores suman
+-- entre -40 y +90, así que el tiempo desempata dentro de un mismo perfil
+-- pero un lead olvidado no pasa por delante de uno caliente.
+-- La fórmula solo está en la vista leads_prioridad_calculada; leads.prioridad
+-- guarda su valor para poder indexarlo. Los triggers de abajo lo recalculan
+-- al crear el lead y al cambiar cualquier factor (segmentación, edición,
+-- interacción) y el trabajo periódico "prioridad" de worker.py lo envejece
+-- (batch.refresh_priorities). El índice parcial solo incluye leads
+-- abiertos, así que el top-N es un recorrido del índice sin ordenar.
+CREATE VIEW IF NOT EXISTS leads_prioridad_calculada AS
+SELECT
+    id,
+    CASE temperatura WHEN 'caliente' THEN 30 WHEN 'tibio' THEN 15 WHEN 'frio' THEN 0 ELSE 10 END
+    + CASE etapa_funnel WHEN 'decision' THEN 20 WHEN 'consideration' THEN 10 ELSE 0 END
+    + CASE tipo_contacto WHEN 'oportunidad' THEN 15 WHEN 'cliente' THEN 5 ELSE 0 END
+    + CASE ultimo_resultado WHEN 'respondio' THEN 25 WHEN 'cerro_llamada' THEN -20 WHEN 'rechazo' THEN -40 ELSE 0 END
+    + min(max(CAST(julianday('now', 'localtime') - julianday(COALESCE(ultima_interaccion_en, creado_en)) AS INTEGER), 0), 30)
+    AS prioridad
+FROM leads;
+
+CREATE TRIGGER IF NOT EXISTS trg_leads_prioridad_insert AFTER INSERT ON leads
+BEGIN
+    UPDATE leads SET prioridad = (SELECT prioridad FROM leads_prioridad_calculada WHERE id = NEW.id)
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_leads_prioridad_update
+AFTER UPDATE OF temperatura, etapa_funnel, tipo_contacto, ultimo_resultado, ultima_interaccion_en, creado_en ON leads
+BEGIN
+    UPDATE leads SET prioridad = (SELECT prioridad FROM leads_prioridad_calculada WHERE id = NEW.id)
+    WHERE id = NEW.id;
+END;
+
+CREATE INDEX IF NOT EXISTS idx_leads_prioridad ON leads (prioridad)
+WHERE prioridad IS NOT NULL AND (estado IS NULL OR estado NOT IN ('ganado', 'perdido'));
+
+-- Toca version para que no se dispare además trg_leads_version, y
+-- actualizado_en (hora actual, como los endpoints) para que el cambio salga
+-- en /export/leads?updated_since igual que en el ETag
+-- (_v2: la primera versión no tocaba actualizado_en; se sustituye en las BD que la tengan)
+DROP TRIGGER IF EXISTS trg_leads_ultima_interaccion;
+CREATE TRIGGER IF NOT EXISTS trg_leads_ultima_interaccion_v2 AFTER INSERT ON interacciones
+WHEN NEW.fecha IS NOT NULL
+BEGIN
+    UPDATE leads
+    SET ultima_interaccion_en = NEW.fecha, ultimo_resultado = NEW.resultado, version = version + 1,
+        actualizado_en = strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')
+    WHERE id = NEW.lead_id AND (ultima_interaccion_en IS NULL OR ultima_interaccion_en <= NEW.fecha);
+END;
+
+-- ======== Búsqueda de texto completo (FTS5) ========
+-- Índices de contenido externo: el texto vive en leads/interacciones y los
+-- triggers mantienen el índice al día. remove_diacritics hace que "atencion"
+-- encuentre "atención"; prefix='2 3' evita expandir término a término las
+-- búsquedas por prefijo cortas ("cr*").
+CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(
+    mensaje_inicial, necesidades, empresa,
+    content='leads', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS interacciones_fts USING fts5(
+    mensaje,
+    content='interacciones', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_leads_fts_insert AFTER INSERT ON leads
+BEGIN
+    INSERT INTO leads_fts (rowid, mensaje_inicial, necesidades, empresa)
+    VALUES (NEW.id, NEW.mensaje_inicial, NEW.necesidades, NEW.empresa);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_leads_fts_delete AFTER DELETE ON leads
+BEGIN
+    INSERT INTO leads_fts (leads_fts, rowid, mensaje_inicial, necesidades, empresa)
+    VALUES ('delete', OLD.id, OLD.mensaje_inicial, OLD.necesidades, OLD.empresa);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_leads_fts_update
+AFTER UPDATE OF mensaje_inicial, necesidades, empresa ON leads
+WHEN OLD.mensaje_inicial IS NOT NEW.mensaje_inicial OR OLD.necesidades IS NOT NEW.necesidades
+  OR OLD.empresa IS NOT NEW.empresa
+BEGIN
+    INSERT INTO leads_fts (leads_fts, rowid, mensaje_inicial, necesidades, empresa)
+    VALUES ('delete', OLD.id, OLD.mensaje_inicial, OLD.necesidades, OLD.empresa);
+    INSERT INTO leads_fts (rowid, mensaje_inicial, necesidades, empresa)
+    VALUES (NEW.id, NEW.mensaje_inicial, NEW.necesidades, NEW.empresa);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_interacciones_fts_insert AFTER INSERT ON interacciones
+BEGIN
+    INSERT INTO interacciones_fts (rowid, mensaje) VALUES (NEW.id, NEW.mensaje);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_interacciones_fts_delete AFTER DELETE ON interacciones
+BEGIN
+    INSERT INTO interacciones_fts (interacciones_fts, rowid, mensaje) VALUES ('delete', OLD.id, OLD.mensaje);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_interacciones_fts_update AFTER UPDATE OF mensaje ON interacciones
+WHEN OLD.mensaje IS NOT NEW.mensaje
+BEGIN
+    INSERT INTO interacciones_fts (interacciones_fts, rowid, mensaje) VALUES ('delete', OLD.id, OLD.mensaje);
+    INSERT INTO interacciones_fts (rowid, mensaje) VALUES (NEW.id, NEW.mensaje);
+END;
+
+-- ======== Trabajos en segundo plano ========
+-- Cola persistente que consume worker.py. ultimo_id es el checkpoint: los
+-- resultados de cada bloque y el avance se guardan en la misma transacción,
+-- así que un worker que retoma un trabajo caído no repite ni salta leads.
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,              -- segmentar / mensajes / prioridad
+    parametros TEXT NOT NULL,        -- JSON (filtro, canal, objetivo...)
+    estado TEXT NOT NULL,            -- pendiente / en_curso / completado / error
+    ultimo_id INTEGER NOT NULL DEFAULT 0,
+    procesados INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,                   -- leads del filtro al empezar
+    segundos REAL NOT NULL DEFAULT 0, -- tiempo de proceso acumulado (para el rendimiento)
+    error TEXT,
+    worker TEXT,                     -- host:pid del worker que lo tiene
+    latido_en TEXT,                  -- último checkpoint / latido del worker
+    creado_en TEXT,
+    iniciado_en TEXT,
+    terminado_en TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_estado ON jobs (estado, id);
@@ -0,0 +1,338 @@
+"""
+Métricas de la API en formato de texto de Prometheus (GET /metrics).
+
+MetricsMiddleware cuenta las peticiones por método, ruta (la plantilla,
+p. ej. /leads/{lead_id}, no la URL) y código de estado, y guarda su
+latencia en un histograma. Durante cada petición, una variable de contexto
+acumula el tiempo de cada etapa:
+
+    conexion       espera para sacar una conexión del pool
+    db             execute/fetch*/commit en SQLite
+    llm            segmentación y generación de mensajes (reglas o HTTP)
+    serializacion  validación contra response_model y codificación JSON
+
+que se vuelcan en otro histograma por ruta y etapa al terminar. Los ganchos
+(database, llm_service, llm_providers, serialization) solo consultan la
+variable de contexto y no hacen nada fuera de una petición (workers, jobs,
+scripts). Los tiempos de etapa son acumulados: si una petición lanza
+trabajo en paralelo pueden sumar más que la latencia total.
+
+Con LEADFLOW_SERVER_TIMING=1 cada respuesta lleva además la cabecera
+Server-Timing con esos tiempos, que las herramientas de desarrollo del
+navegador muestran en la pestaña de red.
+
+No depende de prometheus_client: cada proceso expone sus propios
+contadores (con varios workers de uvicorn, cada scrape ve uno de ellos).
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_ACTIVO = ("1", "true", "si", "on")
+
+METRICS_ENABLED = os.getenv("LEADFLOW_METRICS", "1").lower() in _ACTIVO
+SERVER_TIMING = os.getenv("LEADFLOW_SERVER_TIMING", "0").lower() in _ACTIVO
+
+ETAPAS = ("conexion", "db", "llm", "serializacion")
+
+# Límites superiores (segundos) de los histogramas, de 0,5 ms a 10 s
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ======== Tiempos por etapa de la petición en curso ========
+
+class _Tiempos:
+    """Segundos acumulados por etapa en una petición (compartido con los hilos que lance)."""
+
+    __slots__ = ("etapas", "fin_endpoint", "_lock")
+
+    def __init__(self):
+        self.etapas: Dict[str, float] = {}
+        self.fin_endpoint: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def sumar(self, etapa: str, segundos: float) -> None:
+        with self._lock:
+            self.etapas[etapa] = self.etapas.get(etapa, 0.0) + segundos
+
+
+_peticion: ContextVar[Optional[_Tiempos]] = ContextVar("leadflow_tiempos", default=None)
+
+
+def stage_start() -> Optional[float]:
+    """Instante de inicio si hay una petición midiéndose; None si no (el gancho no hace nada)."""
+    return time.perf_counter() if _peticion.get() is not None else None
+
+
+def stage_end(etapa: str, inicio: Optional[float]) -> None:
+    """Suma a `etapa` el tiempo desde `inicio` (el valor de stage_start)."""
+    if inicio is not None:
+        tiempos = _peticion.get()
+        if tiempos is not None:
+            tiempos.sumar(etapa, time.perf_counter() - inicio)
+
+
+def add_stage(etapa: str, segundos: float) -> None:
+    """Suma `segundos` ya medidos a `etapa`, si hay una petición midiéndose."""
+    tiempos = _peticion.get()
+    if tiempos is not None:
+        tiempos.sumar(etapa, segundos)
+
+
+class stage:
+    """Context manager que suma su duración a `etapa`: `with stage("serializacion"): ...`."""
+
+    __slots__ = ("etapa", "inicio")
+
+    def __init__(self, etapa: str):
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = stage_start()
+
+    def __exit__(self, *exc):
+        stage_end(self.etapa, self.inicio)
+
+
+def timed_stage(etapa: str) -> Callable:
+    """Decorador para funciones (síncronas o async) cuyo tiempo cuenta como `etapa`."""
+
+    def decorador(funcion):
+        if inspect.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                inicio = stage_start()
+                try:
+                    return await funcion(*args, **kwargs)
+                finally:
+                    stage_end(etapa, inicio)
+
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            inicio = stage_start()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                stage_end(etapa, inicio)
+
+        return envoltura
+
+    return decorador
+
+
+def _marcar_fin_endpoint() -> None:
+    tiempos = _peticion.get()
+    if tiempos is not None:
+        tiempos.fin_endpoint = time.perf_counter()
+
+
+def mark_endpoint_end(endpoint: Callable) -> Callable:
+    """
+    Envuelve un endpoint para anotar cuándo devuelve: lo que pase desde ahí
+    hasta enviar la cabecera de la respuesta (validar contra response_model,
+    codificar JSON) cuenta como serialización. functools.wraps conserva la
+    firma que FastAPI inspecciona.
+    """
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def envoltura_async(*args, **kwargs):
+            respuesta = await endpoint(*args, **kwargs)
+            _marcar_fin_endpoint()
+            return respuesta
+
+        return envoltura_async
+
+    @functools.wraps(endpoint)
+    def envoltura(*args, **kwargs):
+        respuesta = endpoint(*args, **kwargs)
+        _marcar_fin_endpoint()
+        return respuesta
+
+    return envoltura
+
+
+# ======== Métricas y formato de exposición ========
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class Counter:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valores: Tuple[str, ...] = (), cantidad: float = 1) -> None:
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def render(self) -> List[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for etiquetas, valor in valores:
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}")
+        return lineas
+
+
+class Gauge(Counter):
+    def dec(self, valores: Tuple[str, ...] = (), cantidad: float = 1) -> None:
+        self.inc(valores, -cantidad)
+
+    def render(self) -> List[str]:
+        lineas = super().render()
+        lineas[1] = f"# TYPE {self.nombre} gauge"
+        return lineas
+
+
+class Histogram:
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), buckets: Iterable[float] = BUCKETS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [cuenta por bucket (sin acumular, el último es +Inf), suma]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, valores: Tuple[str, ...], segundos: float) -> None:
+        i = bisect_left(self.buckets, segundos)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][i] += 1
+            serie[1] += segundos
+
+    def render(self) -> List[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = sorted((k, (list(c), s)) for k, (c, s) in self._series.items())
+        limites = [f'le="{float(b)!r}"' for b in self.buckets] + ['le="+Inf"']
+        for etiquetas, (cuentas, suma) in series:
+            acumulado = 0
+            for limite, cuenta in zip(limites, cuentas):
+                acumulado += cuenta
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, limite)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {repr(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {acumulado}")
+        return lineas
+
+
+class Registry:
+    def __init__(self):
+        self._metricas: list = []
+
+    def register(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def render(self) -> str:
+        lineas: List[str] = []
+        for metrica in self._metricas:
+            lineas += metrica.render()
+        return "\n".join(lineas) + "\n"
+
+
+registry = Registry()
+
+http_requests_total = registry.register(
+    Counter("leadflow_http_requests_total", "Peticiones HTTP atendidas.", ("method", "route", "status"))
+)
+http_requests_in_progress = registry.register(
+    Gauge("leadflow_http_requests_in_progress", "Peticiones HTTP en curso.")
+)
+http_request_duration = registry.register(
+    Histogram(
+        "leadflow_http_request_duration_seconds",
+        "Latencia de las peticiones HTTP hasta terminar de enviar la respuesta.",
+        ("method", "route"),
+    )
+)
+stage_duration = registry.register(
+    Histogram(
+        "leadflow_stage_duration_seconds",
+        "Tiempo acumulado por etapa (conexion, db, llm, serializacion) en cada petición que la usa.",
+        ("method", "route", "stage"),
+    )
+)
+
+
+def server_timing(etapas: Dict[str, float], total: float) -> str:
+    """Valor de la cabecera Server-Timing (milisegundos)."""
+    partes = [f"{e};dur={etapas[e] * 1000:.3f}" for e in ETAPAS if e in etapas]
+    partes.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(partes)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI (sin BaseHTTPMiddleware, para no copiar el contexto ni
+    añadir una tarea por petición). Debe ser el más externo para medir
+    también a los demás.
+    """
+
+    def __init__(self, app, server_timing_header: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tiempos = _Tiempos()
+        token = _peticion.set(tiempos)
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                ahora = time.perf_counter()
+                if tiempos.fin_endpoint is not None:
+                    tiempos.sumar("serializacion", ahora - tiempos.fin_endpoint)
+                    tiempos.fin_endpoint = None
+                if self.server_timing_header:
+                    cabecera = (b"server-timing", server_timing(tiempos.etapas, ahora - inicio).encode("latin-1"))
+                    mensaje = {**mensaje, "headers": [*mensaje.get("headers", ()), cabecera]}
+            await send(mensaje)
+
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _peticion.reset(token)
+            duracion = time.perf_counter() - inicio
+            http_requests_in_progress.dec()
+            # Plantilla de la ruta que atendió la petición; las URLs sin ruta se agrupan
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            metodo = scope["method"]
+            http_requests_total.inc((metodo, ruta, str(estado)))
+            http_request_duration.observe((metodo, ruta), duracion)
+            for etapa, segundos in tiempos.etapas.items():
+                stage_duration.observe((metodo, ruta, etapa), segundos)
@@ -0,0 +1,240 @@
+"""
+Herramientas de diagnóstico en producción (endpoints /debug/*, protegidos
+con LEADFLOW_ADMIN_TOKEN).
+
+- SamplingProfiler: muestrea durante N segundos las pilas de todos los
+  hilos con sys._current_frames() y devuelve el formato "collapsed stacks"
+  (una línea `hilo;marco;...;marco N` por pila) que leen flamegraph.pl,
+  speedscope o inferno. Solo hay un perfil a la vez. Los hilos en reposo
+  (bucle de eventos esperando en select, workers del threadpool esperando
+  trabajo) se descartan salvo que se pidan.
+
+- SlowQueryLog: las sentencias de las conexiones del pool que tardan más
+  que LEADFLOW_SLOW_QUERY_MS (execute + fetch*, medido en
+  database.TimedCursor) se guardan en un buffer circular con el SQL, la
+  forma de los parámetros (tipos, nunca valores), la duración y el
+  EXPLAIN QUERY PLAN. Con LEADFLOW_SLOW_QUERY_TRACE=1 las conexiones
+  instalan además set_trace_callback y cada entrada cuenta las sentencias
+  que SQLite ejecutó por debajo (triggers, escrituras internas de FTS5),
+  útil para ver la amplificación de escrituras; cuesta un 40-80 % en
+  escrituras, así que solo conviene activarlo mientras se investiga.
+"""
+import hmac
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+ADMIN_TOKEN = os.getenv("LEADFLOW_ADMIN_TOKEN") or None
+
+SLOW_QUERY_MS = float(os.getenv("LEADFLOW_SLOW_QUERY_MS", "100"))  # 0 = desactivado
+SLOW_QUERY_BUFFER = int(os.getenv("LEADFLOW_SLOW_QUERY_BUFFER", "200"))
+SLOW_QUERY_TRACE = os.getenv("LEADFLOW_SLOW_QUERY_TRACE", "0").lower() in ("1", "true", "si", "on")
+
+PROFILE_MAX_SECONDS = 60
+
+
+def admin_token_ok(token: Optional[str]) -> bool:
+    """Compara en tiempo constante; sin LEADFLOW_ADMIN_TOKEN nada es válido."""
+    return ADMIN_TOKEN is not None and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+# ======== Perfilador por muestreo ========
+
+class ProfilerBusy(RuntimeError):
+    """Ya hay un perfil en curso."""
+
+
+# Marcos hoja de un hilo que espera trabajo: (fichero, función, función del marco padre o None)
+_REPOSO = (
+    ("selectors.py", "select", None),  # bucle de eventos sin nada que hacer
+    ("threading.py", "wait", "get"),  # worker de anyio esperando en su cola
+    ("thread.py", "_worker", None),  # ThreadPoolExecutor (cola en C, sin marco propio)
+)
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etiquetas: Dict[Any, str] = {}
+
+    def _etiqueta(self, codigo) -> str:
+        etiqueta = self._etiquetas.get(codigo)
+        if etiqueta is None:
+            etiqueta = f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}"
+            self._etiquetas[codigo] = etiqueta
+        return etiqueta
+
+    @staticmethod
+    def _en_reposo(marco) -> bool:
+        codigo = marco.f_code
+        fichero = os.path.basename(codigo.co_filename)
+        for f, funcion, padre in _REPOSO:
+            if fichero == f and codigo.co_name == funcion:
+                if padre is None or (marco.f_back is not None and marco.f_back.f_code.co_name == padre):
+                    return True
+        return False
+
+    def profile(self, segundos: float, intervalo: float = 0.005, reposo: bool = False) -> Dict:
+        """
+        Muestrea cada `intervalo` segundos durante `segundos` en el hilo que
+        llama. Devuelve {"muestras", "segundos", "pilas": Counter de pilas
+        colapsadas}.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("Ya hay un perfil en curso")
+        try:
+            propio = threading.get_ident()
+            pilas: Counter = Counter()
+            muestras = 0
+            inicio = time.perf_counter()
+            fin = inicio + segundos
+            while True:
+                nombres = {h.ident: h.name for h in threading.enumerate()}
+                for ident, marco in sys._current_frames().items():
+                    if ident == propio or (not reposo and self._en_reposo(marco)):
+                        continue
+                    marcos = []
+                    while marco is not None:
+                        marcos.append(self._etiqueta(marco.f_code))
+                        marco = marco.f_back
+                    marcos.append(nombres.get(ident, f"hilo-{ident}").replace(" ", "_"))
+                    pilas[";".join(reversed(marcos))] += 1
+                muestras += 1
+                ahora = time.perf_counter()
+                if ahora >= fin:
+                    break
+                time.sleep(min(intervalo, fin - ahora))
+            return {"muestras": muestras, "segundos": round(time.perf_counter() - inicio, 3), "pilas": pilas}
+        finally:
+            self._lock.release()
+
+
+def collapsed(pilas: Counter) -> str:
+    """Formato "collapsed stacks": `marco;marco;... cuenta`, de más a menos frecuente."""
+    return "".join(f"{pila} {n}\n" for pila, n in pilas.most_common())
+
+
+profiler = SamplingProfiler()
+
+
+# ======== Log de consultas lentas ========
+
+def parameter_shape(parametros) -> Any:
+    """Tipos de los parámetros (con longitud en textos y blobs), sin sus valores."""
+
+    def forma(valor):
+        if isinstance(valor, (str, bytes)):
+            return f"{type(valor).__name__}[{len(valor)}]"
+        return type(valor).__name__
+
+    if isinstance(parametros, dict):
+        return {clave: forma(valor) for clave, valor in parametros.items()}
+    if isinstance(parametros, (list, tuple)):
+        return [forma(valor) for valor in parametros]
+    return type(parametros).__name__
+
+
+class SlowQueryLog:
+    def __init__(self, umbral_ms: float = SLOW_QUERY_MS, capacidad: int = SLOW_QUERY_BUFFER):
+        # Un umbral infinito desactiva el registro sin tocar el camino rápido de TimedCursor
+        self.umbral = umbral_ms / 1000 if umbral_ms > 0 else float("inf")
+        self._entradas: deque = deque(maxlen=capacidad)
+        self._planes: "OrderedDict[str, Optional[List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._siguiente_id = 1
+        self._registradas = 0
+
+    def _plan(self, conn: sqlite3.Connection, sql: str, parametros) -> Optional[List[str]]:
+        """EXPLAIN QUERY PLAN con sangría por nivel, cacheado por texto SQL."""
+        with self._lock:
+            if sql in self._planes:
+                self._planes.move_to_end(sql)
+                return self._planes[sql]
+        try:
+            # Cursor base: no pasa por TimedCursor (ni por este log)
+            filas = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", parametros).fetchall()
+        except (sqlite3.Error, ValueError):
+            plan = None
+        else:
+            profundidad = {0: -1}
+            plan = []
+            for id_, padre, _, detalle in filas:
+                profundidad[id_] = profundidad.get(padre, -1) + 1
+                plan.append("  " * profundidad[id_] + detalle)
+        with self._lock:
+            self._planes[sql] = plan
+            if len(self._planes) > 256:
+                self._planes.popitem(last=False)
+        return plan
+
+    def record(
+        self,
+        conn: sqlite3.Connection,
+        sql: str,
+        parametros,
+        segundos: float,
+        muchas: bool = False,
+        traza: Optional[List[str]] = None,
+    ) -> Dict:
+        """Guarda una sentencia lenta; devuelve la entrada para sumarle después el tiempo de fetch."""
+        # Copia antes del EXPLAIN, que también pasa por el trace callback
+        traza = list(traza) if traza is not None else None
+        if muchas:
+            filas = parametros if isinstance(parametros, (list, tuple)) else None
+            forma = {"filas": len(filas) if filas is not None else None,
+                     "primera": parameter_shape(filas[0]) if filas else None}
+            plan = self._plan(conn, sql, filas[0]) if filas else None
+        else:
+            forma = parameter_shape(parametros)
+            plan = self._plan(conn, sql, parametros)
+        entrada = {
+            "id": None,
+            "fecha": datetime.now().isoformat(timespec="milliseconds"),
+            "duracion_ms": round(segundos * 1000, 3),
+            "sql": " ".join(sql.split())[:2000],
+            "parametros": forma,
+            "executemany": muchas,
+            "plan": plan,
+        }
+        if traza is not None:
+            entrada["sentencias_sqlite"] = len(traza)
+            # Las internas (triggers de FTS5, PRAGMAs) llegan como "-- ..." y no llevan valores
+            entrada["internas"] = list(dict.fromkeys(s for s in traza if s.startswith("-- ")))[:20]
+        with self._lock:
+            entrada["id"] = self._siguiente_id
+            self._siguiente_id += 1
+            self._registradas += 1
+            self._entradas.append(entrada)
+        return entrada
+
+    def add_time(self, entrada: Dict, segundos: float) -> None:
+        with self._lock:
+            entrada["duracion_ms"] = round(entrada["duracion_ms"] + segundos * 1000, 3)
+
+    def entries(self, limit: int = 50) -> List[Dict]:
+        """Las más recientes primero."""
+        with self._lock:
+            return [dict(e) for e in list(self._entradas)[::-1][:limit]]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._planes.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "umbral_ms": self.umbral * 1000 if self.umbral != float("inf") else None,
+                "registradas": self._registradas,
+                "en_buffer": len(self._entradas),
+                "capacidad": self._entradas.maxlen,
+                "traza": SLOW_QUERY_TRACE,
+            }
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,120 @@
+"""
+ETags y caché de respuestas de lectura de leads.
+
+GET /leads/{id} usa como ETag la versión de la fila (leads.version) y
+GET /leads la de la tabla (cambios.version) junto con los parámetros de la
+consulta; ambas las mantienen triggers, así que también cubren escrituras
+de otros procesos (worker.py). Con If-None-Match coincidente se responde
+304 tras una lectura por clave primaria. Si no, el cuerpo ya serializado se
+toma de un LRU en memoria mientras la versión no cambie. Los endpoints de
+escritura de este proceso invalidan las entradas afectadas para no
+guardar respuestas que ya no se van a servir.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+# Leads individuales y páginas de listado que se guardan serializados
+RESPONSE_CACHE_SIZE = int(os.getenv("LEADFLOW_RESPONSE_CACHE_SIZE", "5000"))
+RESPONSE_CACHE_LIST_SIZE = int(os.getenv("LEADFLOW_RESPONSE_CACHE_LIST_SIZE", "256"))
+
+# (ETag, cuerpo JSON, cabeceras extra como X-Next-Cursor)
+Entrada = Tuple[str, bytes, Dict[str, str]]
+
+
+def lead_etag(lead_id: int, version: int) -> str:
+    return f'"l{lead_id}.{version}"'
+
+
+def list_etag(version: int, clave: str) -> str:
+    return f'"L{version}.{hashlib.sha1(clave.encode("utf-8")).hexdigest()[:16]}"'
+
+
+def list_key(query_params) -> str:
+    """Clave canónica de un listado: los parámetros ordenados (el orden en la URL no importa)."""
+    return "&".join(f"{k}={v}" for k, v in sorted(query_params.multi_items()))
+
+
+def leads_table_version(db: sqlite3.Connection) -> int:
+    fila = db.execute("SELECT version FROM cambios WHERE tabla = 'leads'").fetchone()
+    return fila[0] if fila else 0
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110): admite listas, W/ y *."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        (candidata[2:] if candidata.startswith("W/") else candidata) == etag
+        for candidata in (c.strip() for c in if_none_match.split(","))
+    )
+
+
+class ResponseCache:
+    def __init__(self, size: int = RESPONSE_CACHE_SIZE, list_size: int = RESPONSE_CACHE_LIST_SIZE):
+        self.size = size
+        self.list_size = list_size
+        self._leads: "OrderedDict[int, Entrada]" = OrderedDict()
+        self._listados: "OrderedDict[str, Entrada]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"no_modificados": 0, "hits": 0, "misses": 0, "invalidaciones": 0}
+
+    def _get(self, lru: OrderedDict, clave, etag: str) -> Optional[Entrada]:
+        with self._lock:
+            entrada = lru.get(clave)
+            if entrada is not None and entrada[0] == etag:
+                lru.move_to_end(clave)
+                self._stats["hits"] += 1
+                return entrada
+            self._stats["misses"] += 1
+            return None
+
+    def _put(self, lru: OrderedDict, limite: int, clave, entrada: Entrada) -> None:
+        with self._lock:
+            lru[clave] = entrada
+            lru.move_to_end(clave)
+            while len(lru) > limite:
+                lru.popitem(last=False)
+
+    def get_lead(self, lead_id: int, etag: str) -> Optional[Entrada]:
+        return self._get(self._leads, lead_id, etag)
+
+    def put_lead(self, lead_id: int, etag: str, cuerpo: bytes) -> None:
+        self._put(self._leads, self.size, lead_id, (etag, cuerpo, {}))
+
+    def get_list(self, clave: str, etag: str) -> Optional[Entrada]:
+        return self._get(self._listados, clave, etag)
+
+    def put_list(self, clave: str, etag: str, cuerpo: bytes, cabeceras: Dict[str, str]) -> None:
+        self._put(self._listados, self.list_size, clave, (etag, cuerpo, cabeceras))
+
+    def not_modified(self) -> None:
+        with self._lock:
+            self._stats["no_modificados"] += 1
+
+    def invalidate_leads(self, lead_ids: Iterable[int]) -> None:
+        """Tras escribir leads: fuera esas filas y todos los listados (cualquier página puede cambiar)."""
+        with self._lock:
+            for lead_id in lead_ids:
+                self._leads.pop(lead_id, None)
+            self._listados.clear()
+            self._stats["invalidaciones"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            datos = dict(self._stats)
+            datos["leads_en_cache"] = len(self._leads)
+            datos["listados_en_cache"] = len(self._listados)
+        consultas = datos["hits"] + datos["misses"]
+        datos["tamano"] = self.size
+        datos["tamano_listados"] = self.list_size
+        datos["hit_ratio"] = round(datos["hits"] / consultas, 4) if consultas else 0.0
+        return datos
+
+
+response_cache = ResponseCache()
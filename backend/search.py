@@ -0,0 +1,199 @@
+"""
+Búsqueda de texto completo sobre leads e interacciones (SQLite FTS5).
+
+leads_fts indexa mensaje_inicial, necesidades y empresa; interacciones_fts
+el mensaje de cada interacción. Ambos son de contenido externo y los
+mantienen los triggers de models.sql, así que no duplican el texto.
+
+Uso:
+    python search.py --reconstruir   # regenera los índices desde las tablas
+    python search.py --optimizar     # fusiona los segmentos del índice
+"""
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+FTS_TABLES = ("leads_fts", "interacciones_fts")
+
+# Coincidencias por índice que se puntúan con BM25. Calcular BM25 cuesta lo
+# mismo para cada fila que coincide, así que una palabra muy común (cientos de
+# miles de leads) se ordena solo entre sus coincidencias más recientes.
+SEARCH_MAX_CANDIDATES = int(os.getenv("LEADFLOW_SEARCH_MAX_CANDIDATES", "10000"))
+
+MARCA_INICIO = "<mark>"
+MARCA_FIN = "</mark>"
+# Tokens de contexto alrededor de la coincidencia en el fragmento
+FRAGMENTO_TOKENS = 12
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> None:
+    """Regenera los índices FTS desde leads e interacciones."""
+    for tabla in FTS_TABLES:
+        conn.execute(f"INSERT INTO {tabla} ({tabla}) VALUES ('rebuild')")
+    conn.commit()
+
+
+def optimize_search_index(conn: sqlite3.Connection) -> None:
+    for tabla in FTS_TABLES:
+        conn.execute(f"INSERT INTO {tabla} ({tabla}) VALUES ('optimize')")
+    conn.commit()
+
+
+def build_fts_query(q: str) -> Optional[str]:
+    """
+    Convierte el texto del usuario en una consulta FTS5 segura: cada palabra
+    va entre comillas (los operadores y la puntuación no rompen la sintaxis)
+    y todas deben aparecer. Una palabra terminada en * busca por prefijo.
+    Devuelve None si no queda ninguna palabra.
+    """
+    terminos = []
+    for palabra in q.split():
+        prefijo = palabra.endswith("*")
+        palabra = palabra.rstrip("*").replace('"', '""')
+        if palabra:
+            terminos.append(f'"{palabra}"' + ("*" if prefijo else ""))
+    return " ".join(terminos) or None
+
+
+def candidate_window(db: sqlite3.Connection, tabla: str, consulta: str) -> Tuple[int, int, bool]:
+    """
+    (suelo, techo, truncado) de las coincidencias de `consulta` en `tabla`:
+    techo es el rowid de la más reciente y suelo el de la última de las
+    SEARCH_MAX_CANDIDATES más recientes (0 si hay menos); truncado indica
+    que hay coincidencias más antiguas que no se puntúan. Recorrer la lista
+    de rowids no calcula BM25 y es barato.
+    """
+    techo = db.execute(
+        f"SELECT rowid FROM {tabla} WHERE {tabla} MATCH ? ORDER BY rowid DESC LIMIT 1", (consulta,)
+    ).fetchone()
+    limite = db.execute(
+        f"SELECT rowid FROM {tabla} WHERE {tabla} MATCH ? ORDER BY rowid DESC LIMIT 2 OFFSET ?",
+        (consulta, SEARCH_MAX_CANDIDATES - 1),
+    ).fetchall()
+    return (limite[0][0] if limite else 0), (techo[0] if techo else 0), len(limite) > 1
+
+
+def search_leads(
+    db: sqlite3.Connection,
+    consulta: str,
+    where: str,
+    params: List,
+    limit: int,
+    despues: Optional[Tuple[float, int]] = None,
+    incluir_interacciones: bool = True,
+    ventana: Optional[Tuple[int, int, int, int, bool]] = None,
+) -> Tuple[List[Dict], Tuple[int, int, int, int, bool]]:
+    """
+    Leads que coinciden con `consulta` (ya en sintaxis FTS5), ordenados por
+    BM25 (menor = más relevante) e id. Si coinciden el lead y alguna de sus
+    interacciones, cuenta la mejor puntuación. `where`/`params` vienen de
+    build_lead_filter y `despues` es el (puntuacion, id) del último resultado
+    de la página anterior.
+
+    `ventana` es la instantánea de la primera página: (suelo, techo) de
+    rowids candidatos en leads_fts y en interacciones_fts (candidate_window)
+    y si se recortó alguno. Se reutiliza en las páginas siguientes: las filas
+    añadidas después no entran. No es una instantánea completa: una edición
+    del texto o el cambio de las estadísticas de BM25 por otras escrituras
+    puede mover un lead entre páginas (saltarlo o repetirlo).
+    Devuelve hasta limit + 1 leads (con puntuacion, origen y fragmento) y la
+    ventana usada.
+    """
+    if ventana is None:
+        suelo_leads, techo_leads, truncado_leads = candidate_window(db, "leads_fts", consulta)
+        suelo_int, techo_int, truncado_int = (
+            candidate_window(db, "interacciones_fts", consulta) if incluir_interacciones else (0, 0, False)
+        )
+        ventana = (suelo_leads, techo_leads, suelo_int, techo_int, truncado_leads or truncado_int)
+
+    fuentes = """
+        SELECT rowid AS lead_id, bm25(leads_fts) AS puntuacion, 'lead' AS origen, rowid AS fuente_id
+        FROM leads_fts WHERE leads_fts MATCH ? AND rowid BETWEEN ? AND ?
+    """
+    fuentes_params: List = [consulta, ventana[0], ventana[1]]
+    if incluir_interacciones:
+        fuentes += """
+        UNION ALL
+        SELECT i.lead_id, bm25(interacciones_fts), 'interaccion', interacciones_fts.rowid
+        FROM interacciones_fts JOIN interacciones i ON i.id = interacciones_fts.rowid
+        WHERE interacciones_fts MATCH ? AND interacciones_fts.rowid BETWEEN ? AND ?
+        """
+        fuentes_params += [consulta, ventana[2], ventana[3]]
+
+    condiciones = []
+    condicion_params: List = []
+    if where != "1 = 1":
+        condiciones.append(f"EXISTS (SELECT 1 FROM leads WHERE leads.id = m.lead_id AND {where})")
+        condicion_params += list(params)
+    if despues is not None:
+        condiciones.append("(m.puntuacion, m.lead_id) > (?, ?)")
+        condicion_params += list(despues)
+
+    # MIN() con columnas sueltas: SQLite toma origen/fuente_id de la fila mínima.
+    # Se ordena solo con (lead_id, puntuación); las filas de leads se leen para la página.
+    sql = f"""
+        WITH coincidencias AS MATERIALIZED ({fuentes})
+        SELECT * FROM (
+            SELECT lead_id, MIN(puntuacion) AS puntuacion, origen, fuente_id
+            FROM coincidencias GROUP BY lead_id
+        ) m
+        WHERE {" AND ".join(condiciones) or "1 = 1"}
+        ORDER BY m.puntuacion, m.lead_id
+        LIMIT ?
+    """
+    pagina = db.execute(sql, fuentes_params + condicion_params + [limit + 1]).fetchall()
+    leads = {
+        r["id"]: dict(r)
+        for r in db.execute(
+            "SELECT * FROM leads WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps([p["lead_id"] for p in pagina]),),
+        )
+    }
+    filas = []
+    for p in pagina:
+        lead = leads.get(p["lead_id"])
+        if lead is not None:
+            lead.update(puntuacion=p["puntuacion"], origen=p["origen"], fuente_id=p["fuente_id"])
+            filas.append(lead)
+
+    # Los fragmentos solo se calculan para la página, no para todas las coincidencias
+    fragmentos = {}
+    for origen, tabla, columna in (("lead", "leads_fts", -1), ("interaccion", "interacciones_fts", 0)):
+        ids = [f["fuente_id"] for f in filas if f["origen"] == origen]
+        if not ids:
+            continue
+        cur = db.execute(
+            f"""
+            SELECT rowid, snippet({tabla}, {columna}, ?, ?, '…', ?) FROM {tabla}
+            WHERE {tabla} MATCH ? AND rowid IN (SELECT value FROM json_each(?))
+            """,
+            (MARCA_INICIO, MARCA_FIN, FRAGMENTO_TOKENS, consulta, json.dumps(ids)),
+        )
+        fragmentos.update({(origen, rowid): texto for rowid, texto in cur})
+
+    for f in filas:
+        f["fragmento"] = fragmentos.get((f["origen"], f.pop("fuente_id")))
+    return filas, ventana
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from init_db import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Mantenimiento de los índices de búsqueda")
+    parser.add_argument("--reconstruir", action="store_true", help="Regenera leads_fts e interacciones_fts")
+    parser.add_argument("--optimizar", action="store_true", help="Fusiona los segmentos de los índices")
+    args = parser.parse_args()
+    if not (args.reconstruir or args.optimizar):
+        parser.error("indica --reconstruir y/o --optimizar")
+
+    conn = sqlite3.connect(DB_PATH)
+    if args.reconstruir:
+        rebuild_search_index(conn)
+        print("✅ Índices de búsqueda reconstruidos")
+    if args.optimizar:
+        optimize_search_index(conn)
+        print("✅ Índices de búsqueda optimizados")
+    conn.close()
@@ -0,0 +1,223 @@
+"""
+Caché de resultados de segmentación.
+
+La segmentación es una función pura de SEGMENTATION_FIELDS para un
+proveedor dado, así que el resultado se guarda por un hash de esos campos
+más la versión del proveedor que lo calculó (llm_providers: "reglas-v1",
+"http:<modelo>"). Hay dos niveles: un LRU en memoria (por proceso) y la
+tabla segmentacion_cache en SQLite (compartida entre procesos y
+reinicios). Como la clave es el contenido, un lead editado nunca lee un
+resultado viejo; invalidar solo libera la entrada que ya no se va a usar.
+
+Los resultados que el proveedor remoto no pudo dar y respondió el motor de
+reglas de respaldo no se guardan: la próxima vez se vuelve a pedir al
+modelo.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+
+from database import pool
+from llm_providers import llm_provider
+from llm_service import segment_leads, SEGMENTATION_FIELDS, SEGMENTATION_VERSION
+
+# Entradas máximas del nivel en memoria
+SEGMENTATION_CACHE_SIZE = int(os.getenv("LEADFLOW_SEG_CACHE_SIZE", "20000"))
+
+
+def cache_key(lead: Dict, version: str = SEGMENTATION_VERSION) -> str:
+    # None y "" segmentan igual, así que comparten clave
+    h = hashlib.sha256(version.encode("utf-8"))
+    for campo in SEGMENTATION_FIELDS:
+        h.update(b"\x1f")
+        h.update((lead.get(campo) or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+class SegmentationCache:
+    def __init__(self, size: int = SEGMENTATION_CACHE_SIZE, version: str = SEGMENTATION_VERSION):
+        self.size = size
+        self.version = version
+        self._lru: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits_memoria": 0, "hits_bd": 0, "misses": 0, "invalidaciones": 0, "de_respaldo": 0}
+
+    def _recordar(self, clave: str, resultado: Dict) -> None:
+        with self._lock:
+            self._lru[clave] = resultado
+            self._lru.move_to_end(clave)
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+
+    def get_many(
+        self, db: sqlite3.Connection, leads: List[Dict], version: Optional[str] = None
+    ) -> List[Optional[Dict]]:
+        """Resultado guardado para cada lead (None si no está en ningún nivel)."""
+        version = version or self.version
+        claves = [cache_key(lead, version) for lead in leads]
+        resultados: List[Optional[Dict]] = [None] * len(leads)
+        pendientes = {}
+        with self._lock:
+            for i, clave in enumerate(claves):
+                resultado = self._lru.get(clave)
+                if resultado is not None:
+                    self._lru.move_to_end(clave)
+                    resultados[i] = resultado
+                    self._stats["hits_memoria"] += 1
+                else:
+                    pendientes.setdefault(clave, []).append(i)
+
+        if pendientes:
+            filas = db.execute(
+                "SELECT clave, resultado FROM segmentacion_cache WHERE clave IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(pendientes)),),
+            ).fetchall()
+            for clave, texto in filas:
+                resultado = json.loads(texto)
+                self._recordar(clave, resultado)
+                for i in pendientes.pop(clave):
+                    resultados[i] = resultado
+            with self._lock:
+                self._stats["hits_bd"] += len(filas)
+                self._stats["misses"] += sum(len(indices) for indices in pendientes.values())
+        return resultados
+
+    def put_many(
+        self,
+        db: sqlite3.Connection,
+        leads: List[Dict],
+        resultados: List[Dict],
+        version: Optional[str] = None,
+        de_respaldo: Optional[Sequence[bool]] = None,
+    ) -> None:
+        """
+        Guarda en los dos niveles (sin commit: lo hace quien llama), salvo los
+        resultados marcados en `de_respaldo`.
+        """
+        version = version or self.version
+        ahora = datetime.now().isoformat(timespec="seconds")
+        filas = []
+        for i, (lead, resultado) in enumerate(zip(leads, resultados)):
+            if de_respaldo is not None and de_respaldo[i]:
+                continue
+            clave = cache_key(lead, version)
+            self._recordar(clave, resultado)
+            filas.append((clave, version, json.dumps(resultado, ensure_ascii=False), ahora))
+        if de_respaldo is not None:
+            with self._lock:
+                self._stats["de_respaldo"] += len(resultados) - len(filas)
+        db.executemany(
+            "INSERT OR REPLACE INTO segmentacion_cache (clave, version, resultado, creado_en) VALUES (?, ?, ?, ?)",
+            filas,
+        )
+
+    def invalidate(self, db: sqlite3.Connection, lead: Dict) -> None:
+        """Elimina la entrada del lead tal y como estaba (sin commit)."""
+        clave = cache_key(lead, self.version)
+        with self._lock:
+            self._lru.pop(clave, None)
+            self._stats["invalidaciones"] += 1
+        db.execute("DELETE FROM segmentacion_cache WHERE clave = ?", (clave,))
+
+    def purge_old_versions(self, db: sqlite3.Connection) -> int:
+        """
+        Borra de la tabla los resultados de otros proveedores o versiones. Se
+        conservan los del motor de reglas actual, que es el que usa worker.py.
+        """
+        cur = db.execute(
+            "DELETE FROM segmentacion_cache WHERE version NOT IN (?, ?)", (self.version, SEGMENTATION_VERSION)
+        )
+        db.commit()
+        return cur.rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            datos = dict(self._stats)
+            datos["entradas_memoria"] = len(self._lru)
+        consultas = datos["hits_memoria"] + datos["hits_bd"] + datos["misses"]
+        datos["tamano_memoria"] = self.size
+        datos["version"] = self.version
+        datos["hit_ratio"] = round((datos["hits_memoria"] + datos["hits_bd"]) / consultas, 4) if consultas else 0.0
+        datos["hit_ratio_memoria"] = round(datos["hits_memoria"] / consultas, 4) if consultas else 0.0
+        return datos
+
+
+# Por defecto, la versión del proveedor activo de la API
+segmentation_cache = SegmentationCache(version=llm_provider.version)
+
+
+def _pendientes(leads: List[Dict], resultados: List[Optional[Dict]]) -> Dict[str, List[int]]:
+    """Índices de los leads sin resultado, agrupados por clave (los textos repetidos se calculan una vez)."""
+    faltan: Dict[str, List[int]] = {}
+    for i, resultado in enumerate(resultados):
+        if resultado is None:
+            faltan.setdefault(cache_key(leads[i]), []).append(i)
+    return faltan
+
+
+def _completar(resultados: List[Optional[Dict]], faltan: Dict[str, List[int]], nuevos: List[Dict]) -> List[Dict]:
+    for indices, resultado in zip(faltan.values(), nuevos):
+        for i in indices:
+            resultados[i] = resultado
+    return resultados
+
+
+def _segmentar_con_reglas(leads: List[Dict]) -> List[Dict]:
+    return segment_leads(leads)
+
+
+def segment_leads_cached(
+    db: sqlite3.Connection,
+    leads: List[Dict],
+    segment_many: Callable[[List[Dict]], List[Dict]] = _segmentar_con_reglas,
+    version: str = SEGMENTATION_VERSION,
+    con_respaldo: bool = False,
+) -> List[Dict]:
+    """
+    Segmenta un bloque de leads pasando por la caché: solo los que no estaban
+    guardados se envían a `segment_many` (por defecto, el motor de reglas).
+    `version` identifica lo que calcula `segment_many`; con `con_respaldo`,
+    segment_many devuelve (resultados, de_respaldo) como
+    LLMProvider.segment_many_with_fallback. No hace commit.
+    """
+    resultados = segmentation_cache.get_many(db, leads, version)
+    faltan = _pendientes(leads, resultados)
+    if faltan:
+        nuevos_leads = [leads[indices[0]] for indices in faltan.values()]
+        nuevos, de_respaldo = segment_many(nuevos_leads) if con_respaldo else (segment_many(nuevos_leads), None)
+        segmentation_cache.put_many(db, nuevos_leads, nuevos, version, de_respaldo)
+        _completar(resultados, faltan, nuevos)
+    return resultados
+
+
+async def segment_leads_cached_async(leads: List[Dict], provider) -> List[Dict]:
+    """
+    Versión asyncio para proveedores de LLM (llm_providers): la caché se
+    consulta y actualiza en el threadpool con su propia conexión del pool y
+    los fallos se resuelven con el proveedor sin bloquear el event loop. La
+    versión de la caché es la del proveedor.
+    """
+    def leer():
+        with pool.connection() as db:
+            return segmentation_cache.get_many(db, leads, provider.version)
+
+    def guardar(nuevos_leads, nuevos, de_respaldo):
+        with pool.connection() as db:
+            segmentation_cache.put_many(db, nuevos_leads, nuevos, provider.version, de_respaldo)
+            db.commit()
+
+    resultados = await run_in_threadpool(leer)
+    faltan = _pendientes(leads, resultados)
+    if faltan:
+        nuevos_leads = [leads[indices[0]] for indices in faltan.values()]
+        nuevos, de_respaldo = await provider.segment_many_with_fallback(nuevos_leads)
+        await run_in_threadpool(guardar, nuevos_leads, nuevos, de_respaldo)
+        _completar(resultados, faltan, nuevos)
+    return resultados
@@ -0,0 +1,70 @@
+"""
+Serialización rápida de filas para los endpoints de lectura (opcional,
+LEADFLOW_FAST_JSON=1).
+
+El camino normal convierte cada sqlite3.Row en dict, FastAPI lo valida
+contra el response_model y lo codifica con json. Con el camino rápido las
+filas llegan como tuplas (cursor sin row_factory) con las columnas en el
+orden de los campos del modelo, se emparejan con esos nombres ya
+calculados y orjson escribe el cuerpo directamente. La salida es la misma
+(mismo orden de claves) y el esquema OpenAPI no cambia, porque los
+endpoints siguen declarando su response_model. No se vuelve a validar lo
+que ya se validó al escribir.
+"""
+import json
+import os
+import sqlite3
+from typing import Any, Iterable, List, Sequence, Tuple
+
+from observability import timed_stage
+
+try:
+    import orjson
+except ImportError:  # sin orjson, el camino rápido queda desactivado
+    orjson = None
+
+FAST_JSON = orjson is not None and os.getenv("LEADFLOW_FAST_JSON", "0").lower() in ("1", "true", "si", "on")
+
+
+def dumps(contenido: Any) -> bytes:
+    """Mismo resultado que JSONResponse (UTF-8, sin espacios), con orjson si está disponible."""
+    if orjson is not None:
+        return orjson.dumps(contenido)
+    return json.dumps(contenido, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def model_columns(modelo) -> Tuple[str, ...]:
+    """Campos del modelo en el orden en que FastAPI los serializa."""
+    return tuple(modelo.model_fields)
+
+
+class RowEncoder:
+    """
+    Codifica tuplas de SQLite cuyas primeras columnas son `columnas`. Las
+    columnas extra al final (p. ej. las del cursor de paginación) se ignoran.
+    """
+
+    def __init__(self, columnas: Sequence[str]):
+        self.columnas = tuple(columnas)
+        self.select = ", ".join(self.columnas)
+
+    @timed_stage("serializacion")
+    def encode_many(self, filas: Iterable[Sequence]) -> bytes:
+        columnas = self.columnas
+        return dumps([dict(zip(columnas, fila)) for fila in filas])
+
+    @timed_stage("serializacion")
+    def encode_one(self, fila: Sequence) -> bytes:
+        return dumps(dict(zip(self.columnas, fila)))
+
+
+def tuple_cursor(db: sqlite3.Connection) -> sqlite3.Cursor:
+    """Cursor que devuelve tuplas aunque la conexión use sqlite3.Row."""
+    cur = db.cursor()
+    cur.row_factory = None
+    return cur
+
+
+def fetch_rows(db: sqlite3.Connection, sql: str, params: Sequence = (), tuplas: bool = FAST_JSON) -> List:
+    cur = tuple_cursor(db) if tuplas else db.cursor()
+    return cur.execute(sql, params).fetchall()
@@ -0,0 +1,42 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Los módulos del backend se importan por nombre (como hace main.py)
+sys.path.insert(0, BACKEND)
+
+
+@pytest.fixture
+def bd_vacia(tmp_path, monkeypatch):
+    """Directorio temporal con models.sql como directorio actual (database.DB_PATH es relativo)."""
+    shutil.copy(os.path.join(BACKEND, "models.sql"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "leadflow.db"
+
+
+@pytest.fixture
+def db(bd_vacia):
+    """Conexión a una BD nueva con el esquema completo."""
+    from init_db import ensure_schema
+
+    conn = sqlite3.connect(bd_vacia)
+    conn.row_factory = sqlite3.Row
+    ensure_schema(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client(bd_vacia):
+    """TestClient de la API sobre una BD nueva (el lifespan crea el esquema)."""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
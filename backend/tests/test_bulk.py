@@ -0,0 +1,33 @@
+"""POST /leads/bulk: alta masiva con segmentar y upsert."""
+from llm_service import segment_lead_with_llm
+
+CAMPOS = ("etapa_funnel", "temperatura", "tipo_contacto")
+
+
+def _segmentacion(lead):
+    return {campo: lead[campo] for campo in CAMPOS}
+
+
+def test_bulk_upsert_segmenta_los_fusionados(client):
+    existente = client.post(
+        "/leads",
+        json={"nombre": "Ana", "email": "ana@example.com", "mensaje_inicial": "Solo estoy mirando opciones."},
+    ).json()
+    client.post("/leads/segmentar", json={"ids": [existente["id"]]})
+    antes = client.get(f"/leads/{existente['id']}").json()
+
+    filas = [
+        # Sin mensaje_inicial: el lead fusionado conserva el suyo y suma estas necesidades
+        {"nombre": "Ana", "email": " ANA@example.com", "necesidades": "Me urge, necesito contratar ya esta semana."},
+        {"nombre": "Luis", "email": "luis@example.com", "mensaje_inicial": "Quiero una demo cuanto antes."},
+    ]
+    respuesta = client.post("/leads/bulk", params={"segmentar": True, "upsert": True}, json=filas).json()
+    assert (respuesta["insertados"], respuesta["fusionados"], respuesta["errores"]) == (1, 1, 0)
+
+    fusionado = client.get(f"/leads/{existente['id']}").json()
+    assert fusionado["mensaje_inicial"] == antes["mensaje_inicial"]
+    assert _segmentacion(fusionado) == _segmentacion(segment_lead_with_llm(fusionado))
+    assert _segmentacion(fusionado) != _segmentacion(antes)
+
+    nuevo = client.get(f"/leads/{respuesta['resultados'][1]['id']}").json()
+    assert _segmentacion(nuevo) == _segmentacion(segment_lead_with_llm(nuevo))
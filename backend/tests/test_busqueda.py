@@ -0,0 +1,41 @@
+"""GET /leads/search: recorte de candidatos y paginación con cursor."""
+import search
+
+
+def _crear(client, n, texto="necesito ordenar whatsapp"):
+    return [client.post("/leads", json={"nombre": f"Lead {i}", "mensaje_inicial": texto}).json()["id"] for i in range(n)]
+
+
+def test_avisa_cuando_recorta_candidatos(client, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_MAX_CANDIDATES", 3)
+    _crear(client, 3)
+    respuesta = client.get("/leads/search", params={"q": "whatsapp", "interacciones": False})
+    assert len(respuesta.json()) == 3
+    assert "X-Search-Truncated" not in respuesta.headers
+
+    _crear(client, 2)
+    respuesta = client.get("/leads/search", params={"q": "whatsapp", "interacciones": False, "limit": 2})
+    assert len(respuesta.json()) == 2
+    assert respuesta.headers["X-Search-Truncated"] == "true"
+    siguiente = client.get(
+        "/leads/search",
+        params={"q": "whatsapp", "interacciones": False, "limit": 2, "cursor": respuesta.headers["X-Next-Cursor"]},
+    )
+    assert len(siguiente.json()) == 1  # 3 candidatos en total
+    assert siguiente.headers["X-Search-Truncated"] == "true"
+
+
+def test_paginas_siguientes_ignoran_leads_nuevos(client):
+    ids = _crear(client, 4)
+    primera = client.get("/leads/search", params={"q": "whatsapp", "limit": 2})
+    _crear(client, 3)  # llegan entre página y página
+    segunda = client.get("/leads/search", params={"q": "whatsapp", "limit": 2, "cursor": primera.headers["X-Next-Cursor"]})
+
+    vistos = [f["id"] for f in primera.json() + segunda.json()]
+    assert sorted(vistos) == sorted(ids)
+    assert "X-Next-Cursor" not in segunda.headers
+
+
+def test_cursor_invalido(client):
+    respuesta = client.get("/leads/search", params={"q": "whatsapp", "cursor": "no-es-un-cursor"})
+    assert respuesta.status_code == 400
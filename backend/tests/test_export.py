@@ -0,0 +1,34 @@
+"""Exportaciones: mismas columnas que la API, sin las internas de la tabla."""
+import csv
+import io
+import json
+
+from database import LEAD_COLUMNS
+
+
+def test_export_leads_solo_columnas_de_la_api(client):
+    lead = client.post("/leads", json={"nombre": "Ana", "email": "Ana@Example.com"}).json()
+    client.post(
+        f"/leads/{lead['id']}/interacciones",
+        json={"canal": "email", "rol": "lead", "mensaje": "hola", "resultado": "respondio"},
+    )
+
+    filas = [json.loads(linea) for linea in client.get("/export/leads").text.splitlines()]
+    assert [tuple(fila) for fila in filas] == [LEAD_COLUMNS]
+    assert filas[0]["id"] == lead["id"]
+
+    cabecera = next(csv.reader(io.StringIO(client.get("/export/leads", params={"formato": "csv"}).text)))
+    assert tuple(cabecera) == LEAD_COLUMNS
+    for interna in ("email_norm", "prioridad"):
+        assert interna not in cabecera
+
+
+def test_export_interacciones_como_la_api(client):
+    lead = client.post("/leads", json={"nombre": "Ana"}).json()
+    guardada = client.post(
+        f"/leads/{lead['id']}/interacciones",
+        json={"canal": "whatsapp", "rol": "lead", "mensaje": "hola"},
+    ).json()
+
+    filas = [json.loads(linea) for linea in client.get("/export/interacciones").text.splitlines()]
+    assert filas == [guardada]
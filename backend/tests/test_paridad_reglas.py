@@ -0,0 +1,303 @@
+"""
+Paridad del motor de reglas de llm_service con su versión original.
+
+Las funciones *_referencia son copia literal de llm_service antes de
+precompilar las tablas de frases (segmentación, dolor y contexto de
+negocio); no se deben tocar. Cualquier reescritura del motor
+(segment_lead_with_llm, segment_leads_batch, _detectar_dolor,
+_detectar_contexto_negocio) tiene que dar exactamente lo mismo sobre un
+corpus generado con semilla que mezcla todas las frases de las reglas,
+mayúsculas, tildes, solapamientos y campos vacíos.
+
+Uso (desde backend/):
+    python -m pytest tests
+"""
+import random
+from typing import Dict, List
+
+import pytest
+
+import llm_service
+
+CAMPOS_SEGMENTACION = ("etapa_funnel", "temperatura", "tipo_contacto", "siguiente_paso", "justificacion")
+
+
+# ======== Referencia congelada (no modificar) ========
+
+def segmentar_referencia(lead: Dict) -> Dict:
+    """
+    Simula segmentación con LLM.
+    Usa mensaje_inicial + necesidades + sector + fuente
+    para inferir etapa, temperatura y tipo de contacto.
+    """
+    texto = (
+        (lead.get("mensaje_inicial") or "")
+        + " "
+        + (lead.get("necesidades") or "")
+        + " "
+        + (lead.get("sector") or "")
+        + " "
+        + (lead.get("fuente") or "")
+    ).lower()
+
+    # ---- Temperatura / etapa según el tipo de frase ----
+
+    # 1) Urgencia clara -> caliente / decision
+    if any(p in texto for p in ["me urge", "urgente", "ya mismo", "lo antes posible", "este mes"]):
+        temperatura = "caliente"
+        etapa = "decision"
+        siguiente_paso = "Proponer una llamada de cierre con una propuesta concreta y próximos pasos."
+
+    # 2) Duda tipo “no sé si tiene sentido / quiero entender si tiene sentido”
+    elif any(p in texto for p in ["tiene sentido", "si tiene sentido", "no sé si tiene sentido", "no se si tiene sentido"]):
+        temperatura = "tibio"
+        etapa = "awareness"
+        siguiente_paso = "Ayudarle primero a entender el problema y si realmente tiene sentido hacer la inversión."
+
+    # 3) Interés activo / está buscando opciones
+    elif any(p in texto for p in ["me interesa", "quiero entender", "quiero saber", "estoy buscando", "evaluando opciones"]):
+        temperatura = "tibio"
+        etapa = "consideration"
+        siguiente_paso = "Proponer una llamada corta para entender mejor el caso y adaptar la solución al negocio."
+
+    # 4) Genérico / poco contexto
+    else:
+        temperatura = "frio"
+        etapa = "awareness"
+        siguiente_paso = "Enviar contenido educativo sencillo para que vea el valor antes de tomar una decisión."
+
+    # Tipo de contacto (lead / oportunidad / cliente)
+    if any(p in texto for p in ["cliente actual", "ya trabajo con", "renovar", "renovación", "renovacion"]):
+        tipo_contacto = "cliente"
+    elif any(p in texto for p in ["propuesta", "cotización", "cotizacion", "presupuesto"]):
+        tipo_contacto = "oportunidad"
+    else:
+        tipo_contacto = "lead"
+
+    return {
+        "etapa_funnel": etapa,
+        "temperatura": temperatura,
+        "tipo_contacto": tipo_contacto,
+        "siguiente_paso": siguiente_paso,
+        "justificacion": (
+            "Clasificación basada en expresiones de urgencia, duda e interés dentro del texto recibido. "
+            "En un entorno real se podría sustituir por un modelo LLM entrenado."
+        ),
+    }
+
+
+def dolor_referencia(texto: str) -> str:
+    """
+    Detecta el dolor principal que menciona la persona
+    (caos, tiempo, conversión, recurrencia, equipo, tech, etc.)
+    y devuelve una frase ya lista para usar en el mensaje.
+    """
+    t = texto.lower()
+
+    # Caos / desorden
+    if any(p in t for p in ["desorden", "caos", "muchos mensajes", "se me pierden", "no doy abasto", "no alcanzo", "saturado"]):
+        return (
+            "bajar el caos de mensajes y tener claro en un solo sitio quién te escribió, "
+            "qué pidió y en qué punto de la conversación se quedó."
+        )
+
+    # Tiempo
+    if any(p in t for p in ["tiempo", "horas", "manual", "manualmente", "automatizar", "automatice", "automatización", "automatizacion"]):
+        return (
+            "dejar de hacerlo todo de forma manual y recuperar horas de trabajo, "
+            "sin perder seguimiento de las oportunidades importantes."
+        )
+
+    # Conversión / ventas
+    if any(p in t for p in ["no convierten", "no compran", "pocas ventas", "ventas", "cerrar", "cierres", "cierre", "tasa de conversión", "conversion"]):
+        return (
+            "entender qué contactos tienen más probabilidad de convertirse en venta "
+            "y priorizarlos en lugar de tratar todo por igual."
+        )
+
+    # Recurrencia / fidelización
+    if any(p in t for p in ["recurrente", "recurrentes", "que vuelvan", "fidelizar", "fidelidad", "retener", "retencion", "retención"]):
+        return (
+            "identificar quién ya te ha comprado y crear acciones específicas para que vuelvan, "
+            "en lugar de vivir solo de clientes nuevos."
+        )
+
+    # Equipo / coordinación comercial
+    if any(p in t for p in ["equipo", "vendedores", "agentes", "comercial", "equipo de ventas", "comerciales"]):
+        return (
+            "que todo el equipo comercial vea la misma información y no se dupliquen mensajes, "
+            "evitando que dos personas contacten al mismo cliente sin saberlo."
+        )
+
+    # Tecnología / herramientas dispersas
+    if any(p in t for p in ["excel", "hoja de cálculo", "hoja de calculo", "google sheets", "herramientas distintas", "múltiples sistemas", "varias herramientas"]):
+        return (
+            "pasar de tener la información repartida en mil sitios (Excel, chats, notas) "
+            "a un flujo simple donde puedas seguir cada oportunidad."
+        )
+
+    # Genérico si no detecta nada claro
+    return (
+        "tener un flujo de seguimiento claro, sin depender solo de la memoria y sin perder oportunidades importantes por el camino."
+    )
+
+
+def contexto_referencia(lead: Dict) -> str:
+    """
+    Devuelve una descripción del tipo de negocio / contexto
+    para que el mensaje no hable solo de 'leads'.
+    """
+    empresa = (lead.get("empresa") or "").lower()
+    sector = (lead.get("sector") or "").lower()
+    fuente = (lead.get("fuente") or "").lower()
+    texto = (
+        (lead.get("mensaje_inicial") or "")
+        + " "
+        + (lead.get("necesidades") or "")
+        + " "
+        + empresa
+        + " "
+        + sector
+        + " "
+        + fuente
+    ).lower()
+
+    # Redes / Instagram / social media
+    if any(p in texto for p in ["instagram", "dm", "redes", "facebook ads", "tiktok", "social"]):
+        return (
+            "cómo conectar lo que pasa en tus redes sociales (DM, comentarios, formularios) "
+            "con un sistema donde no se pierdan las conversaciones valiosas."
+        )
+
+    # E-commerce
+    if "ecommerce" in texto or "tienda online" in texto:
+        return (
+            "identificar qué personas pasan de solo mirar productos a realmente tener intención de compra "
+            "y acompañarlas mejor hasta el pago."
+        )
+
+    # Academias / cursos / formaciones
+    if "academia" in texto or "curso" in texto or "formación" in texto or "formacion" in texto or "webinar" in texto:
+        return (
+            "saber entre todos los registros de tus cursos y webinars quién está listo para una oferta de mayor valor, "
+            "sin tener que revisar uno a uno."
+        )
+
+    # Hostelería / cafetería / restaurantes
+    if "cafetería" in texto or "cafeteria" in texto or "hosteleria" in texto or "restaurante" in texto:
+        return (
+            "pasar de visitas puntuales a clientes recurrentes, "
+            "sabiendo quién vuelve, cada cuánto y qué tipo de comunicación les funciona mejor."
+        )
+
+    # Servicios B2B / consultoría
+    if "consultoría" in texto or "consultoria" in texto or "b2b" in texto or "empresa" in texto or "servicio" in texto:
+        return (
+            "tener visibilidad clara de en qué fase está cada empresa con la que hablas "
+            "y priorizar a las que están más cerca de tomar una decisión."
+        )
+
+    # Genérico
+    return (
+        "organizar mejor tus oportunidades, tener claras las prioridades "
+        "y no depender solo de la memoria o de revisar chats antiguos para saber qué sigue."
+    )
+
+
+# ======== Corpus ========
+
+FRASES = (
+    # segmentación
+    "me urge", "urgente", "ya mismo", "lo antes posible", "este mes",
+    "tiene sentido", "si tiene sentido", "no sé si tiene sentido", "no se si tiene sentido",
+    "me interesa", "quiero entender", "quiero saber", "estoy buscando", "evaluando opciones",
+    "cliente actual", "ya trabajo con", "renovar", "renovación", "renovacion",
+    "propuesta", "cotización", "cotizacion", "presupuesto",
+    # dolor
+    "desorden", "caos", "muchos mensajes", "se me pierden", "no doy abasto", "no alcanzo", "saturado",
+    "tiempo", "horas", "manual", "manualmente", "automatizar", "automatice", "automatización", "automatizacion",
+    "no convierten", "no compran", "pocas ventas", "ventas", "cerrar", "cierres", "cierre",
+    "tasa de conversión", "conversion", "recurrente", "recurrentes", "que vuelvan", "fidelizar", "fidelidad",
+    "retener", "retencion", "retención", "equipo", "vendedores", "agentes", "comercial", "equipo de ventas",
+    "comerciales", "excel", "hoja de cálculo", "hoja de calculo", "google sheets", "herramientas distintas",
+    "múltiples sistemas", "varias herramientas",
+    # contexto
+    "instagram", "dm", "redes", "facebook ads", "tiktok", "social", "ecommerce", "tienda online",
+    "academia", "curso", "formación", "formacion", "webinar", "cafetería", "cafeteria", "hosteleria",
+    "restaurante", "consultoría", "consultoria", "b2b", "empresa", "servicio",
+)
+RELLENO = (
+    "hola", "quería información", "para mi negocio", "gracias", "un saludo", "tenemos una tienda",
+    "el equipo es pequeño", "ÁRBOL", "niño", "", "  ", "\n", "ñ", "admin", "urge", "sentido",
+)
+SECTORES = ("ecommerce", "educacion", "hosteleria", "salud", "servicios", "Consultoría B2B", "", None)
+FUENTES = ("Instagram Ads", "LinkedIn", "Formulario web", "Referido", "TikTok", "", None)
+
+
+def _texto(rnd: random.Random):
+    if rnd.random() < 0.08:
+        return rnd.choice((None, ""))
+    partes = rnd.choices(RELLENO, k=rnd.randint(0, 5))
+    for _ in range(rnd.choice((0, 1, 1, 2, 3))):
+        frase = rnd.choice(FRASES)
+        r = rnd.random()
+        if r < 0.15:
+            frase = frase.upper()
+        elif r < 0.25:
+            frase = frase.capitalize()
+        elif r < 0.32:
+            # pegada a otra palabra: las reglas buscan subcadenas, no palabras
+            frase = rnd.choice(RELLENO) + frase + rnd.choice(("", "s", "mente"))
+        partes.insert(rnd.randint(0, len(partes)), frase)
+    return rnd.choice((" ", ", ", ". ", "")).join(partes)
+
+
+def generar_leads(n: int, semilla: int) -> List[Dict]:
+    rnd = random.Random(semilla)
+    return [
+        {
+            "mensaje_inicial": _texto(rnd),
+            "necesidades": _texto(rnd),
+            "empresa": _texto(rnd) if rnd.random() < 0.5 else rnd.choice(("Tienda Verde", "Academia Norte", None)),
+            "sector": rnd.choice(SECTORES),
+            "fuente": rnd.choice(FUENTES),
+        }
+        for _ in range(n)
+    ]
+
+
+@pytest.fixture(scope="module")
+def leads() -> List[Dict]:
+    return generar_leads(20000, semilla=20240501)
+
+
+# ======== Pruebas ========
+
+def test_segment_lead_with_llm(leads):
+    for lead in leads:
+        assert llm_service.segment_lead_with_llm(lead) == segmentar_referencia(lead), lead
+
+
+def test_segment_leads(leads):
+    esperados = [segmentar_referencia(lead) for lead in leads]
+    assert llm_service.segment_leads(leads) == esperados
+
+
+def test_segment_leads_batch(leads):
+    columnas = [[lead.get(c) for lead in leads] for c in llm_service.SEGMENTATION_FIELDS]
+    resultado = llm_service.segment_leads_batch(*columnas)
+    for i, lead in enumerate(leads):
+        esperado = segmentar_referencia(lead)
+        for campo in ("etapa_funnel", "temperatura", "tipo_contacto", "siguiente_paso"):
+            assert resultado[campo][i] == esperado[campo], (campo, lead)
+
+
+def test_detectar_dolor(leads):
+    for lead in leads:
+        texto = " ".join(lead.get(c) or "" for c in ("mensaje_inicial", "necesidades", "sector", "fuente"))
+        assert llm_service._detectar_dolor(texto) == dolor_referencia(texto), texto
+
+
+def test_detectar_contexto_negocio(leads):
+    for lead in leads:
+        assert llm_service._detectar_contexto_negocio(lead) == contexto_referencia(lead), lead
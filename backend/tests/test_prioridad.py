@@ -0,0 +1,119 @@
+"""
+Prioridad de GET /leads/next: orden del ranking, envejecimiento con el
+trabajo "prioridad" y migración desde la antigua columna generada.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+from batch import refresh_priorities
+from init_db import ensure_schema
+from jobs import claim_job, enqueue_periodic_job, get_job
+from worker import WORKER_ID, run_job
+
+
+def _hace(dias: int) -> str:
+    return (datetime.now() - timedelta(days=dias)).isoformat(timespec="seconds")
+
+
+def _lead(db, nombre, temperatura=None, etapa=None, tipo="lead", dias=0, estado="nuevo") -> int:
+    cur = db.execute(
+        """
+        INSERT INTO leads (nombre, temperatura, etapa_funnel, tipo_contacto, estado, creado_en)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (nombre, temperatura, etapa, tipo, estado, _hace(dias)),
+    )
+    return cur.lastrowid
+
+
+def _interaccion(db, lead_id, resultado, dias):
+    db.execute(
+        "INSERT INTO interacciones (lead_id, canal, rol, mensaje, resultado, fecha) VALUES (?, 'email', 'lead', '', ?, ?)",
+        (lead_id, resultado, _hace(dias)),
+    )
+
+
+def test_ranking_no_degenera_en_antiguedad(client):
+    db = sqlite3.connect("leadflow.db")
+    _lead(db, "caliente nuevo", "caliente", "decision", "oportunidad")              # 30+20+15 = 65
+    _lead(db, "sin segmentar olvidado", dias=400)                                   # 10 + 30 (tope) = 40
+    _lead(db, "tibio de hace 10 dias", "tibio", "consideration", dias=10)           # 25 + 10 = 35
+    _lead(db, "frio de hace un anio", "frio", "awareness", dias=363)                # 0 + 30 (tope) = 30
+    _lead(db, "tibio nuevo", "tibio", "consideration")                              # 25
+    rechazo = _lead(db, "rechazo antiguo", "tibio", "consideration", dias=300)
+    _interaccion(db, rechazo, "rechazo", 200)                                       # 25 - 40 + 30 = 15
+    _lead(db, "ganado", "caliente", "decision", "oportunidad", estado="ganado")     # cerrado: fuera
+    db.commit()
+    db.close()
+
+    respuesta = client.get("/leads/next", params={"n": 10})
+    assert respuesta.status_code == 200
+    filas = respuesta.json()
+    assert [f["nombre"] for f in filas] == [
+        "caliente nuevo",
+        "sin segmentar olvidado",
+        "tibio de hace 10 dias",
+        "frio de hace un anio",
+        "tibio nuevo",
+        "rechazo antiguo",
+    ]
+    assert [round(f["puntuacion"]) for f in filas] == [65, 40, 35, 30, 25, 15]
+
+
+def test_triggers_recalculan_al_segmentar_y_al_interactuar(db):
+    lead_id = _lead(db, "nuevo")
+    assert db.execute("SELECT prioridad FROM leads WHERE id = ?", (lead_id,)).fetchone()[0] == 10
+    version = db.execute("SELECT version FROM leads WHERE id = ?", (lead_id,)).fetchone()[0]
+
+    db.execute("UPDATE leads SET temperatura = 'caliente', etapa_funnel = 'decision' WHERE id = ?", (lead_id,))
+    assert db.execute("SELECT prioridad FROM leads WHERE id = ?", (lead_id,)).fetchone()[0] == 50
+    _interaccion(db, lead_id, "respondio", 0)
+    prioridad, nueva_version = db.execute("SELECT prioridad, version FROM leads WHERE id = ?", (lead_id,)).fetchone()
+    assert round(prioridad) == 75
+    # Una versión por escritura del lead; el recálculo de prioridad no cuenta como otra
+    assert nueva_version == version + 2
+
+
+def test_trabajo_prioridad_envejece_los_leads(db):
+    lead_id = _lead(db, "frio", "frio", "awareness", dias=12)
+    db.commit()
+    # Como si la última pasada fuera de hace 12 días: el término de tiempo se quedó en 0
+    db.execute("UPDATE leads SET prioridad = 0 WHERE id = ?", (lead_id,))
+    version = db.execute("SELECT version FROM leads WHERE id = ?", (lead_id,)).fetchone()[0]
+    db.commit()
+
+    job_id = enqueue_periodic_job(db, "prioridad", {}, 3600)
+    assert job_id is not None
+    assert enqueue_periodic_job(db, "prioridad", {}, 3600) is None  # ya hay uno pendiente
+    run_job(db, claim_job(db, WORKER_ID), None, 1)
+
+    assert get_job(db, job_id)["estado"] == "completado"
+    prioridad, nueva_version = db.execute("SELECT prioridad, version FROM leads WHERE id = ?", (lead_id,)).fetchone()
+    assert round(prioridad) == 12
+    assert nueva_version == version
+    assert refresh_priorities(db) == 0  # nada que cambiar hasta que pase más tiempo
+
+
+def test_migra_la_columna_generada(bd_vacia):
+    conn = sqlite3.connect(bd_vacia)
+    conn.execute(
+        """
+        CREATE TABLE leads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, email TEXT, empresa TEXT, sector TEXT,
+            fuente TEXT, mensaje_inicial TEXT, necesidades TEXT, etapa_funnel TEXT, temperatura TEXT,
+            tipo_contacto TEXT, estado TEXT, creado_en TEXT, actualizado_en TEXT, email_norm TEXT,
+            version INTEGER NOT NULL DEFAULT 1, ultima_interaccion_en TEXT, ultimo_resultado TEXT,
+            prioridad REAL GENERATED ALWAYS AS (- julianday(COALESCE(ultima_interaccion_en, creado_en))) VIRTUAL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX idx_leads_prioridad ON leads (prioridad)")
+    conn.execute("INSERT INTO leads (nombre, temperatura, creado_en) VALUES ('viejo', 'caliente', ?)", (_hace(363),))
+    conn.commit()
+
+    ensure_schema(conn)
+
+    columnas = {fila[1]: fila[6] for fila in conn.execute("PRAGMA table_xinfo(leads)")}
+    assert columnas["prioridad"] == 0  # columna normal, ya no generada
+    assert conn.execute("SELECT prioridad FROM leads").fetchone()[0] == 60  # 30 + 30 (tope)
+    conn.close()
@@ -0,0 +1,232 @@
+"""
+Worker de trabajos en segundo plano (tabla jobs).
+
+Reclama trabajos encolados con POST /jobs y reparte cada bloque de leads
+entre varios procesos (ProcessPoolExecutor) que ejecutan el motor de
+reglas. Los resultados de cada bloque y el checkpoint (ultimo_id) se
+escriben en la misma transacción: si el worker muere, otro (o el mismo al
+reiniciar) retoma el trabajo en cuanto caduca su latido, sin repetir leads.
+Con la cola vacía encola cada --intervalo-prioridad segundos el recálculo
+de leads.prioridad, cuyo término de días sin contacto avanza con el tiempo.
+
+Uso (desde backend/):
+    python worker.py                    # atiende la cola indefinidamente
+    python worker.py --procesos 8 --una-vez
+"""
+import argparse
+import os
+import socket
+import sqlite3
+import time
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Tuple
+
+from batch import (
+    insert_generated_messages,
+    iter_lead_chunks,
+    leads_with_history_chunk,
+    refresh_priorities,
+    save_segmentations,
+)
+from database import build_lead_filter, pool, row_to_dict
+from init_db import ensure_schema
+from jobs import (
+    JOB_LEASE_SECONDS,
+    PRIORITY_REFRESH_SECONDS,
+    checkpoint,
+    claim_job,
+    enqueue_periodic_job,
+    finish_job,
+    set_total,
+)
+from llm_service import SEGMENTATION_FIELDS, generate_next_message_with_llm, segment_leads
+from segmentation_cache import segment_leads_cached
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TrabajoPerdido(Exception):
+    """Otro worker reclamó el trabajo (este perdió el latido)."""
+
+
+# ---- Funciones que se ejecutan en los procesos hijos ----
+
+def _segmentar_parte(campos: List[Tuple]) -> List[Dict]:
+    return segment_leads([dict(zip(SEGMENTATION_FIELDS, fila)) for fila in campos])
+
+
+def _generar_parte(parte: List[Tuple[Dict, List[Dict]]], canal: str, objetivo: str, tono: str) -> List[Dict]:
+    return [
+        generate_next_message_with_llm(lead=lead, last_interactions=historial, canal=canal, objetivo=objetivo, tono=tono)
+        for lead, historial in parte
+    ]
+
+
+def _repartir(elementos: List, n_partes: int) -> List[List]:
+    tamano = max(1, -(-len(elementos) // n_partes))
+    return [elementos[i:i + tamano] for i in range(0, len(elementos), tamano)]
+
+
+def _en_procesos(executor: Executor, funcion, elementos: List, n_partes: int) -> List:
+    resultados: List = []
+    for parte in executor.map(funcion, _repartir(elementos, n_partes)):
+        resultados.extend(parte)
+    return resultados
+
+
+# ---- Ejecución de trabajos ----
+
+def _filtro(parametros: Dict) -> Tuple[str, List]:
+    filtro = parametros.get("filtro", parametros)
+    return build_lead_filter(filtro, ids=filtro.get("ids"), solo_sin_segmentar=filtro.get("solo_sin_segmentar", False))
+
+
+def _confirmar_bloque(db: sqlite3.Connection, job: Dict, ultimo_id: int, n: int, t0: float, escribir) -> None:
+    """Escribe los resultados del bloque y avanza el checkpoint en una transacción."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        escribir()
+        if not checkpoint(db, job["id"], WORKER_ID, ultimo_id, n, time.perf_counter() - t0):
+            raise TrabajoPerdido(job["id"])
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+
+def run_segmentation_job(db: sqlite3.Connection, job: Dict, executor: Executor, procesos: int) -> None:
+    parametros = job["parametros"]
+    where, params = _filtro(parametros)
+    tamano_bloque = parametros.get("tamano_bloque", 1000)
+
+    for filas in iter_lead_chunks(db, where, params, tamano_bloque, desde_id=job["ultimo_id"]):
+        t0 = time.perf_counter()
+        leads = [row_to_dict(fila) for fila in filas]
+        segmentaciones = segment_leads_cached(
+            db,
+            leads,
+            segment_many=lambda pendientes: _en_procesos(
+                executor,
+                _segmentar_parte,
+                [tuple(lead.get(c) for c in SEGMENTATION_FIELDS) for lead in pendientes],
+                procesos,
+            ),
+        )
+        db.commit()  # entradas nuevas de la caché de segmentación
+        resultados = [(lead["id"], seg) for lead, seg in zip(leads, segmentaciones)]
+        _confirmar_bloque(
+            db, job, leads[-1]["id"], len(leads), t0, lambda: save_segmentations(db, resultados)
+        )
+
+
+def run_messages_job(db: sqlite3.Connection, job: Dict, executor: Executor, procesos: int) -> None:
+    parametros = job["parametros"]
+    where, params = _filtro(parametros)
+    tamano_bloque = parametros.get("tamano_bloque", 500)
+    limite = parametros.get("limite")
+    generar = partial(
+        _generar_parte,
+        canal=parametros["canal"],
+        objetivo=parametros["objetivo"],
+        tono=parametros.get("tono") or "cercano_profesional",
+    )
+
+    procesados = job["procesados"]
+    ultimo_id = job["ultimo_id"]
+    while limite is None or procesados < limite:
+        n = tamano_bloque if limite is None else min(tamano_bloque, limite - procesados)
+        t0 = time.perf_counter()
+        bloque = leads_with_history_chunk(db, where, params, ultimo_id, n)
+        if not bloque:
+            break
+        mensajes = _en_procesos(executor, generar, bloque, procesos)
+        filas = [(lead, historial, m) for (lead, historial), m in zip(bloque, mensajes)]
+        ultimo_id = bloque[-1][0]["id"]
+        _confirmar_bloque(
+            db, job, ultimo_id, len(bloque), t0,
+            lambda: insert_generated_messages(db, filas, parametros["objetivo"]),
+        )
+        procesados += len(bloque)
+
+
+def run_priority_job(db: sqlite3.Connection, job: Dict, executor: Executor, procesos: int) -> None:
+    """Recalcula leads.prioridad por bloques de ids; es SQL puro, no usa el pool de procesos."""
+    where, params = _filtro(job["parametros"])
+    tamano_bloque = job["parametros"].get("tamano_bloque", 5000)
+    desde_id = job["ultimo_id"]
+    for filas in iter_lead_chunks(db, where, params, tamano_bloque, desde_id=desde_id):
+        t0 = time.perf_counter()
+        hasta_id = filas[-1]["id"]
+        _confirmar_bloque(db, job, hasta_id, len(filas), t0, lambda: refresh_priorities(db, desde_id, hasta_id))
+        desde_id = hasta_id
+
+
+EJECUTORES = {
+    "segmentar": run_segmentation_job,
+    "mensajes": run_messages_job,
+    "prioridad": run_priority_job,
+}
+
+
+def _contar(db: sqlite3.Connection, job: Dict) -> int:
+    where, params = _filtro(job["parametros"])
+    total = db.execute(f"SELECT COUNT(*) FROM leads WHERE {where}", params).fetchone()[0]
+    limite = job["parametros"].get("limite")
+    return min(total, limite) if limite else total
+
+
+def run_job(db: sqlite3.Connection, job: Dict, executor: Executor, procesos: int) -> None:
+    reanudado = " (reanudado desde id %d)" % job["ultimo_id"] if job["ultimo_id"] else ""
+    print(f"▶️  Trabajo {job['id']} ({job['tipo']}){reanudado}")
+    try:
+        if job["total"] is None:
+            set_total(db, job["id"], _contar(db, job))
+        EJECUTORES[job["tipo"]](db, job, executor, procesos)
+    except TrabajoPerdido:
+        print(f"⚠️  Trabajo {job['id']} reclamado por otro worker; se abandona")
+        return
+    except Exception as exc:
+        traceback.print_exc()
+        finish_job(db, job["id"], WORKER_ID, error=f"{type(exc).__name__}: {exc}")
+        print(f"❌ Trabajo {job['id']} con error")
+        return
+    finish_job(db, job["id"], WORKER_ID)
+    print(f"✅ Trabajo {job['id']} completado")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de la cola de trabajos (tabla jobs)")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Procesos del pool")
+    parser.add_argument("--una-vez", action="store_true", help="Salir cuando la cola esté vacía")
+    parser.add_argument("--intervalo", type=float, default=2.0, help="Segundos entre consultas con la cola vacía")
+    parser.add_argument(
+        "--latido-caducado", type=int, default=JOB_LEASE_SECONDS,
+        help="Segundos sin latido tras los que se retoma un trabajo en curso",
+    )
+    parser.add_argument(
+        "--intervalo-prioridad", type=int, default=PRIORITY_REFRESH_SECONDS,
+        help="Segundos entre recálculos de la prioridad de los leads (0 = no encolarlos)",
+    )
+    args = parser.parse_args()
+
+    with pool.connection() as db:
+        ensure_schema(db)
+        with ProcessPoolExecutor(max_workers=args.procesos) as executor:
+            print(f"👷 Worker {WORKER_ID} con {args.procesos} procesos")
+            while True:
+                job = claim_job(db, WORKER_ID, args.latido_caducado)
+                if job is None and args.intervalo_prioridad > 0:
+                    if enqueue_periodic_job(db, "prioridad", {}, args.intervalo_prioridad):
+                        continue
+                if job is None:
+                    if args.una_vez:
+                        break
+                    time.sleep(args.intervalo)
+                    continue
+                run_job(db, job, executor, args.procesos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Escritura diferida de interacciones con commit agrupado (opcional,
+LEADFLOW_WRITE_BEHIND=1).
+
+POST /leads/{id}/interacciones no escribe en la petición: encola la fila y
+espera. Un único hilo escritor vacía la cola en lotes: un lote se cierra al
+llegar a WRITE_BEHIND_BATCH_SIZE filas o a WRITE_BEHIND_MAX_LATENCY_MS
+desde la primera, comprueba de una vez que los leads existen, inserta cada
+fila con RETURNING y hace un solo commit. Solo entonces se responde a cada
+petición, así que la respuesta llega con la fila ya confirmada (con la
+misma durabilidad que el camino normal: la de PRAGMA synchronous).
+
+Con ráfagas de mensajes (WhatsApp) pasa de un BEGIN/commit por mensaje y
+muchas conexiones peleando por el bloqueo de escritura de SQLite a una
+transacción por lote y un solo escritor por proceso. Si la cola se llena
+(WRITE_BEHIND_QUEUE_SIZE) se rechaza la petición con 503 en lugar de
+acumular memoria. Al apagar la API se escribe todo lo encolado.
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from database import pool, row_to_dict
+
+logger = logging.getLogger("leadflow.write_behind")
+
+WRITE_BEHIND_ENABLED = os.getenv("LEADFLOW_WRITE_BEHIND", "0").lower() in ("1", "true", "si", "on")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("LEADFLOW_WRITE_BEHIND_BATCH_SIZE", "256"))
+WRITE_BEHIND_MAX_LATENCY_MS = float(os.getenv("LEADFLOW_WRITE_BEHIND_MAX_LATENCY_MS", "2"))
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("LEADFLOW_WRITE_BEHIND_QUEUE_SIZE", "10000"))
+
+INTERACCION_INSERT_SQL = """
+    INSERT INTO interacciones (
+        lead_id, canal, rol, mensaje, tipo, resultado, fecha
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+_FIN = object()
+
+
+class LeadNotFound(LookupError):
+    """La interacción apunta a un lead que no existe."""
+
+
+class WriteBehindFull(RuntimeError):
+    """La cola de escritura diferida está llena."""
+
+
+def insert_interaccion(db, fila: Sequence) -> Dict:
+    """Inserta una interacción (lead_id, canal, rol, mensaje, tipo, resultado, fecha) y la devuelve."""
+    return row_to_dict(db.execute(INTERACCION_INSERT_SQL + " RETURNING *", fila).fetchone())
+
+
+class InteractionWriter:
+    def __init__(
+        self,
+        enabled: bool = WRITE_BEHIND_ENABLED,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        max_latency_ms: float = WRITE_BEHIND_MAX_LATENCY_MS,
+        queue_size: int = WRITE_BEHIND_QUEUE_SIZE,
+    ):
+        self.enabled = enabled
+        self.batch_size = max(1, batch_size)
+        self.max_latency = max(0.0, max_latency_ms) / 1000
+        self._cola: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._encoladas = 0
+        self._escritas = 0
+        self._rechazadas = 0
+        self._procesadas = 0
+        self._lotes = 0
+        self._errores = 0
+        self._espera_total = 0.0   # segundos desde que se encola una fila hasta su commit
+        self._espera_max = 0.0
+        self._commit_total = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self._hilo is not None
+
+    def start(self) -> None:
+        if not self.enabled or self._hilo is not None:
+            return
+        self._hilo = threading.Thread(target=self._consumir, name="leadflow-write-behind", daemon=True)
+        self._hilo.start()
+
+    def stop(self) -> None:
+        """Escribe lo que quede en la cola y termina el hilo (bloquea hasta entonces)."""
+        if self._hilo is None:
+            return
+        self._cola.put(_FIN)
+        self._hilo.join()
+        self._hilo = None
+
+    def submit(self, fila: Sequence) -> concurrent.futures.Future:
+        """
+        Encola una fila de interacción. El futuro se resuelve con la fila
+        guardada tras el commit, o falla con LeadNotFound / sqlite3.Error.
+        """
+        futuro: concurrent.futures.Future = concurrent.futures.Future()
+        try:
+            self._cola.put_nowait((fila, futuro, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._rechazadas += 1
+            raise WriteBehindFull("Cola de escritura llena")
+        with self._lock:
+            self._encoladas += 1
+        return futuro
+
+    async def write(self, fila: Sequence) -> Dict:
+        """submit() y espera del commit sin ocupar un hilo del threadpool."""
+        return await asyncio.wrap_future(self.submit(fila))
+
+    def _consumir(self) -> None:
+        terminar = False
+        while not terminar:
+            elemento = self._cola.get()
+            if elemento is _FIN:
+                break
+            lote = [elemento]
+            limite = time.perf_counter() + self.max_latency
+            while len(lote) < self.batch_size:
+                try:
+                    elemento = self._cola.get_nowait()
+                except queue.Empty:
+                    restante = limite - time.perf_counter()
+                    if restante <= 0:
+                        break
+                    try:
+                        elemento = self._cola.get(timeout=restante)
+                    except queue.Empty:
+                        break
+                if elemento is _FIN:
+                    terminar = True
+                    break
+                lote.append(elemento)
+            self._procesar(lote)
+        # Lo encolado después del fin (peticiones que llegaban durante el apagado)
+        resto = []
+        while True:
+            try:
+                elemento = self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if elemento is not _FIN:
+                resto.append(elemento)
+        for inicio in range(0, len(resto), self.batch_size):
+            self._procesar(resto[inicio:inicio + self.batch_size])
+
+    def _procesar(self, lote: List) -> None:
+        # Desde aquí una cancelación (cliente desconectado) ya no evita la escritura
+        for _, futuro, _ in lote:
+            futuro.set_running_or_notify_cancel()
+        inicio = time.perf_counter()
+        try:
+            resultados = self._escribir_lote(lote)
+        except Exception:
+            # Un fallo no debe tumbar el lote entero: se repite fila a fila
+            logger.exception("Error al escribir un lote de %d interacciones; se reintenta por separado", len(lote))
+            resultados = [self._escribir_una(elemento) for elemento in lote]
+        ahora = time.perf_counter()
+        escritas = errores = 0
+        for (_, futuro, _), resultado in zip(lote, resultados):
+            if isinstance(resultado, BaseException):
+                errores += not isinstance(resultado, LeadNotFound)
+                _resolver(futuro, excepcion=resultado)
+            else:
+                escritas += 1
+                _resolver(futuro, resultado=resultado)
+        esperas = [ahora - instante for _, _, instante in lote]
+        with self._lock:
+            self._lotes += 1
+            self._procesadas += len(lote)
+            self._escritas += escritas
+            self._errores += errores
+            self._commit_total += ahora - inicio
+            self._espera_total += sum(esperas)
+            self._espera_max = max(self._espera_max, max(esperas))
+
+    @staticmethod
+    def _escribir_lote(lote: List) -> List:
+        ids = list(dict.fromkeys(fila[0] for fila, _, _ in lote))
+        with pool.connection() as db:
+            db.execute("BEGIN IMMEDIATE")
+            existentes = {
+                r[0]
+                for r in db.execute("SELECT id FROM leads WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+            }
+            resultados = [
+                insert_interaccion(db, fila) if fila[0] in existentes else LeadNotFound(fila[0])
+                for fila, _, _ in lote
+            ]
+            db.commit()
+        return resultados
+
+    @staticmethod
+    def _escribir_una(elemento) -> object:
+        try:
+            return InteractionWriter._escribir_lote([elemento])[0]
+        except Exception as exc:
+            return exc
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lotes = self._lotes
+            return {
+                "activo": self.active,
+                "tamano_lote": self.batch_size,
+                "latencia_max_ms": round(self.max_latency * 1000, 1),
+                "capacidad_cola": self._cola.maxsize,
+                "pendientes": self._cola.qsize(),
+                "encoladas": self._encoladas,
+                "escritas": self._escritas,
+                "rechazadas": self._rechazadas,
+                "errores": self._errores,
+                "lotes": lotes,
+                "lote_medio": round(self._procesadas / lotes, 1) if lotes else 0.0,
+                "commit_medio_ms": round(self._commit_total / lotes * 1000, 3) if lotes else 0.0,
+                "espera_media_ms": round(self._espera_total / self._procesadas * 1000, 3) if self._procesadas else 0.0,
+                "espera_max_ms": round(self._espera_max * 1000, 3),
+            }
+
+
+def _resolver(futuro: concurrent.futures.Future, resultado=None, excepcion: Optional[BaseException] = None) -> None:
+    if futuro.cancelled():
+        return
+    try:
+        if excepcion is not None:
+            futuro.set_exception(excepcion)
+        else:
+            futuro.set_result(resultado)
+    except concurrent.futures.InvalidStateError:
+        pass
@@ -5,100 +5,189 @@ const outputIA = document.getElementById("output-ia");
 const btnRefresh = document.getElementById("btn-refresh");
 const leadForm = document.getElementById("lead-form");
 
+// Tamaño de página de GET /leads y cursor de la siguiente (cabecera X-Next-Cursor)
+const PAGE_SIZE = 50;
+let nextCursor = null;
+
+// Leads pintados en el panel, por id, para aplicar los eventos de GET /events
+const leadsCargados = new Map();
+let eventos = null;
+
 // ================== Helpers de UI ==================
 
-async function fetchLeads() {
-    leadsContainer.innerHTML = "<p>Cargando leads...</p>";
+async function fetchLeads(append = false) {
+    if (!append) {
+        nextCursor = null;
+        leadsContainer.innerHTML = "<p>Cargando leads...</p>";
+    }
     try {
-        const res = await fetch(`${API_BASE}/leads`);
+        const params = new URLSearchParams({ limit: PAGE_SIZE });
+        if (append && nextCursor) params.set("cursor", nextCursor);
+        const res = await fetch(`${API_BASE}/leads?${params}`);
         const data = await res.json();
-        renderLeads(data);
+        nextCursor = res.headers.get("X-Next-Cursor");
+        renderLeads(data, append);
     } catch (err) {
         console.error(err);
         leadsContainer.innerHTML = "<p>Error al cargar leads.</p>";
     }
 }
 
-function renderLeads(leads) {
-    if (!leads.length) {
+function renderLeads(leads, append = false) {
+    const btnMore = document.getElementById("btn-more");
+    if (btnMore) btnMore.remove();
+
+    if (!append) leadsCargados.clear();
+    if (!append && !leads.length) {
         leadsContainer.innerHTML = "<p>No hay leads aún.</p>";
         return;
     }
-    leadsContainer.innerHTML = "";
+    if (!append) leadsContainer.innerHTML = "";
     leads.forEach((lead) => {
-        const card = document.createElement("div");
-        card.className = "lead-card";
-
-        const header = document.createElement("div");
-        header.className = "lead-header";
-
-        const info = document.createElement("div");
-        const name = document.createElement("div");
-        name.className = "lead-name";
-        name.textContent = `${lead.nombre} (${lead.id})`;
-
-        const meta = document.createElement("div");
-        meta.className = "lead-meta";
-        meta.textContent = `${lead.empresa || "Sin empresa"} · ${lead.sector || "Sin sector"} · ${lead.fuente || "Sin fuente"}`;
-
-        info.appendChild(name);
-        info.appendChild(meta);
-
-        const tags = document.createElement("div");
-        if (lead.etapa_funnel) {
-            const chipEtapa = document.createElement("span");
-            chipEtapa.className = "chip";
-            chipEtapa.textContent = `Funnel: ${lead.etapa_funnel}`;
-            tags.appendChild(chipEtapa);
-        }
-        if (lead.temperatura) {
-            const chipTemp = document.createElement("span");
-            chipTemp.className = "chip";
-            chipTemp.textContent = `Temp: ${lead.temperatura}`;
-            tags.appendChild(chipTemp);
-        }
-        if (!lead.etapa_funnel && !lead.temperatura) {
-            const chip = document.createElement("span");
-            chip.className = "chip";
-            chip.textContent = "Sin segmentar";
-            tags.appendChild(chip);
-        }
+        leadsCargados.set(lead.id, lead);
+        leadsContainer.appendChild(buildLeadCard(lead));
+    });
+
+    if (nextCursor) {
+        const more = document.createElement("button");
+        more.id = "btn-more";
+        more.textContent = "⬇️ Cargar más";
+        more.onclick = () => fetchLeads(true);
+        leadsContainer.appendChild(more);
+    }
+}
 
-        header.appendChild(info);
-        header.appendChild(tags);
+function buildLeadCard(lead) {
+    const card = document.createElement("div");
+    card.className = "lead-card";
+    card.dataset.leadId = lead.id;
 
-        const body = document.createElement("div");
-        body.className = "lead-body";
-        const mensaje = document.createElement("p");
-        mensaje.className = "lead-meta";
-        mensaje.textContent = lead.mensaje_inicial || "(Sin mensaje inicial)";
-        body.appendChild(mensaje);
+    const header = document.createElement("div");
+    header.className = "lead-header";
 
-        const acciones = document.createElement("div");
-        acciones.className = "lead-actions";
+    const info = document.createElement("div");
+    const name = document.createElement("div");
+    name.className = "lead-name";
+    name.textContent = `${lead.nombre} (${lead.id})`;
 
-        const btnSeg = document.createElement("button");
-        btnSeg.textContent = "🧠 Segmentar";
-        btnSeg.onclick = () => segmentLead(lead.id);
+    const meta = document.createElement("div");
+    meta.className = "lead-meta";
+    meta.textContent = `${lead.empresa || "Sin empresa"} · ${lead.sector || "Sin sector"} · ${lead.fuente || "Sin fuente"}`;
 
-        const btnMsgEmail = document.createElement("button");
-        btnMsgEmail.textContent = "✉️ Mensaje email";
-        btnMsgEmail.onclick = () => nextMessage(lead.id, "email", "conseguir_llamada");
+    info.appendChild(name);
+    info.appendChild(meta);
 
-        const btnMsgWhats = document.createElement("button");
-        btnMsgWhats.textContent = "📱 Mensaje WhatsApp";
-        btnMsgWhats.onclick = () => nextMessage(lead.id, "whatsapp", "conseguir_llamada");
+    const tags = document.createElement("div");
+    if (lead.etapa_funnel) {
+        const chipEtapa = document.createElement("span");
+        chipEtapa.className = "chip";
+        chipEtapa.textContent = `Funnel: ${lead.etapa_funnel}`;
+        tags.appendChild(chipEtapa);
+    }
+    if (lead.temperatura) {
+        const chipTemp = document.createElement("span");
+        chipTemp.className = "chip";
+        chipTemp.textContent = `Temp: ${lead.temperatura}`;
+        tags.appendChild(chipTemp);
+    }
+    if (!lead.etapa_funnel && !lead.temperatura) {
+        const chip = document.createElement("span");
+        chip.className = "chip";
+        chip.textContent = "Sin segmentar";
+        tags.appendChild(chip);
+    }
 
-        acciones.appendChild(btnSeg);
-        acciones.appendChild(btnMsgEmail);
-        acciones.appendChild(btnMsgWhats);
+    header.appendChild(info);
+    header.appendChild(tags);
 
-        card.appendChild(header);
-        card.appendChild(body);
-        card.appendChild(acciones);
+    const body = document.createElement("div");
+    body.className = "lead-body";
+    const mensaje = document.createElement("p");
+    mensaje.className = "lead-meta";
+    mensaje.textContent = lead.mensaje_inicial || "(Sin mensaje inicial)";
+    body.appendChild(mensaje);
 
-        leadsContainer.appendChild(card);
-    });
+    const acciones = document.createElement("div");
+    acciones.className = "lead-actions";
+
+    const btnSeg = document.createElement("button");
+    btnSeg.textContent = "🧠 Segmentar";
+    btnSeg.onclick = () => segmentLead(lead.id);
+
+    const btnMsgEmail = document.createElement("button");
+    btnMsgEmail.textContent = "✉️ Mensaje email";
+    btnMsgEmail.onclick = () => nextMessage(lead.id, "email", "conseguir_llamada");
+
+    const btnMsgWhats = document.createElement("button");
+    btnMsgWhats.textContent = "📱 Mensaje WhatsApp";
+    btnMsgWhats.onclick = () => nextMessage(lead.id, "whatsapp", "conseguir_llamada");
+
+    acciones.appendChild(btnSeg);
+    acciones.appendChild(btnMsgEmail);
+    acciones.appendChild(btnMsgWhats);
+
+    card.appendChild(header);
+    card.appendChild(body);
+    card.appendChild(acciones);
+
+    return card;
+}
+
+// ================== Eventos en vivo (GET /events) ==================
+
+function sinConexionEventos() {
+    return !eventos || eventos.readyState !== EventSource.OPEN;
+}
+
+function patchLead(id, cambios) {
+    const actual = leadsCargados.get(id);
+    if (!actual) return;
+    const lead = { ...actual, ...cambios };
+    leadsCargados.set(id, lead);
+    const card = leadsContainer.querySelector(`[data-lead-id="${id}"]`);
+    if (card) card.replaceWith(buildLeadCard(lead));
+}
+
+function prependLead(lead) {
+    if (leadsCargados.has(lead.id)) {
+        patchLead(lead.id, lead);
+        return;
+    }
+    if (!leadsCargados.size) leadsContainer.innerHTML = "";
+    leadsCargados.set(lead.id, lead);
+    leadsContainer.prepend(buildLeadCard(lead));
+}
+
+function removeLead(id) {
+    if (!leadsCargados.delete(id)) return;
+    const card = leadsContainer.querySelector(`[data-lead-id="${id}"]`);
+    if (card) card.remove();
+}
+
+// Altas masivas o un hueco en el historial de eventos: se recarga la primera página,
+// agrupando las ráfagas en una sola petición
+let recargaPendiente = null;
+function scheduleReload() {
+    if (recargaPendiente) return;
+    recargaPendiente = setTimeout(() => {
+        recargaPendiente = null;
+        fetchLeads();
+    }, 1000);
+}
+
+function connectEvents() {
+    if (!window.EventSource) return;
+    eventos = new EventSource(`${API_BASE}/events`);
+    const on = (tipo, handler) =>
+        eventos.addEventListener(tipo, (e) => handler(JSON.parse(e.data)));
+
+    on("lead.creado", (ev) => prependLead(ev.lead));
+    on("lead.actualizado", (ev) => patchLead(ev.lead_id, ev.lead));
+    on("lead.segmentado", (ev) => patchLead(ev.lead_id, ev.lead));
+    on("lead.eliminado", (ev) => removeLead(ev.lead_id));
+    on("leads.segmentados", (ev) => ev.leads.forEach((l) => patchLead(l.id, l)));
+    on("leads.creados", () => scheduleReload());
+    on("reset", () => scheduleReload());
 }
 
 // ================== Format helpers ==================
@@ -145,7 +234,8 @@ async function segmentLead(id) {
         }
         const data = await res.json();
         outputIA.textContent = formatSegmentation(data);
-        fetchLeads();
+        // Con el stream de eventos abierto, la tarjeta se actualiza sola (lead.segmentado)
+        if (sinConexionEventos()) fetchLeads();
     } catch (err) {
         console.error(err);
         outputIA.textContent = "Error al segmentar el lead.";
@@ -195,14 +285,15 @@ leadForm.addEventListener("submit", async (e) => {
         });
         if (!res.ok) throw new Error("Error al crear lead");
         leadForm.reset();
-        fetchLeads();
+        if (sinConexionEventos()) fetchLeads();
     } catch (err) {
         console.error(err);
         alert("Error al crear el lead");
     }
 });
 
-btnRefresh.addEventListener("click", fetchLeads);
+btnRefresh.addEventListener("click", () => fetchLeads());
 
-// Primera carga
+// Primera carga: el stream se abre antes para no perder cambios durante la carga
+connectEvents();
 fetchLeads();